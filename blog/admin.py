@@ -1,6 +1,8 @@
 
 
 from django.contrib import admin
+from django.utils import timezone
+from .cache import bump
 from .models import Post, Category, UserProfile
 from .models import Comment
 from .models import Tag
@@ -10,19 +12,22 @@ class UserProfileAdmin(admin.ModelAdmin):
     search_fields = ('user__username', 'user__email')
 
 class PostAdmin(admin.ModelAdmin):
-    list_display = ('title', 'pub_date', 'category', 'author', 'view_count', 'is_featured')
+    list_display = ('title', 'pub_date', 'category', 'author', 'view_count', 'unique_viewers', 'like_count', 'is_featured')
     list_filter = ('pub_date', 'category', 'author', 'is_featured')
     actions = ['make_featured', 'remove_featured']
     search_fields = ('title', 'content')
-    readonly_fields = ('view_count',)
+    readonly_fields = ('view_count', 'unique_viewers', 'like_count', 'approved_comment_count')
 
+    # update() skips post_save, so invalidate the cached listings by hand
     def make_featured(self, request, queryset):
-        queryset.update(is_featured=True)
+        queryset.update(is_featured=True, updated_at=timezone.now())
+        bump('posts')
 
     make_featured.short_description = "Mark selected posts as featured"
 
     def remove_featured(self, request, queryset):
-        queryset.update(is_featured=False)
+        queryset.update(is_featured=False, updated_at=timezone.now())
+        bump('posts')
 
     remove_featured.short_description = "Remove selected posts from featured"
 
@@ -34,13 +39,14 @@ class CommentAdmin(admin.ModelAdmin):
     search_fields = ('content', 'author__username', 'post__title')
     actions = ['approve_comments', 'disapprove_comments']
 
+    # set_approved() keeps Post.approved_comment_count in sync with the bulk update
     def approve_comments(self, request, queryset):
-        queryset.update(is_approved=True)
+        queryset.set_approved(True)
 
     approve_comments.short_description = "Approve selected comments"
 
     def disapprove_comments(self, request, queryset):
-        queryset.update(is_approved=False)
+        queryset.set_approved(False)
 
     disapprove_comments.short_description = "Disapprove selected comments"
 
@@ -0,0 +1,97 @@
+# blog/api/serializers.py
+
+from django.contrib.auth.models import User
+from django.urls import reverse
+from rest_framework import serializers
+
+from ..models import Comment, Post, Tag
+
+
+class SparseFieldsMixin:
+    """
+    Drop every field not listed in the request's `?fields=` parameter
+    (comma separated). Only for top-level serializers; nested ones always
+    render in full.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        wanted = requested_fields(request) if request is not None else None
+        if wanted:
+            for name in set(self.fields) - wanted:
+                self.fields.pop(name)
+
+
+def requested_fields(request):
+    """The set of names in `?fields=`, or None if the parameter is missing."""
+    raw = request.query_params.get('fields')
+    if not raw:
+        return None
+    return {name.strip() for name in raw.split(',') if name.strip()}
+
+
+class TagSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Tag
+        fields = ('id', 'name', 'slug', 'post_count')
+
+
+class TagRefSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Tag
+        fields = ('name', 'slug')
+
+
+class AuthorSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    bio = serializers.CharField(source='profile.bio', default='')
+    website = serializers.CharField(source='profile.website', default=None)
+    profile_pic = serializers.CharField(source='profile.profile_pic_url', default=None)
+    # Annotated by the view
+    post_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = User
+        fields = ('username', 'first_name', 'last_name', 'bio', 'website', 'profile_pic', 'post_count')
+
+
+class PostSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """A post as shown on cards; PostDetailSerializer adds the body."""
+
+    author = serializers.CharField(source='author.username', default=None)
+    category = serializers.CharField(source='category.name', default=None)
+    tags = TagRefSerializer(many=True, read_only=True)
+    image = serializers.CharField(source='image_url', default=None)
+    comment_count = serializers.IntegerField(source='approved_comment_count')
+    url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Post
+        fields = (
+            'id', 'title', 'excerpt', 'pub_date', 'author', 'category', 'tags', 'image',
+            'is_featured', 'like_count', 'comment_count', 'word_count', 'reading_time', 'url',
+        )
+
+    def get_url(self, post):
+        return reverse('post_detail', args=[post.pk])
+
+
+class PostDetailSerializer(PostSerializer):
+    class Meta(PostSerializer.Meta):
+        fields = PostSerializer.Meta.fields + ('content',)
+
+
+class ReplySerializer(serializers.ModelSerializer):
+    author = serializers.CharField(source='author.username')
+
+    class Meta:
+        model = Comment
+        fields = ('id', 'author', 'content', 'created_date', 'like_count')
+
+
+class CommentSerializer(SparseFieldsMixin, ReplySerializer):
+    # Prefetched by the view
+    replies = ReplySerializer(source='approved_replies', many=True, read_only=True)
+
+    class Meta(ReplySerializer.Meta):
+        fields = ReplySerializer.Meta.fields + ('replies',)
@@ -0,0 +1,19 @@
+# blog/api/urls.py
+
+from django.urls import path
+
+from . import views
+
+app_name = 'api'
+
+urlpatterns = [
+    path('posts/', views.PostList.as_view(), name='post_list'),
+    path('posts/trending/', views.RankedPostList.as_view(ranking='trending'), name='post_trending'),
+    path('posts/popular/', views.RankedPostList.as_view(ranking='popular_this_week'), name='post_popular'),
+    path('posts/<int:post_id>/', views.PostDetail.as_view(), name='post_detail'),
+    path('posts/<int:post_id>/comments/', views.PostComments.as_view(), name='post_comments'),
+    path('tags/', views.TagList.as_view(), name='tag_list'),
+    path('tags/<slug:slug>/', views.TagDetail.as_view(), name='tag_detail'),
+    path('authors/', views.AuthorList.as_view(), name='author_list'),
+    path('authors/<str:username>/', views.AuthorDetail.as_view(), name='author_detail'),
+]
@@ -0,0 +1,225 @@
+# blog/api/views.py
+
+"""
+Read-only JSON API, version 1 (mounted at /api/v1/).
+
+Every list is cursor paginated (?cursor=, ?page_size= up to 100), every
+endpoint takes ?fields=a,b,c to return only some fields, and responses carry
+an ETag built from the cache version counters in blog/cache.py, so a
+matching If-None-Match is answered with 304 before any query runs.
+"""
+
+from hashlib import md5
+
+from django.contrib.auth.models import User
+from django.db.models import Count, Prefetch
+from django.shortcuts import get_object_or_404
+from django.utils.cache import parse_etags, patch_cache_control, patch_vary_headers, quote_etag
+from rest_framework import generics, status
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+from ..cache import get_versions
+from ..models import Comment, Post, Tag
+from .serializers import (
+    AuthorSerializer, CommentSerializer, PostDetailSerializer, PostSerializer, TagSerializer,
+    requested_fields,
+)
+
+
+class Pagination(CursorPagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class PostPagination(Pagination):
+    ordering = ('-pub_date', '-id')
+
+
+class TagPagination(Pagination):
+    ordering = ('-post_count', 'name')
+
+
+class AuthorPagination(Pagination):
+    ordering = ('username',)
+
+
+class CommentPagination(Pagination):
+    ordering = ('created_date', 'id')
+
+
+class VersionETagMixin:
+    """
+    ETag = hash of the URL, the output format and the current versions of
+    the cache scopes the response depends on (see get_etag_scopes()).
+    """
+
+    def get_etag_scopes(self):
+        raise NotImplementedError
+
+    def get_etag(self, request):
+        versions = get_versions(*self.get_etag_scopes())
+        raw = '|'.join([
+            request.get_full_path(),
+            request.accepted_renderer.format,
+            *(f'{scope}={version}' for scope, version in sorted(versions.items())),
+        ])
+        return quote_etag(md5(raw.encode()).hexdigest())
+
+    def get(self, request, *args, **kwargs):
+        etag = self.get_etag(request)
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match and (etag in parse_etags(if_none_match) or '*' in parse_etags(if_none_match)):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = super().get(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            # Clients may keep the response but must revalidate it
+            patch_cache_control(response, max_age=0, must_revalidate=True)
+            patch_vary_headers(response, ['Accept'])
+        return response
+
+
+def post_queryset(request, with_content=False):
+    """Posts with exactly the joins and prefetches the requested fields need."""
+    wanted = requested_fields(request)
+    queryset = Post.objects.all()
+    related = [name for name in ('author', 'category') if wanted is None or name in wanted]
+    if related:
+        queryset = queryset.select_related(*related)
+    if wanted is None or 'tags' in wanted:
+        queryset = queryset.prefetch_related('tags')
+    if not with_content or (wanted is not None and 'content' not in wanted):
+        queryset = queryset.defer('content')
+    return queryset
+
+
+class PostList(VersionETagMixin, generics.ListAPIView):
+    """Posts, newest first. Filters: ?tag=<slug>, ?author=<username>, ?featured=1."""
+
+    serializer_class = PostSerializer
+    pagination_class = PostPagination
+
+    def get_etag_scopes(self):
+        return ['posts', 'likes']
+
+    def get_queryset(self):
+        queryset = post_queryset(self.request)
+        params = self.request.query_params
+        if params.get('tag'):
+            queryset = queryset.filter(tags__slug=params['tag'])
+        if params.get('author'):
+            queryset = queryset.filter(author__username=params['author'])
+        if params.get('featured') in ('1', 'true'):
+            queryset = queryset.filter(is_featured=True)
+        return queryset
+
+
+class RankedPostList(generics.ListAPIView):
+    """
+    The top posts of a ranking (blog/rankings.py), ?limit= up to 50. Rankings
+    move with every view, so instead of an ETag these may be cached briefly.
+    """
+
+    serializer_class = PostSerializer
+    pagination_class = None
+    ranking = None  # 'trending' or 'popular_this_week'
+    max_limit = 50
+
+    def get_queryset(self):
+        try:
+            limit = int(self.request.query_params.get('limit', 10))
+        except ValueError:
+            limit = 10
+        limit = min(max(limit, 1), self.max_limit)
+        return getattr(post_queryset(self.request), self.ranking)()[:limit]
+
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        patch_cache_control(response, max_age=60)
+        return response
+
+
+class PostDetail(VersionETagMixin, generics.RetrieveAPIView):
+    serializer_class = PostDetailSerializer
+    lookup_url_kwarg = 'post_id'
+
+    def get_etag_scopes(self):
+        return ['posts', f"post:{self.kwargs['post_id']}"]
+
+    def get_queryset(self):
+        return post_queryset(self.request, with_content=True)
+
+
+class PostComments(VersionETagMixin, generics.ListAPIView):
+    """Approved top-level comments of a post, oldest first, with their approved replies."""
+
+    serializer_class = CommentSerializer
+    pagination_class = CommentPagination
+
+    def get_etag_scopes(self):
+        # Comments show their authors' usernames
+        return [f"post:{self.kwargs['post_id']}", 'authors']
+
+    def get_queryset(self):
+        post = get_object_or_404(Post.objects.only('pk'), pk=self.kwargs['post_id'])
+        replies = Comment.objects.filter(is_approved=True).select_related('author').order_by('created_date', 'id')
+        return (
+            Comment.objects.filter(post=post, parent__isnull=True, is_approved=True)
+            .select_related('author')
+            .prefetch_related(Prefetch('replies', queryset=replies, to_attr='approved_replies'))
+        )
+
+
+class TagList(VersionETagMixin, generics.ListAPIView):
+    """Tags in use, most used first."""
+
+    serializer_class = TagSerializer
+    pagination_class = TagPagination
+    queryset = Tag.objects.filter(post_count__gt=0)
+
+    def get_etag_scopes(self):
+        return ['tags']
+
+
+class TagDetail(VersionETagMixin, generics.RetrieveAPIView):
+    serializer_class = TagSerializer
+    queryset = Tag.objects.all()
+    lookup_field = 'slug'
+
+    def get_etag_scopes(self):
+        return ['tags']
+
+
+def author_queryset():
+    return (
+        User.objects.filter(is_active=True)
+        .select_related('profile')
+        .annotate(post_count=Count('blog_posts'))
+    )
+
+
+class AuthorList(VersionETagMixin, generics.ListAPIView):
+    """Users who have published at least one post."""
+
+    serializer_class = AuthorSerializer
+    pagination_class = AuthorPagination
+
+    def get_etag_scopes(self):
+        return ['posts', 'authors']
+
+    def get_queryset(self):
+        return author_queryset().filter(post_count__gt=0)
+
+
+class AuthorDetail(VersionETagMixin, generics.RetrieveAPIView):
+    serializer_class = AuthorSerializer
+    lookup_field = 'username'
+
+    def get_etag_scopes(self):
+        return ['posts', f"author:{self.kwargs['username']}"]
+
+    def get_queryset(self):
+        return author_queryset()
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class BlogConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "blog"
+
+    def ready(self):
+        # Connect the search index, cache, feed and sitemap invalidation,
+        # image, related-posts and ranking signal handlers
+        from . import cache, feeds, images, rankings, related, search, sitemaps  # noqa: F401
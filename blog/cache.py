@@ -0,0 +1,224 @@
+# blog/cache.py
+
+"""
+Versioned page and fragment caching.
+
+Cached pages and template fragments embed the current value of one or more
+version counters ("scopes") in their cache key. The signal handlers below bump
+the affected counters whenever posts, comments, likes, tags or profiles change
+(after the change commits), so stale entries are never looked up again and simply expire.
+
+Scopes:
+    posts              anything shown on post cards / listings
+    likes              post like counts, as shown on listings
+    tags               the tag cloud
+    post:<id>          a single post page (its comments and likes) and its card
+    author:<username>  an author's profile header
+    authors            any author's name or profile, e.g. in the API's author list
+
+A like bumps `likes` and the post's scope, not `posts`: listing pages and
+their ETags change, but each card fragment is also keyed on its post's scope,
+so only the liked post's card is rendered again.
+
+The RSS/Atom feeds have scopes of their own, see blog/feeds.py.
+
+Entries must be rendered from rows at least as new as their version, so a
+page-cache miss is rendered from the primary, and nothing rendered from a
+read replica is stored (blog/replicas.py).
+"""
+
+import time
+from hashlib import md5
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+
+from .models import Comment, Like, Post, Tag, UserProfile, comment_approval_changed
+from .replicas import has_read_replica, use_primary
+
+VERSION_KEY_PREFIX = 'blogcache:version:'
+
+
+def _fresh_version():
+    # Seed counters from the clock, so a counter that was evicted and recreated
+    # can't come back with a value an old cache entry was stored under
+    return int(time.time() * 1000)
+
+
+def get_versions(*scopes):
+    """Return {scope: version} for the given scopes, creating missing counters."""
+    keys = {VERSION_KEY_PREFIX + scope: scope for scope in scopes}
+    found = cache.get_many(list(keys))
+    versions = {}
+    for key, scope in keys.items():
+        if key not in found:
+            cache.add(key, _fresh_version(), timeout=None)
+            found[key] = cache.get(key)
+        versions[scope] = found[key]
+    return versions
+
+
+def bump(*scopes):
+    """
+    Invalidate everything cached under any of `scopes` once the current
+    transaction commits (right away outside one). Bumping before the commit
+    would let a concurrent request cache the old rows under the new version.
+    """
+    transaction.on_commit(lambda: bump_now(scopes))
+
+
+def bump_now(scopes):
+    for scope in scopes:
+        key = VERSION_KEY_PREFIX + scope
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _fresh_version(), timeout=None)
+
+
+class VersionLookup:
+    """Lazy {scope: version} mapping for templates, e.g. cache_versions.posts"""
+
+    def __init__(self):
+        self._versions = {}
+
+    def __getitem__(self, scope):
+        if scope not in self._versions:
+            self._versions.update(get_versions(scope))
+        return self._versions[scope]
+
+
+def cache_versions(request):
+    """Context processor for versioned {% cache %} fragments."""
+    # A timeout of 0 stores nothing: rows read from a replica may be older
+    # than the versions the fragments would be stored under
+    timeout = 0 if has_read_replica(request) else getattr(settings, 'FRAGMENT_CACHE_TIMEOUT', 600)
+    return {
+        'cache_versions': VersionLookup(),
+        'fragment_cache_timeout': timeout,
+    }
+
+
+class PageCache:
+    """
+    Whole-page cache for anonymous GET requests.
+
+        page_cache = PageCache(request, 'post_list', 'posts', 'likes', 'tags')
+        cached = page_cache.get()
+        if cached is not None:
+            return cached
+        ...
+        return page_cache.set(render(request, ...))
+    """
+
+    def __init__(self, request, name, *scopes):
+        self.key = None
+        self.request = request
+        timeout = getattr(settings, 'PAGE_CACHE_TIMEOUT', 600)
+        if not timeout or not self.is_cacheable(request):
+            return
+        self.timeout = timeout
+        versions = get_versions(*scopes)
+        version_part = '.'.join(str(versions[scope]) for scope in scopes)
+        path_hash = md5(request.get_full_path().encode()).hexdigest()
+        self.key = f'blogcache:page:{name}:{path_hash}:{version_part}'
+
+    @staticmethod
+    def is_cacheable(request):
+        return (
+            request.method in ('GET', 'HEAD')
+            and not request.user.is_authenticated
+            # Pending flash messages are rendered into the page
+            and 'messages' not in request.COOKIES
+        )
+
+    def get(self):
+        if self.key is None:
+            return None
+        cached = cache.get(self.key)
+        if cached is None:
+            # This request will store the page for everyone: read from the primary
+            use_primary()
+            return None
+        content, content_type = cached
+        response = HttpResponse(content, content_type=content_type)
+        patch_vary_headers(response, ['Cookie'])
+        return response
+
+    def set(self, response):
+        if (
+            self.key is not None and response.status_code == 200 and not response.streaming
+            and not has_read_replica(self.request)
+        ):
+            cache.set(self.key, (response.content, response['Content-Type']), self.timeout)
+        patch_vary_headers(response, ['Cookie'])
+        return response
+
+
+# Invalidation
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post(sender, instance, **kwargs):
+    scopes = ['posts', f'post:{instance.pk}']
+    if kwargs.get('signal') is post_delete:
+        scopes.append('tags')  # the deleted post no longer counts towards its tags
+    bump(*scopes)
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def invalidate_post_tags(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    scopes = ['posts', 'tags']
+    if not reverse:
+        scopes.append(f'post:{instance.pk}')
+    else:
+        scopes.extend(f'post:{pk}' for pk in pk_set or ())
+    bump(*scopes)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_tag(sender, instance, **kwargs):
+    bump('posts', 'tags')
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comment(sender, instance, **kwargs):
+    bump(f'post:{instance.post_id}')
+
+
+@receiver(comment_approval_changed)
+def invalidate_approved_comments(sender, post_ids, **kwargs):
+    bump(*(f'post:{pk}' for pk in post_ids))
+
+
+@receiver(post_save, sender=Like)
+@receiver(post_delete, sender=Like)
+def invalidate_like(sender, instance, **kwargs):
+    if instance.post_id:
+        bump('likes', f'post:{instance.post_id}')
+    elif instance.comment_id:
+        post_id = Comment.objects.filter(pk=instance.comment_id).values_list('post_id', flat=True).first()
+        if post_id:
+            bump(f'post:{post_id}')
+
+
+@receiver(post_save, sender=User)
+def invalidate_author(sender, instance, created, update_fields=None, **kwargs):
+    if created or (update_fields and set(update_fields) <= {'last_login'}):
+        return
+    # Usernames appear on every post card and comment
+    bump(f'author:{instance.username}', 'authors', 'posts')
+
+
+@receiver(post_save, sender=UserProfile)
+def invalidate_author_profile(sender, instance, **kwargs):
+    bump(f'author:{instance.user.username}', 'authors')
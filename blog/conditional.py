@@ -0,0 +1,53 @@
+# blog/conditional.py
+
+"""
+Validators for conditional GET on the HTML pages, for use with
+django.views.decorators.http.condition:
+
+    @condition(etag_func=post_list_etag)
+
+ETags hash the page's cache version counters (blog/cache.py), which are bumped
+by every change that shows on the page, likes and comment counts included,
+together with the user, since logged-in pages differ per user. Computing one
+costs a cache lookup and no queries.
+
+There is deliberately no Last-Modified: no single timestamp moves on every
+change a page shows (likes, deletions, comment approvals, featuring), and a
+client sending only If-Modified-Since would be told a changed page is
+unchanged.
+
+Requests with pending flash messages get neither: the messages are part of
+the page.
+"""
+
+from hashlib import md5
+
+from .cache import get_versions
+
+
+def is_conditional(request):
+    return 'messages' not in request.COOKIES
+
+
+def page_etag(request, name, *scopes):
+    if not is_conditional(request):
+        return None
+    versions = get_versions(*scopes)
+    user = request.user.pk if request.user.is_authenticated else 'anonymous'
+    raw = '|'.join([name, request.get_full_path(), str(user), *(str(versions[scope]) for scope in scopes)])
+    return md5(raw.encode()).hexdigest()
+
+
+# post_list
+def post_list_etag(request):
+    return page_etag(request, 'post_list', 'posts', 'likes', 'tags')
+
+
+# tag_posts
+def tag_posts_etag(request, tag_slug):
+    return page_etag(request, 'tag_posts', 'posts', 'likes')
+
+
+# post_detail
+def post_detail_etag(request, post_id):
+    return page_etag(request, 'post_detail', 'posts', f'post:{post_id}')
@@ -0,0 +1,285 @@
+# blog/feeds.py
+
+"""
+RSS and Atom feeds for the whole site, each tag and each author.
+
+Feeds are polled far more often than they change, so every rendered feed is
+cached under version counters (blog/cache.py) that only move when a post in
+that feed changes:
+
+    feed:site              any post is saved, deleted or retagged
+    feed:tag:<slug>        a post with (or losing) that tag changes
+    feed:author:<username> one of that author's posts changes
+    feeds                  every feed: a tag or author was renamed or deleted
+
+A poll is answered from the cache without touching the database, with an
+ETag and Last-Modified so feed readers can revalidate and get a 304. Feeds
+list the newest FEED_ITEM_COUNT posts.
+
+Cached feeds are served to every reader, so their links are absolute on
+SITE_URL rather than on the requested host, which any client can set.
+"""
+
+from hashlib import md5
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.syndication.views import Feed
+from django.core.cache import cache
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control, quote_etag
+from django.utils.feedgenerator import Atom1Feed
+from django.utils.http import parse_http_date_safe
+
+from .cache import bump, get_versions
+from .models import Post, Tag
+from .sitemaps import site_url
+
+SITE_TITLE = "FREDA'S BLOG"
+
+
+def item_count():
+    return getattr(settings, 'FEED_ITEM_COUNT', 20)
+
+
+def absolute(url_name, *args):
+    return site_url() + reverse(url_name, args=args)
+
+
+class LatestPostsFeed(Feed):
+    """The newest posts on the site."""
+
+    url_name = 'post_feed'
+
+    def title(self, obj):
+        return SITE_TITLE
+
+    def link(self, obj):
+        return absolute('post_list')
+
+    def feed_url(self, obj):
+        return absolute(self.url_name, *self.url_args(obj))
+
+    def url_args(self, obj):
+        return []
+
+    def description(self, obj):
+        return "Latest posts"
+
+    def get_posts(self, obj):
+        return Post.objects.all()
+
+    def items(self, obj):
+        return self.get_posts(obj).for_listing()[:item_count()]
+
+    def item_title(self, item):
+        return item.title
+
+    def item_description(self, item):
+        return item.excerpt
+
+    def item_link(self, item):
+        return absolute('post_detail', item.pk)
+
+    def item_author_name(self, item):
+        return item.author.username if item.author else None
+
+    def item_pubdate(self, item):
+        return item.pub_date
+
+    def item_updateddate(self, item):
+        return item.updated_at
+
+    def item_categories(self, item):
+        return [tag.name for tag in item.tags.all()]
+
+    def scopes(self, **kwargs):
+        return ['feed:site']
+
+
+class TagFeed(LatestPostsFeed):
+    """The newest posts with a tag."""
+
+    url_name = 'tag_feed'
+
+    def get_object(self, request, tag_slug):
+        return get_object_or_404(Tag, slug=tag_slug)
+
+    def title(self, obj):
+        return f'{SITE_TITLE}: posts tagged "{obj.name}"'
+
+    def link(self, obj):
+        return absolute('tag_posts', obj.slug)
+
+    def url_args(self, obj):
+        return [obj.slug]
+
+    def description(self, obj):
+        return f'Latest posts tagged "{obj.name}"'
+
+    def get_posts(self, obj):
+        return Post.objects.filter(tags=obj)
+
+    def scopes(self, tag_slug):
+        return [f'feed:tag:{tag_slug}']
+
+
+class AuthorFeed(LatestPostsFeed):
+    """The newest posts by an author."""
+
+    url_name = 'author_feed'
+
+    def get_object(self, request, username):
+        return get_object_or_404(User, username=username)
+
+    def title(self, obj):
+        return f'{SITE_TITLE}: posts by {obj.username}'
+
+    def link(self, obj):
+        return absolute('author_profile', obj.username)
+
+    def url_args(self, obj):
+        return [obj.username]
+
+    def description(self, obj):
+        return f'Latest posts by {obj.username}'
+
+    def get_posts(self, obj):
+        return Post.objects.filter(author=obj)
+
+    def scopes(self, username):
+        return [f'feed:author:{username}']
+
+
+class AtomMixin:
+    feed_type = Atom1Feed
+
+    def subtitle(self, obj):
+        return self.description(obj)
+
+
+class LatestPostsAtomFeed(AtomMixin, LatestPostsFeed):
+    url_name = 'post_atom_feed'
+
+
+class TagAtomFeed(AtomMixin, TagFeed):
+    url_name = 'tag_atom_feed'
+
+
+class AuthorAtomFeed(AtomMixin, AuthorFeed):
+    url_name = 'author_atom_feed'
+
+
+def cached_feed(feed, name):
+    """
+    Wrap a Feed instance in a view that serves it from the cache, keyed on
+    the feed's version scopes, and answers conditional GETs.
+    """
+    def view(request, **kwargs):
+        scopes = ['feeds', *feed.scopes(**kwargs)]
+        versions = get_versions(*scopes)
+        version_part = '.'.join(str(versions[scope]) for scope in scopes)
+        # The query string is ignored by feeds, so it isn't part of the key
+        path_hash = md5(request.path.encode()).hexdigest()
+        key = f'blogcache:feed:{name}:{path_hash}:{version_part}'
+
+        cached = cache.get(key)
+        if cached is None:
+            rendered = feed(request, **kwargs)
+            cached = (rendered.content, rendered['Content-Type'], rendered.get('Last-Modified'))
+            cache.set(key, cached, getattr(settings, 'FEED_CACHE_TIMEOUT', 3600))
+
+        content, content_type, last_modified = cached
+        response = HttpResponse(content, content_type=content_type)
+        response['ETag'] = quote_etag(md5(content).hexdigest())
+        if last_modified:
+            response['Last-Modified'] = last_modified
+        patch_cache_control(response, max_age=0, must_revalidate=True)
+        return get_conditional_response(
+            request,
+            etag=response['ETag'],
+            last_modified=parse_http_date_safe(last_modified) if last_modified else None,
+            response=response,
+        )
+    return view
+
+
+post_feed = cached_feed(LatestPostsFeed(), 'post_feed')
+post_atom_feed = cached_feed(LatestPostsAtomFeed(), 'post_atom_feed')
+tag_feed = cached_feed(TagFeed(), 'tag_feed')
+tag_atom_feed = cached_feed(TagAtomFeed(), 'tag_atom_feed')
+author_feed = cached_feed(AuthorFeed(), 'author_feed')
+author_atom_feed = cached_feed(AuthorAtomFeed(), 'author_atom_feed')
+
+
+# Invalidation
+def feed_scopes(post_ids=(), tag_ids=()):
+    """The feeds showing any of `post_ids`, plus the feeds of `tag_ids`."""
+    post_ids, tag_ids = set(post_ids), set(tag_ids)
+    scopes = {'feed:site'}
+    if post_ids:
+        scopes.update(
+            f'feed:author:{username}'
+            for username in User.objects.filter(blog_posts__in=post_ids).values_list('username', flat=True)
+        )
+        tag_ids.update(Post.tags.through.objects.filter(post_id__in=post_ids).values_list('tag_id', flat=True))
+    if tag_ids:
+        scopes.update(
+            f'feed:tag:{slug}' for slug in Tag.objects.filter(pk__in=tag_ids).values_list('slug', flat=True)
+        )
+    return scopes
+
+
+@receiver(post_save, sender=Post)
+def invalidate_post_feeds(sender, instance, raw=False, **kwargs):
+    if not raw:
+        bump(*feed_scopes([instance.pk]))
+
+
+@receiver(pre_delete, sender=Post)
+def remember_post_feeds(sender, instance, **kwargs):
+    # The post's tags are cascaded away before post_delete
+    instance._feed_scopes = feed_scopes([instance.pk])
+
+
+@receiver(post_delete, sender=Post)
+def invalidate_deleted_post_feeds(sender, instance, **kwargs):
+    bump(*getattr(instance, '_feed_scopes', ['feed:site']))
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def invalidate_retagged_feeds(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        # Feeds of the tags (or posts) about to be unlinked
+        if reverse:
+            instance._feed_scopes = feed_scopes(instance.posts.values_list('pk', flat=True), [instance.pk])
+        else:
+            instance._feed_scopes = feed_scopes([instance.pk])
+        return
+    if action == 'post_clear':
+        bump(*getattr(instance, '_feed_scopes', ['feed:site']))
+    elif action in ('post_add', 'post_remove'):
+        if reverse:
+            bump(*feed_scopes(pk_set or (), [instance.pk]))
+        else:
+            bump(*feed_scopes([instance.pk], pk_set or ()))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_tag_feeds(sender, instance, created=False, **kwargs):
+    # Tag names are item categories in every feed
+    if not created:
+        bump('feeds')
+
+
+@receiver(post_save, sender=User)
+def invalidate_author_feeds(sender, instance, created, update_fields=None, **kwargs):
+    if created or (update_fields and set(update_fields) <= {'last_login'}):
+        return
+    # Usernames are item authors in every feed
+    bump('feeds')
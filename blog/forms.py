@@ -3,8 +3,8 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from django.contrib.auth.models import User
-from .models import UserProfile, Post, Comment, Tag  # Import Tag here
-from django.utils.text import slugify
+from .models import UserProfile, Post, Comment
+from .tagging import parse_tag_names, set_post_tags
 
 
 class UserRegistrationForm(UserCreationForm):
@@ -55,39 +55,27 @@ class PostForm(forms.ModelForm):
 
     class Meta:
         model = Post
-        fields = ('title', 'content', 'category', 'image', 'tags')
+        # tags is the form field above, stored by save(), not the model's m2m
+        fields = ('title', 'content', 'category', 'image')
         widgets = {
             'content': forms.Textarea(attrs={'rows': 8}),
         }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.pk:
+            self.initial['tags'] = ', '.join(tag.name for tag in self.instance.tags.all())
+
     def clean_tags(self):
-        if self.cleaned_data['tags']:
-            return [tag.strip() for tag in self.cleaned_data['tags'].split(',')]
-        return []
+        return parse_tag_names(self.cleaned_data['tags'])
 
     def save(self, commit=True):
-        post = super().save(commit=False)
-
+        post = super().save(commit=commit)
         if commit:
-            post.save()
-
-            # Clear existing tags and add new ones
-            post.tags.clear()
-            tag_list = self.cleaned_data['tags']
-
-            if tag_list:
-                for tag_name in tag_list:
-                    if tag_name:
-                        # Create or get tag
-                        slug = slugify(tag_name)
-                        tag, created = Tag.objects.get_or_create(
-                            slug=slug,
-                            defaults={'name': tag_name}
-                        )
-                        post.tags.add(tag)
-
+            set_post_tags(post, self.cleaned_data['tags'])
         return post
 
+
 class CommentForm(forms.ModelForm):
     class Meta:
         model = Comment
@@ -0,0 +1,141 @@
+# blog/images.py
+
+"""
+Responsive image renditions for Post.image and UserProfile.profile_pic.
+
+When an image is uploaded, Pillow writes resized, re-encoded copies (WebP and
+JPEG) next to the original, e.g. blog_images/photo_640w.webp, and their paths
+and widths are recorded in the model's `*_renditions` JSON field so templates
+can build srcset attributes without touching the filesystem.
+Use `manage.py generate_image_renditions` to backfill existing media.
+"""
+
+import logging
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from PIL import Image, ImageOps, features
+
+from .models import Post, UserProfile
+
+logger = logging.getLogger(__name__)
+
+# Rendition widths, per model
+POST_IMAGE_SIZES = {'thumb': 320, 'card': 640, 'hero': 1280}
+PROFILE_PIC_SIZES = {'thumb': 96, 'card': 256}
+
+JPEG_QUALITY = 80
+WEBP_QUALITY = 75
+
+
+def image_formats():
+    formats = [('jpeg', 'JPEG', {'quality': JPEG_QUALITY, 'optimize': True, 'progressive': True})]
+    if features.check('webp'):
+        formats.insert(0, ('webp', 'WEBP', {'quality': WEBP_QUALITY, 'method': 4}))
+    return formats
+
+
+def delete_renditions(storage, renditions):
+    for rendition in renditions.get('sizes', {}).values():
+        for ext, _, _ in image_formats():
+            name = rendition.get(ext)
+            if name and storage.exists(name):
+                storage.delete(name)
+
+
+def generate_renditions(fieldfile, sizes):
+    """
+    Write every rendition of `fieldfile` and return the renditions dict:
+    {'source': name, 'width': w, 'height': h,
+     'sizes': {'card': {'width': 640, 'height': 427, 'webp': name, 'jpeg': name}, ...}}
+    """
+    storage = fieldfile.storage
+    with storage.open(fieldfile.name, 'rb') as f:
+        original = Image.open(f)
+        original = ImageOps.exif_transpose(original)
+        original.load()
+
+    if original.mode not in ('RGB', 'L'):
+        # Flatten transparency onto white; JPEG has no alpha channel
+        background = Image.new('RGB', original.size, (255, 255, 255))
+        rgba = original.convert('RGBA')
+        background.paste(rgba, mask=rgba.split()[-1])
+        original = background
+    elif original.mode == 'L':
+        original = original.convert('RGB')
+
+    stem, _ = os.path.splitext(fieldfile.name)
+    result = {'source': fieldfile.name, 'width': original.width, 'height': original.height, 'sizes': {}}
+    written = {}
+    for size_name, width in sorted(sizes.items(), key=lambda item: item[1]):
+        # Never upscale; sizes wider than the original share one rendition
+        target_width = min(width, original.width)
+        if target_width not in written:
+            target_height = max(1, round(original.height * target_width / original.width))
+            resized = original.resize((target_width, target_height), Image.LANCZOS)
+            rendition = {'width': target_width, 'height': target_height}
+            for ext, pil_format, options in image_formats():
+                buffer = BytesIO()
+                resized.save(buffer, pil_format, **options)
+                rendition[ext] = storage.save(f'{stem}_{target_width}w.{ext}', ContentFile(buffer.getvalue()))
+            written[target_width] = rendition
+        result['sizes'][size_name] = written[target_width]
+    return result
+
+
+def refresh_renditions(instance, field_name, renditions_field, sizes, force=False):
+    """
+    (Re)generate renditions for instance.<field_name> if the image changed.
+    Saves through queryset.update() so post_save isn't re-entered.
+    Returns True if renditions were written or cleared.
+    """
+    fieldfile = getattr(instance, field_name)
+    current = getattr(instance, renditions_field) or {}
+    source = fieldfile.name if fieldfile else None
+
+    if not force and current.get('source') == source:
+        return False
+    if current:
+        delete_renditions(fieldfile.storage, current)
+
+    renditions = {}
+    if source:
+        try:
+            renditions = generate_renditions(fieldfile, sizes)
+        except (OSError, ValueError, Image.DecompressionBombError):
+            logger.exception("Could not generate renditions for %s", source)
+            # Remember the failure so every save doesn't retry it
+            renditions = {'source': source, 'sizes': {}}
+
+    setattr(instance, renditions_field, renditions)
+    type(instance).objects.filter(pk=instance.pk).update(**{renditions_field: renditions})
+    return True
+
+
+@receiver(post_save, sender=Post)
+def post_image_renditions(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields and 'image' not in update_fields):
+        return
+    refresh_renditions(instance, 'image', 'image_renditions', POST_IMAGE_SIZES)
+
+
+@receiver(post_save, sender=UserProfile)
+def profile_pic_renditions(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields and 'profile_pic' not in update_fields):
+        return
+    refresh_renditions(instance, 'profile_pic', 'profile_pic_renditions', PROFILE_PIC_SIZES)
+
+
+@receiver(post_delete, sender=Post)
+def delete_post_renditions(sender, instance, **kwargs):
+    if instance.image_renditions:
+        delete_renditions(instance.image.storage, instance.image_renditions)
+
+
+@receiver(post_delete, sender=UserProfile)
+def delete_profile_pic_renditions(sender, instance, **kwargs):
+    if instance.profile_pic_renditions:
+        delete_renditions(instance.profile_pic.storage, instance.profile_pic_renditions)
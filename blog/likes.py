@@ -0,0 +1,228 @@
+# blog/likes.py
+
+"""
+Like toggling for the async like endpoints in blog/views.py, and batches of
+like/unlike operations for the like_batch endpoint. The writes themselves
+run in worker threads through blog/writes.py, which retries them while
+SQLite is locked.
+
+Requests may race (double clicks, retries, several tabs), so every operation
+lands on a well-defined state: the unique_user_post_like and
+unique_user_comment_like constraints decide which concurrent insert wins and
+the loser's IntegrityError is treated as "already liked". Counters are kept
+by the Like signals in models.py, which the async ORM still sends.
+"""
+
+import json
+
+from asgiref.sync import sync_to_async
+from django.db import IntegrityError, transaction
+from django.db.models import Count, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .cache import bump
+from .models import Comment, Like, Post
+from .rankings import record_event
+from .writes import write_with_retry
+
+
+def requested_state(request):
+    """
+    The state the client asked for: True (like), False (unlike) or None
+    (toggle). Read from a JSON body or form field named `liked`.
+    """
+    value = request.POST.get('liked')
+    if value is None and request.content_type == 'application/json' and request.body:
+        try:
+            value = json.loads(request.body).get('liked')
+        except (ValueError, AttributeError):
+            value = None
+    if isinstance(value, str):
+        value = {'true': True, '1': True, 'false': False, '0': False}.get(value.lower())
+    return value if isinstance(value, bool) else None
+
+
+@write_with_retry
+def create_like(user, **target):
+    try:
+        # Savepoint, so a lost race doesn't break an enclosing transaction
+        with transaction.atomic():
+            Like.objects.create(user=user, **target)
+    except IntegrityError:
+        # A concurrent request got there first; the like exists either way
+        pass
+
+
+@write_with_retry
+def delete_likes(user, **target):
+    """Delete the like of `user` on `target`; returns the number deleted."""
+    deleted, _ = Like.objects.filter(user=user, **target).delete()
+    return deleted
+
+
+async def alike(user, **target):
+    """Make sure `user` likes `target` (post=... or comment=...)."""
+    await sync_to_async(create_like)(user, **target)
+    return True
+
+
+async def aunlike(user, **target):
+    """Make sure `user` doesn't like `target`."""
+    await sync_to_async(delete_likes)(user, **target)
+    return False
+
+
+async def aset_like(user, liked=None, **target):
+    """
+    Set the like state of `user` on `target` and return it. liked=None
+    toggles: an existing like is removed, otherwise one is added.
+    """
+    if liked is True:
+        return await alike(user, **target)
+    if liked is False:
+        return await aunlike(user, **target)
+    if await sync_to_async(delete_likes)(user, **target):
+        return False
+    return await alike(user, **target)
+
+
+# Batched likes
+
+MAX_BATCH_SIZE = 100
+TARGETS = {'post': Post, 'comment': Comment}
+
+
+class InvalidBatch(Exception):
+    pass
+
+
+def parse_batch(data):
+    """
+    Validate a batch ({'operations': [{'type': 'post', 'id': 1, 'liked': true}, ...]})
+    and coalesce it to {(type, id): liked}; the last operation on a target wins.
+    """
+    operations = data.get('operations') if isinstance(data, dict) else None
+    if not isinstance(operations, list) or not operations:
+        raise InvalidBatch("Expected a non-empty list of operations.")
+    if len(operations) > MAX_BATCH_SIZE:
+        raise InvalidBatch(f"At most {MAX_BATCH_SIZE} operations per batch.")
+
+    wanted = {}
+    for op in operations:
+        if not (
+            isinstance(op, dict)
+            and op.get('type') in TARGETS
+            and isinstance(op.get('id'), int)
+            and isinstance(op.get('liked'), bool)
+        ):
+            raise InvalidBatch("Each operation needs a type ('post' or 'comment'), an integer id and liked (true/false).")
+        wanted[op['type'], op['id']] = op['liked']
+    return wanted
+
+
+def insert_likes(likes):
+    """
+    Insert `likes` without sending signals and return the ones inserted: all
+    of them in one INSERT, unless a concurrent request added one first.
+    """
+    try:
+        with transaction.atomic():
+            Like.objects.bulk_create(likes)
+        return likes
+    except IntegrityError:
+        pass
+    inserted = []
+    for like in likes:
+        try:
+            with transaction.atomic():
+                Like.objects.bulk_create([like])
+        except IntegrityError:
+            # Already liked; the other request counts it
+            continue
+        inserted.append(like)
+    return inserted
+
+
+def refresh_like_counts(model, pks):
+    """Recount `like_count` for the given posts or comments from the Like table."""
+    if not pks:
+        return
+    fk = model.__name__.lower()
+    counts = (
+        Like.objects.filter(**{fk: OuterRef('pk')})
+        .order_by()
+        .values(fk)
+        .annotate(n=Count('pk'))
+        .values('n')
+    )
+    model.objects.filter(pk__in=pks).update(like_count=Coalesce(Subquery(counts), Value(0)))
+
+
+def apply_like_batch(user, wanted):
+    """
+    Apply {(type, id): liked} for `user` in one transaction, with one bulk
+    INSERT and one DELETE, and return the final state of every target:
+    [{'type': ..., 'id': ..., 'liked': ..., 'like_count': ...}, ...].
+    Targets that don't exist are left out.
+    """
+    existing_ids, counts, changed_posts, comment_posts = write_like_batch(user, wanted)
+    if changed_posts or comment_posts:
+        bump(*(['likes'] if changed_posts else []), *(f'post:{pk}' for pk in changed_posts | comment_posts))
+
+    return [
+        {'type': kind, 'id': pk, 'liked': liked, 'like_count': counts[kind][pk]}
+        for (kind, pk), liked in wanted.items()
+        if pk in existing_ids[kind]
+    ]
+
+
+@write_with_retry
+def write_like_batch(user, wanted):
+    """
+    The transaction of apply_like_batch(). Returns the existing target ids,
+    their like counts, and the changed posts and posts of changed comments.
+    """
+    ids = {kind: {pk for (k, pk) in wanted if k == kind} for kind in TARGETS}
+    existing_ids = {
+        kind: set(model.objects.filter(pk__in=ids[kind]).values_list('pk', flat=True))
+        for kind, model in TARGETS.items()
+    }
+    current = {}
+    for like_id, post_id, comment_id in Like.objects.filter(
+        Q(post_id__in=existing_ids['post']) | Q(comment_id__in=existing_ids['comment']), user=user
+    ).values_list('pk', 'post_id', 'comment_id'):
+        current['post' if post_id else 'comment', post_id or comment_id] = like_id
+
+    to_add, to_remove = [], []
+    for (kind, pk), liked in wanted.items():
+        if pk not in existing_ids[kind]:
+            continue
+        if liked and (kind, pk) not in current:
+            to_add.append(Like(user=user, **{f'{kind}_id': pk}))
+        elif not liked and (kind, pk) in current:
+            to_remove.append(current[kind, pk])
+
+    # Inserts skip the Like signals, so the liked targets are recounted
+    # instead of adjusted, and the rankings are told directly; deletes send
+    # them, which adjusts the counters of the unliked ones
+    added = insert_likes(to_add) if to_add else []
+    if to_remove:
+        Like.objects.filter(pk__in=to_remove).delete()
+
+    record_event('like', [like.post_id for like in added if like.post_id])
+    changed_posts = {like.post_id for like in added if like.post_id}
+    changed_comments = {like.comment_id for like in added if like.comment_id}
+    refresh_like_counts(Post, changed_posts)
+    refresh_like_counts(Comment, changed_comments)
+    for kind, pk in current:
+        if current[kind, pk] in to_remove:
+            (changed_posts if kind == 'post' else changed_comments).add(pk)
+
+    counts = {
+        kind: dict(model.objects.filter(pk__in=existing_ids[kind]).values_list('pk', 'like_count'))
+        for kind, model in TARGETS.items()
+    }
+    comment_posts = set(
+        Comment.objects.filter(pk__in=changed_comments).values_list('post_id', flat=True)
+    )
+    return existing_ids, counts, changed_posts, comment_posts
@@ -0,0 +1,294 @@
+# blog/management/commands/benchmark.py
+
+import io
+import json
+import random
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from blog.models import Comment, Like, Post, Tag, UserProfile, refresh_tag_counts, text_stats
+from blog.viewcounts import flush_view_counts
+
+WORDS = (
+    "django python cache query index page post comment reader author view "
+    "template model signal database latency memory request response server "
+    "performance benchmark writing blog story idea code data design"
+).split()
+
+# The seeded database gets its own cache, so neither what the run stores nor
+# --cold's clears reach the real one
+THROWAWAY_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'benchmark',
+    }
+}
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of `samples`."""
+    ordered = sorted(samples)
+    rank = max(1, round(pct / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway test database and time every route in blog/urls.py, "
+        "the API's included, through the test client, anonymously and logged "
+        "in. Prints a JSON report."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--posts', type=int, default=500)
+        parser.add_argument('--tags', type=int, default=40)
+        parser.add_argument('--tags-per-post', type=int, default=4)
+        parser.add_argument('--comments-per-post', type=int, default=10,
+                            help="Top-level comments per post; each gets one reply.")
+        parser.add_argument('--likes-per-post', type=int, default=20)
+        parser.add_argument('--requests', type=int, default=30,
+                            help="Timed requests per route and user.")
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--cold', action='store_true',
+                            help="Clear the cache before every request.")
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--output', help="Write the JSON report to this file instead of stdout.")
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.random = random.Random(options['seed'])
+
+        # Never touch the real database: seed a test database and drop it after
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        # Nor the real cache or sitemap files
+        sitemap_root = tempfile.TemporaryDirectory()
+        try:
+            with override_settings(CACHES=THROWAWAY_CACHES, SITEMAP_ROOT=sitemap_root.name):
+                results = self.run_routes(self.seed())
+                # Into the test database, not the real one when the process exits
+                flush_view_counts()
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            sitemap_root.cleanup()
+
+        report = {
+            'dataset': {key: options[key] for key in (
+                'users', 'posts', 'tags', 'tags_per_post', 'comments_per_post', 'likes_per_post', 'seed',
+            )},
+            'settings': {
+                'requests': options['requests'],
+                'warmup': options['warmup'],
+                'cold_cache': options['cold'],
+                'database': connection.vendor,
+                'django': django.get_version(),
+            },
+            'routes': results,
+        }
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+            self.stderr.write(self.style.SUCCESS(f"Wrote {len(results)} result(s) to {options['output']}."))
+        else:
+            self.stdout.write(output)
+
+    def words(self, count):
+        return ' '.join(self.random.choice(WORDS) for _ in range(count))
+
+    def seed(self):
+        options, rng = self.options, self.random
+        password = make_password('benchmark')
+
+        # Objects are re-read after each bulk_create, which doesn't set
+        # primary keys on every database
+        User.objects.bulk_create([
+            User(username=f'bench{i}', password=password) for i in range(max(2, options['users']))
+        ])
+        UserProfile.objects.bulk_create([UserProfile(user_id=pk) for pk in User.objects.values_list('pk', flat=True)])
+        users = list(User.objects.select_related('profile').order_by('pk'))
+
+        Tag.objects.bulk_create([
+            Tag(name=f'topic{i}', slug=f'topic{i}') for i in range(max(1, options['tags']))
+        ])
+        tags = list(Tag.objects.order_by('pk'))
+
+        posts = []
+        for i in range(max(1, options['posts'])):
+            content = '\n\n'.join(self.words(rng.randint(40, 120)) for _ in range(rng.randint(3, 12)))
+            word_count, reading_time, excerpt = text_stats(content)
+            posts.append(Post(
+                title=f'{self.words(4).title()} {i}', content=content, author=rng.choice(users),
+                is_featured=i % 50 == 0, word_count=word_count, reading_time=reading_time, excerpt=excerpt,
+            ))
+        Post.objects.bulk_create(posts, batch_size=500)
+        posts = list(Post.objects.order_by('pk'))
+
+        # Popular tags are used much more often than the rest
+        weights = [1 / (rank + 1) for rank in range(len(tags))]
+        PostTags = Post.tags.through
+        PostTags.objects.bulk_create([
+            PostTags(post_id=post.pk, tag_id=tag.pk)
+            for post in posts
+            for tag in set(rng.choices(tags, weights, k=options['tags_per_post']))
+        ], batch_size=1000)
+
+        Comment.objects.bulk_create([
+            Comment(post=post, author=rng.choice(users), content=self.words(20), is_approved=True)
+            for post in posts
+            for _ in range(options['comments_per_post'])
+        ], batch_size=1000)
+        top_level = list(Comment.objects.filter(parent__isnull=True).values_list('pk', 'post_id'))
+        Comment.objects.bulk_create([
+            Comment(post_id=post_id, parent_id=pk, author=rng.choice(users), content=self.words(10), is_approved=True)
+            for pk, post_id in top_level
+        ], batch_size=1000)
+
+        likes_per_post = min(options['likes_per_post'], len(users))
+        Like.objects.bulk_create([
+            Like(user=user, post=post)
+            for post in posts
+            for user in rng.sample(users, likes_per_post)
+        ], batch_size=1000)
+
+        # bulk_create skips signals: rebuild everything they would have maintained
+        refresh_tag_counts(tag.pk for tag in tags)
+        for command in ('reconcile_counters', 'rebuild_search_index', 'rebuild_related_posts'):
+            call_command(command, stdout=io.StringIO())
+
+        post = posts[-1]
+        comment = Comment.objects.filter(post=post, parent__isnull=True).first()
+        return {
+            'post': post,
+            'comment': comment,
+            'tag': tags[0],
+            'author': post.author,
+            'reader': next(user for user in users if user.pk != post.author_id),
+        }
+
+    def routes(self, seeded):
+        """
+        (url name, args, method, data, who) for every route in blog/urls.py,
+        including the API's. String data is sent as a JSON body.
+        """
+        post, comment, tag, author = seeded['post'], seeded['comment'], seeded['tag'], seeded['author']
+        batch = json.dumps({'operations': [
+            {'type': 'post', 'id': post.pk, 'liked': True},
+            {'type': 'comment', 'id': comment.pk, 'liked': True},
+        ]})
+        return [
+            ('post_list', [], 'get', None, None),
+            ('post_detail', [post.pk], 'get', None, None),
+            ('register', [], 'get', None, None),
+            ('login', [], 'get', None, None),
+            ('logout', [], 'get', None, None),
+            ('profile', [], 'get', None, None),
+            ('author_profile', [author.username], 'get', None, None),
+            ('create_post', [], 'get', None, None),
+            ('update_post', [post.pk], 'get', None, 'author'),
+            ('delete_post', [post.pk], 'get', None, 'author'),
+            ('delete_comment', [comment.pk], 'get', None, None),
+            ('search_posts', [], 'get', {'query': WORDS[0]}, None),
+            ('tag_posts', [tag.slug], 'get', None, None),
+            ('like_post', [post.pk], 'post', None, None),
+            ('like_comment', [comment.pk], 'post', None, None),
+            ('like_batch', [], 'post', batch, None),
+            ('post_feed', [], 'get', None, None),
+            ('post_atom_feed', [], 'get', None, None),
+            ('tag_feed', [tag.slug], 'get', None, None),
+            ('tag_atom_feed', [tag.slug], 'get', None, None),
+            ('author_feed', [author.username], 'get', None, None),
+            ('author_atom_feed', [author.username], 'get', None, None),
+            ('sitemap_index', [], 'get', None, None),
+            ('sitemap_section', ['posts', 1], 'get', None, None),
+            ('api-v1:post_list', [], 'get', None, None),
+            ('api-v1:post_trending', [], 'get', None, None),
+            ('api-v1:post_popular', [], 'get', None, None),
+            ('api-v1:post_detail', [post.pk], 'get', None, None),
+            ('api-v1:post_comments', [post.pk], 'get', None, None),
+            ('api-v1:tag_list', [], 'get', None, None),
+            ('api-v1:tag_detail', [tag.slug], 'get', None, None),
+            ('api-v1:author_list', [], 'get', None, None),
+            ('api-v1:author_detail', [author.username], 'get', None, None),
+        ]
+
+    @staticmethod
+    def send(client, method, url, data):
+        if isinstance(data, str):
+            return getattr(client, method)(url, data, content_type='application/json')
+        return getattr(client, method)(url, data)
+
+    def run_routes(self, seeded):
+        results = []
+        for name, args, method, data, who in self.routes(seeded):
+            for user_label in ('anonymous', 'logged_in'):
+                client = Client()
+                login = None
+                if user_label == 'logged_in':
+                    # Edit/delete pages are only shown to the post's author
+                    user = seeded['author'] if who == 'author' else seeded['reader']
+                    login = lambda: client.force_login(user)  # noqa: E731
+                    login()
+                # Logging out ends the session, so log back in before each request
+                before = login if name == 'logout' else None
+                results.append(self.measure(client, name, reverse(name, args=args), method, data, user_label, before))
+                self.stderr.write(f"{name} ({user_label}) done")
+        return results
+
+    def request(self, client, url, method, data, before=None):
+        if before is not None:
+            before()
+        if self.options['cold']:
+            cache.clear()
+        start = time.perf_counter()
+        response = self.send(client, method, url, data)
+        elapsed = (time.perf_counter() - start) * 1000
+        return response, elapsed
+
+    def measure(self, client, name, url, method, data, user_label, before=None):
+        for _ in range(self.options['warmup']):
+            self.request(client, url, method, data, before)
+
+        timings, queries, statuses = [], [], set()
+        for _ in range(max(1, self.options['requests'])):
+            response, elapsed = self.request(client, url, method, data, before)
+            timings.append(elapsed)
+            queries.append(response.wsgi_request.query_stats.queries)
+            statuses.add(response.status_code)
+
+        # Measured separately: tracing allocations slows the request down
+        tracemalloc.start()
+        self.request(client, url, method, data, before)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        return {
+            'route': name,
+            'user': user_label,
+            'url': url,
+            'method': method.upper(),
+            'status': sorted(statuses),
+            'p50_ms': round(percentile(timings, 50), 2),
+            'p95_ms': round(percentile(timings, 95), 2),
+            'p99_ms': round(percentile(timings, 99), 2),
+            'mean_ms': round(statistics.fmean(timings), 2),
+            'queries_median': statistics.median(queries),
+            'queries_max': max(queries),
+            'peak_memory_kb': round(peak / 1024, 1),
+        }
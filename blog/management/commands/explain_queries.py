@@ -0,0 +1,148 @@
+# blog/management/commands/explain_queries.py
+
+import random
+import re
+
+from django.core.cache import cache
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import resolve, reverse
+
+from blog.viewcounts import flush_view_counts
+
+from .benchmark import THROWAWAY_CACHES, Command as BenchmarkCommand
+
+EXPLAINED = ('SELECT', 'UPDATE', 'DELETE')
+
+
+def explain(sql):
+    """The query plan of `sql` (as captured, with its parameters inlined), one string per step."""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return [row[-1] for row in cursor.fetchall()]
+        cursor.execute(f'EXPLAIN {sql}')
+        if connection.vendor == 'mysql':
+            # One row per table read, e.g. "blog_post type=ALL key=None Using where; Using filesort"
+            columns = [column[0].lower() for column in cursor.description]
+            rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+            return [f"{row['table']} type={row['type']} key={row['key']} {row['extra'] or ''}".rstrip() for row in rows]
+        return [row[0] for row in cursor.fetchall()]
+
+
+def problems(sql, plan):
+    """
+    Full table scans, and sorts of every matching row for a LIMITed query, in
+    `plan`. Queries without a WHERE clause read whole tables on purpose.
+    """
+    filtered, limited = ' WHERE ' in sql, ' LIMIT ' in sql
+    found = []
+    for step in plan:
+        if connection.vendor == 'sqlite':
+            # "SCAN blog_post" reads the whole table; "SCAN blog_post USING INDEX ..."
+            # walks an index. Full-text searches (blog/search.py) scan a virtual
+            # table and sort by relevance, which no index can serve.
+            if 'VIRTUAL TABLE' in step:
+                return []
+            scan = re.match(r'\s*SCAN (\w+)', step)
+            if scan and filtered and not re.search(r' USING |CONSTANT ROW', step):
+                found.append(f'full scan of {scan.group(1)}')
+            elif 'USE TEMP B-TREE FOR ORDER BY' in step and limited:
+                found.append('sort of every matching row')
+        elif connection.vendor == 'mysql':
+            # type=ALL reads the whole table; a filesort sorts every matching
+            # row. Full-text searches (blog/search.py) sort by relevance.
+            if ' type=fulltext ' in step:
+                return []
+            scan = re.match(r'(\S+) type=ALL\b', step)
+            if scan and filtered:
+                found.append(f'full scan of {scan.group(1)}')
+            elif 'Using filesort' in step and limited:
+                found.append('sort of every matching row')
+        else:
+            scan = re.search(r'Seq Scan on (\w+)', step)
+            if scan and filtered:
+                found.append(f'full scan of {scan.group(1)}')
+            elif re.search(r'\bSort\b', step) and 'Top-N' not in step and limited:
+                found.append('sort of every matching row')
+    return found
+
+
+class Command(BenchmarkCommand):
+    help = (
+        "Seed a throwaway test database, request every view in blog/views.py "
+        "with a cold cache, anonymously and logged in, and EXPLAIN the queries "
+        "they issue. Flags full table scans and sorts no index serves."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--posts', type=int, default=500)
+        parser.add_argument('--tags', type=int, default=40)
+        parser.add_argument('--tags-per-post', type=int, default=4)
+        parser.add_argument('--comments-per-post', type=int, default=10)
+        parser.add_argument('--likes-per-post', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--all', action='store_true', help="Print every plan, not only flagged ones.")
+        parser.add_argument('--fail', action='store_true', help="Exit with an error if anything is flagged.")
+
+    def handle(self, *args, **options):
+        if connection.vendor not in ('sqlite', 'mysql', 'postgresql'):
+            raise CommandError(f"Reading {connection.vendor} query plans isn't supported.")
+        self.options = options
+        self.random = random.Random(options['seed'])
+
+        # Never touch the real database: seed a test database and drop it after
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        # Nor the real cache
+        try:
+            with override_settings(CACHES=THROWAWAY_CACHES):
+                flagged = self.explain_routes(self.seed())
+                # Into the test database, not the real one when the process exits
+                flush_view_counts()
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        if flagged and options['fail']:
+            raise CommandError(f"{flagged} quer{'y' if flagged == 1 else 'ies'} flagged.")
+        self.stdout.write(self.style.SUCCESS(f"{flagged} quer{'y' if flagged == 1 else 'ies'} flagged."))
+
+    def explain_routes(self, seeded):
+        seen, flagged = set(), 0
+        for name, args, method, data, who in self.routes(seeded):
+            url = reverse(name, args=args)
+            if resolve(url).func.__module__ != 'blog.views':
+                continue
+            for user_label in ('anonymous', 'logged_in'):
+                client = Client()
+                if user_label == 'logged_in':
+                    client.force_login(seeded['author'] if who == 'author' else seeded['reader'])
+                cache.clear()
+                with CaptureQueriesContext(connection) as captured:
+                    self.send(client, method, url, data)
+
+                for query in captured.captured_queries:
+                    sql = query['sql']
+                    if not sql.lstrip().upper().startswith(EXPLAINED) or sql in seen:
+                        continue
+                    seen.add(sql)
+                    plan = explain(sql)
+                    found = problems(sql, plan)
+                    flagged += bool(found)
+                    if found or self.options['all']:
+                        self.report(f'{name} ({user_label})', sql, plan, found)
+        return flagged
+
+    def report(self, label, sql, plan, found):
+        self.stdout.write(self.style.MIGRATE_HEADING(label))
+        self.stdout.write(f'  {sql}')
+        for step in plan:
+            self.stdout.write(f'    {step}')
+        for problem in found:
+            self.stdout.write(self.style.WARNING(f'  ! {problem}'))
+        self.stdout.write('')
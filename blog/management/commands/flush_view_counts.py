@@ -0,0 +1,47 @@
+# blog/management/commands/flush_view_counts.py
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from blog.models import Post
+from blog.viewcounts import drain_cached_counts, flush_view_counts
+
+
+class Command(BaseCommand):
+    help = "Write buffered post view counts to the database."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help="Number of posts to drain from the cache per batch.",
+        )
+
+    def handle(self, *args, batch_size=500, **options):
+        mode = getattr(settings, 'VIEW_COUNT_MODE', 'sync')
+
+        if mode != 'cache':
+            # Only this process's buffer can be flushed from here: each worker
+            # flushes its own on the threshold/interval and at exit.
+            flushed = flush_view_counts()
+            self.stdout.write(f"VIEW_COUNT_MODE is '{mode}'; nothing to drain from the cache.")
+            self.stdout.write(self.style.SUCCESS(f"Flushed {flushed} view(s)."))
+            return
+
+        flushed = 0
+        batch = []
+        for post_id in Post.objects.values_list('id', flat=True).iterator(chunk_size=batch_size):
+            batch.append(post_id)
+            if len(batch) >= batch_size:
+                flushed += self.drain(batch)
+                batch = []
+        flushed += self.drain(batch)
+
+        self.stdout.write(self.style.SUCCESS(f"Flushed {flushed} view(s)."))
+
+    def drain(self, post_ids):
+        applied = drain_cached_counts(post_ids)
+        if applied is None:
+            raise CommandError("Another process is flushing view counts; try again shortly.")
+        return applied
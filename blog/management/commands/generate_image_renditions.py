@@ -0,0 +1,38 @@
+# blog/management/commands/generate_image_renditions.py
+
+from django.core.management.base import BaseCommand
+
+from blog.images import POST_IMAGE_SIZES, PROFILE_PIC_SIZES, refresh_renditions
+from blog.models import Post, UserProfile
+
+
+class Command(BaseCommand):
+    help = "Generate resized WebP/JPEG renditions for existing post images and profile pictures."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help="Regenerate renditions even for images that already have them.",
+        )
+
+    def handle(self, *args, force=False, **options):
+        targets = [
+            (Post.objects.exclude(image='').exclude(image__isnull=True),
+             'image', 'image_renditions', POST_IMAGE_SIZES),
+            (UserProfile.objects.exclude(profile_pic='').exclude(profile_pic__isnull=True),
+             'profile_pic', 'profile_pic_renditions', PROFILE_PIC_SIZES),
+        ]
+
+        total = 0
+        for queryset, field_name, renditions_field, sizes in targets:
+            for instance in queryset.iterator():
+                fieldfile = getattr(instance, field_name)
+                if not fieldfile.storage.exists(fieldfile.name):
+                    self.stderr.write(f"Missing file for {instance!r}: {fieldfile.name}")
+                    continue
+                if refresh_renditions(instance, field_name, renditions_field, sizes, force=force):
+                    total += 1
+                    self.stdout.write(f"{fieldfile.name}: {len(getattr(instance, renditions_field).get('sizes', {}))} size(s)")
+
+        self.stdout.write(self.style.SUCCESS(f"Generated renditions for {total} image(s)."))
@@ -0,0 +1,19 @@
+# blog/management/commands/rebuild_related_posts.py
+
+from django.core.management.base import BaseCommand
+
+from blog.cache import bump
+from blog.related import rebuild_related
+
+
+class Command(BaseCommand):
+    help = "Recompute the related-posts index for every post."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, batch_size=500, **options):
+        total = rebuild_related(batch_size=batch_size)
+        # Related posts are shown on every detail page
+        bump('posts')
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt related posts for {total} post(s)."))
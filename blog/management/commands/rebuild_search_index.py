@@ -0,0 +1,17 @@
+# blog/management/commands/rebuild_search_index.py
+
+from django.core.management.base import BaseCommand
+
+from blog.search import get_backend_class, rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index from all posts."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, batch_size=500, **options):
+        indexed = rebuild_index(batch_size=batch_size)
+        backend = get_backend_class().__name__
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} post(s) with {backend}."))
@@ -0,0 +1,75 @@
+# blog/management/commands/reconcile_counters.py
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from blog.cache import bump
+from blog.models import Comment, Like, Post, Tag
+
+
+def count_of(model, fk, **filters):
+    """Correlated COUNT(*) of `model` rows pointing at the outer row through `fk`."""
+    subquery = (
+        model.objects.filter(**{fk: OuterRef('pk')}, **filters)
+        .order_by()
+        .values(fk)
+        .annotate(n=Count('pk'))
+        .values('n')
+    )
+    return Coalesce(Subquery(subquery), Value(0))
+
+
+class Command(BaseCommand):
+    help = "Recompute the denormalized like/comment/tag counters and repair any drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help="Only report drifted rows, don't fix them.",
+        )
+
+    def handle(self, *args, dry_run=False, **options):
+        checks = [
+            (Post, {
+                'like_count': count_of(Like, 'post'),
+                'approved_comment_count': count_of(Comment, 'post', is_approved=True),
+            }),
+            (Comment, {
+                'like_count': count_of(Like, 'comment'),
+            }),
+            (Tag, {
+                'post_count': count_of(Post.tags.through, 'tag'),
+            }),
+        ]
+
+        total = 0
+        with transaction.atomic():
+            for model, counters in checks:
+                actual = {f'actual_{field}': expr for field, expr in counters.items()}
+                drift = Q()
+                for field in counters:
+                    drift |= ~Q(**{field: F(f'actual_{field}')})
+
+                drifted = model.objects.annotate(**actual).filter(drift)
+                rows = list(drifted.values('pk', *counters, *actual))
+                for row in rows:
+                    self.stdout.write(
+                        f"{model.__name__} #{row['pk']}: " + ", ".join(
+                            f"{field} {row[field]} -> {row[f'actual_{field}']}"
+                            for field in counters
+                        )
+                    )
+                    if not dry_run:
+                        model.objects.filter(pk=row['pk']).update(
+                            **{field: row[f'actual_{field}'] for field in counters}
+                        )
+                total += len(rows)
+
+        if total and not dry_run:
+            bump('posts', 'tags')
+
+        verb = "Found" if dry_run else "Repaired"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {total} drifted row(s)."))
@@ -0,0 +1,130 @@
+# blog/management/commands/stress_writes.py
+
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, connections
+from django.test import override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from blog.likes import create_like, delete_likes
+from blog.models import Comment, Like, Post
+from blog.viewcounts import flush_view_counts, record_view
+from blog.writes import write_with_retry
+
+from .benchmark import THROWAWAY_CACHES
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway test database and hammer one post with views, likes, "
+        "unlikes and comments from concurrent threads, each on its own "
+        "connection like separate workers. Prints a JSON report of the database "
+        "errors hit and whether the post's counters still add up."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--operations', type=int, default=100, help="Writes per thread.")
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        # Never touch the real database: seed a test database and drop it after.
+        # On SQLite it must be a file: threads can't share an in-memory database
+        # the way workers share db.sqlite3.
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        tmp_dir = tempfile.TemporaryDirectory()
+        if connection.vendor == 'sqlite':
+            connection.settings_dict['TEST']['NAME'] = os.path.join(tmp_dir.name, 'stress.sqlite3')
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        # Nor the real cache
+        try:
+            with override_settings(CACHES=THROWAWAY_CACHES):
+                report = self.run(options)
+        finally:
+            connections.close_all()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            tmp_dir.cleanup()
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def run(self, options):
+        threads, operations = max(1, options['threads']), max(1, options['operations'])
+        users = [User.objects.create_user(f'stress{i}') for i in range(threads)]
+        post = Post.objects.create(title='Stress', content='Body', author=users[0])
+        errors, done = Counter(), Counter()
+        lock = threading.Lock()
+        start_line = threading.Barrier(threads)
+
+        def work(index):
+            rng = random.Random(options['seed'] * 1000 + index)
+            user = users[index]
+            start_line.wait()
+            try:
+                for i in range(operations):
+                    kind = ('view', 'like', 'unlike', 'comment')[i % 4]
+                    try:
+                        if kind == 'view':
+                            record_view(post.pk, rng.getrandbits(128))
+                        elif kind == 'like':
+                            create_like(user, post=post)
+                        elif kind == 'unlike':
+                            delete_likes(user, post=post)
+                        else:
+                            comment = Comment(post=post, author=user, content=f'Comment {i}', is_approved=True)
+                            write_with_retry(comment.save)()
+                    except OperationalError as e:
+                        with lock:
+                            errors[str(e)] += 1
+                    else:
+                        with lock:
+                            done[kind] += 1
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=work, args=(i,)) for i in range(threads)]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        # Buffered views (and every mode's rankings and sketches) go in now,
+        # not into the real database when the process exits
+        flush_view_counts()
+        elapsed = time.perf_counter() - started
+
+        post.refresh_from_db()
+        journal_mode = None
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA journal_mode')
+                journal_mode = cursor.fetchone()[0]
+        counters = {
+            'view_count': (post.view_count, done['view']),
+            'like_count': (post.like_count, Like.objects.filter(post=post).count()),
+            'approved_comment_count': (post.approved_comment_count, done['comment']),
+        }
+        return {
+            'settings': {
+                'database': connection.vendor,
+                'journal_mode': journal_mode,
+                'sqlite_concurrent': getattr(settings, 'SQLITE_CONCURRENT', False),
+                'write_retries': getattr(settings, 'SQLITE_WRITE_RETRIES', 5),
+                'threads': threads,
+                'operations_per_thread': operations,
+            },
+            'elapsed_s': round(elapsed, 2),
+            'writes': dict(done),
+            'errors': dict(errors),
+            'counters': {name: {'stored': stored, 'expected': expected} for name, (stored, expected) in counters.items()},
+            'consistent': all(stored == expected for stored, expected in counters.values()),
+        }
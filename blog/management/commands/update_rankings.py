@@ -0,0 +1,27 @@
+# blog/management/commands/update_rankings.py
+
+from django.core.management.base import BaseCommand
+
+from blog.rankings import rebuild_rankings, update_weekly
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the weekly popularity ranking from the last seven days of "
+        "activity and drop older activity. Run daily, e.g. from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help="Recompute both rankings from likes and approved comments (drops recorded views).",
+        )
+
+    def handle(self, *args, rebuild=False, **options):
+        if rebuild:
+            total = rebuild_rankings()
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt rankings for {total} post(s)."))
+            return
+        deleted = update_weekly()
+        self.stdout.write(self.style.SUCCESS(f"Updated weekly rankings; dropped {deleted} old activity bucket(s)."))
@@ -0,0 +1,145 @@
+# blog/middleware.py
+
+"""
+Per-request query budgets.
+
+QueryBudgetMiddleware counts the SQL queries a request runs and times them,
+whether or not DEBUG is on, and stores the numbers on `request.query_stats`.
+Each request is logged to the "blog.querybudget" logger (at DEBUG level) with
+its resolved view name. When the view has an entry in QUERY_BUDGETS and goes
+over it, a warning is logged, or QueryBudgetExceeded is raised if
+QUERY_BUDGET_RAISE is set (meant for DEBUG and the test suite):
+
+    QUERY_BUDGETS = {
+        'post_list': 12,                              # max queries
+        'post_detail': {'queries': 15, 'db_ms': 50},  # and/or DB time
+    }
+"""
+
+import logging
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('blog.querybudget')
+
+# The QueryStats of the request being handled; copied into sync_to_async
+# threads along with the rest of the context
+active_stats = ContextVar('active_stats', default=None)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class QueryStats:
+    """Counts and times the queries run through the wrapped connections."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.total_time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        if active_stats.get() is not self:
+            # A concurrent request sharing this thread's connection
+            return execute(sql, params, many, context)
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += time.perf_counter() - start
+
+    @property
+    def db_ms(self):
+        return self.db_time * 1000
+
+    @property
+    def total_ms(self):
+        return self.total_time * 1000
+
+
+def get_budget(view_name):
+    """{'queries': n, 'db_ms': ms} for `view_name` (either key may be missing), or None."""
+    budget = getattr(settings, 'QUERY_BUDGETS', {}).get(view_name)
+    if isinstance(budget, int):
+        return {'queries': budget}
+    return budget
+
+
+def over_budget(stats, budget):
+    """Descriptions of every limit in `budget` that `stats` exceeded."""
+    problems = []
+    if budget.get('queries') is not None and stats.queries > budget['queries']:
+        problems.append(f"{stats.queries} queries > {budget['queries']}")
+    if budget.get('db_ms') is not None and stats.db_ms > budget['db_ms']:
+        problems.append(f"{stats.db_ms:.1f}ms in the database > {budget['db_ms']}ms")
+    return problems
+
+
+class QueryBudgetMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def wrap_connections(stack, stats):
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(stats))
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = request.query_stats = QueryStats()
+        token = active_stats.set(stats)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                self.wrap_connections(stack, stats)
+                response = self.get_response(request)
+        finally:
+            active_stats.reset(token)
+        stats.total_time = time.perf_counter() - start
+        self.check_budget(request, stats)
+        return response
+
+    async def __acall__(self, request):
+        stats = request.query_stats = QueryStats()
+        active_stats.set(stats)  # the context is this request's own
+        start = time.perf_counter()
+        # Under ASGI the ORM runs in the request's sync_to_async thread, whose
+        # connections are separate from the event loop's: wrap those
+        stack = ExitStack()
+        await sync_to_async(self.wrap_connections)(stack, stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        stats.total_time = time.perf_counter() - start
+        self.check_budget(request, stats)
+        return response
+
+    def check_budget(self, request, stats):
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name if match else None
+        logger.debug(
+            "%s %s: %d queries, %.1fms db, %.1fms total",
+            view_name or request.path, request.method, stats.queries, stats.db_ms, stats.total_ms,
+        )
+
+        budget = get_budget(view_name) if view_name else None
+        problems = over_budget(stats, budget) if budget else []
+        if problems:
+            message = f"{view_name} went over its query budget: {'; '.join(problems)}"
+            if getattr(settings, 'QUERY_BUDGET_RAISE', False):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
@@ -0,0 +1,54 @@
+# Generated by Django 5.2 on 2026-10-18 04:33
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def count_of(model, fk, **filters):
+    """Correlated COUNT(*) of `model` rows pointing at the outer row through `fk`."""
+    subquery = (
+        model.objects.filter(**{fk: OuterRef("pk")}, **filters)
+        .order_by()
+        .values(fk)
+        .annotate(n=Count("pk"))
+        .values("n")
+    )
+    return Coalesce(Subquery(subquery), Value(0))
+
+
+def backfill_counters(apps, schema_editor):
+    Post = apps.get_model("blog", "Post")
+    Comment = apps.get_model("blog", "Comment")
+    Like = apps.get_model("blog", "Like")
+
+    Post.objects.update(
+        like_count=count_of(Like, "post"),
+        approved_comment_count=count_of(Comment, "post", is_approved=True),
+    )
+    Comment.objects.update(like_count=count_of(Like, "comment"))
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("blog", "0008_post_is_featured"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="comment",
+            name="like_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="post",
+            name="approved_comment_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="post",
+            name="like_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,66 @@
+# Creates the full-text search index used by blog/search.py. The SQL is a copy
+# of the backends' as of this migration, so later changes to blog/search.py
+# don't change what this migration does.
+
+from django.db import migrations
+
+SQLITE_TABLE = "blog_post_fts"
+MYSQL_TABLE = "blog_post_search"
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {SQLITE_TABLE} "
+            f"USING fts5(title, content, author, tags, tokenize='porter unicode61')"
+        )
+        insert = f"INSERT INTO {SQLITE_TABLE} (rowid, title, content, author, tags) VALUES (%s, %s, %s, %s, %s)"
+    elif vendor == "mysql":
+        schema_editor.execute(
+            f"CREATE TABLE IF NOT EXISTS {MYSQL_TABLE} ("
+            f"post_id BIGINT NOT NULL PRIMARY KEY, "
+            f"title VARCHAR(200) NOT NULL, content LONGTEXT NOT NULL, "
+            f"author VARCHAR(150) NOT NULL, tags TEXT NOT NULL, "
+            f"FULLTEXT INDEX blog_post_search_ft (title, content, author, tags)"
+            f") ENGINE=InnoDB DEFAULT CHARSET=utf8mb4"
+        )
+        insert = f"REPLACE INTO {MYSQL_TABLE} (post_id, title, content, author, tags) VALUES (%s, %s, %s, %s, %s)"
+    else:
+        # Other databases search with LIKE and need no index
+        return
+
+    Post = apps.get_model("blog", "Post")
+    documents = [
+        (
+            post.pk,
+            post.title,
+            post.content,
+            post.author.username if post.author_id else "",
+            " ".join(tag.name for tag in post.tags.all()),
+        )
+        for post in Post.objects.using(schema_editor.connection.alias)
+        .select_related("author")
+        .prefetch_related("tags")
+    ]
+    if documents:
+        with schema_editor.connection.cursor() as cursor:
+            cursor.executemany(insert, documents)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        schema_editor.execute(f"DROP TABLE IF EXISTS {SQLITE_TABLE}")
+    elif vendor == "mysql":
+        schema_editor.execute(f"DROP TABLE IF EXISTS {MYSQL_TABLE}")
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("blog", "0009_post_like_count_comment_like_count"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2 on 2026-10-18 04:44
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_post_counts(apps, schema_editor):
+    Tag = apps.get_model("blog", "Tag")
+    PostTags = apps.get_model("blog", "Post").tags.through
+    counts = (
+        PostTags.objects.filter(tag=OuterRef("pk"))
+        .order_by()
+        .values("tag")
+        .annotate(n=Count("pk"))
+        .values("n")
+    )
+    Tag.objects.update(post_count=Coalesce(Subquery(counts), Value(0)))
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("blog", "0012_relatedpost"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="tag",
+            name="post_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name="tag",
+            index=models.Index(
+                fields=["-post_count", "name"], name="blog_tag_popularity_idx"
+            ),
+        ),
+        migrations.RunPython(backfill_post_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2 on 2026-10-18 04:46
+
+from django.db import migrations, models
+from django.utils.html import strip_tags
+from django.utils.text import Truncator
+
+
+def text_stats(content):
+    # A copy of blog.models.text_stats as of this migration, so later changes
+    # to it don't change what this migration does
+    words = strip_tags(content or "").split()
+    word_count = len(words)
+    reading_time = max(1, round(word_count / 200))
+    excerpt = Truncator(" ".join(words)).chars(300)
+    return word_count, reading_time, excerpt
+
+
+def backfill_text_stats(apps, schema_editor):
+    Post = apps.get_model("blog", "Post")
+    batch = []
+    for post in Post.objects.only("pk", "content").iterator(chunk_size=500):
+        post.word_count, post.reading_time, post.excerpt = text_stats(post.content)
+        batch.append(post)
+        if len(batch) >= 500:
+            Post.objects.bulk_update(batch, ["word_count", "reading_time", "excerpt"])
+            batch = []
+    Post.objects.bulk_update(batch, ["word_count", "reading_time", "excerpt"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("blog", "0013_tag_post_count"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="post",
+            name="excerpt",
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name="post",
+            name="reading_time",
+            field=models.PositiveSmallIntegerField(default=1, editable=False),
+        ),
+        migrations.AddField(
+            model_name="post",
+            name="word_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_text_stats, migrations.RunPython.noop),
+    ]
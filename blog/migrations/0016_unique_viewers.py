@@ -0,0 +1,34 @@
+# Generated by Django 5.2 on 2026-10-18 05:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("blog", "0015_updated_at"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ViewerSketch",
+            fields=[
+                (
+                    "post",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="viewer_sketch",
+                        serialize=False,
+                        to="blog.post",
+                    ),
+                ),
+                ("registers", models.BinaryField(default=bytes)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="post",
+            name="unique_viewers",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
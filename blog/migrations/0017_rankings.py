@@ -0,0 +1,71 @@
+# Generated by Django 5.2 on 2026-10-18 05:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("blog", "0016_unique_viewers"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PostRanking",
+            fields=[
+                (
+                    "post",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="ranking",
+                        serialize=False,
+                        to="blog.post",
+                    ),
+                ),
+                ("trending", models.FloatField()),
+                ("weekly", models.FloatField(default=0)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["-trending"], name="blog_ranking_trending_idx"
+                    ),
+                    models.Index(fields=["-weekly"], name="blog_ranking_weekly_idx"),
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="PostActivity",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField()),
+                ("score", models.FloatField(default=0)),
+                (
+                    "post",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="activity",
+                        to="blog.post",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "Post activity",
+                "indexes": [models.Index(fields=["day"], name="blog_activity_day_idx")],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("post", "day"), name="unique_post_activity_day"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Databases without partial indexes (MySQL, MariaDB) skip the conditional
+# indexes and unique constraints on Post, Comment and Like (models.W036/W037),
+# leaving listings, comment threads and like lookups unindexed and likes
+# without their uniqueness guarantee. There, add plain composite ones that put
+# the boolean first instead; MySQL compares booleans with `= 1`, so they're
+# searchable. Unique indexes allow several NULLs, so (user, post) only
+# constrains post likes and (user, comment) comment likes, as the conditions do.
+
+from django.db import migrations, models
+
+INDEXES = {
+    "post": [
+        models.Index(fields=["is_featured", "-pub_date", "-id"], name="blog_post_featured_date_idx"),
+    ],
+    "comment": [
+        models.Index(fields=["post", "is_approved", "created_date", "id"], name="blog_comment_approved_idx"),
+        models.Index(
+            fields=["post", "is_approved", "parent", "created_date", "id"], name="blog_comment_approved_top_idx"
+        ),
+    ],
+}
+
+CONSTRAINTS = {
+    "like": [
+        models.UniqueConstraint(fields=["user", "post"], name="unique_user_post_like_all"),
+        models.UniqueConstraint(fields=["user", "comment"], name="unique_user_comment_like_all"),
+    ],
+}
+
+
+def needs_plain_indexes(schema_editor):
+    return not schema_editor.connection.features.supports_partial_indexes
+
+
+def add_plain_indexes(apps, schema_editor):
+    if not needs_plain_indexes(schema_editor):
+        return
+    for model_name, indexes in INDEXES.items():
+        for index in indexes:
+            schema_editor.add_index(apps.get_model("blog", model_name), index)
+    for model_name, constraints in CONSTRAINTS.items():
+        for constraint in constraints:
+            schema_editor.add_constraint(apps.get_model("blog", model_name), constraint)
+
+
+def remove_plain_indexes(apps, schema_editor):
+    if not needs_plain_indexes(schema_editor):
+        return
+    for model_name, constraints in CONSTRAINTS.items():
+        for constraint in constraints:
+            schema_editor.remove_constraint(apps.get_model("blog", model_name), constraint)
+    for model_name, indexes in INDEXES.items():
+        for index in indexes:
+            schema_editor.remove_index(apps.get_model("blog", model_name), index)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("blog", "0018_query_indexes"),
+    ]
+
+    operations = [
+        migrations.RunPython(add_plain_indexes, remove_plain_indexes),
+    ]
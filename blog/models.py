@@ -1,10 +1,21 @@
 # blog/models.py
 
-from django.db import models
+import math
+
+from django.db import models, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
 from django.utils import timezone
+from django.utils.html import strip_tags
+from django.utils.text import Truncator
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
-from django.dispatch import receiver
+from django.db.models.signals import m2m_changed, post_save, post_delete, pre_delete
+from django.dispatch import receiver, Signal
+
+# Sent by CommentQuerySet.set_approved(), whose bulk update() bypasses post_save.
+# Receivers get `post_ids`: the posts whose approved comments changed, `approved`:
+# the new state, and `counts`: {post_id: number of comments changed}.
+comment_approval_changed = Signal()
 
 class Category(models.Model):
     name = models.CharField(max_length=100, unique=True)
@@ -15,65 +26,256 @@ class Category(models.Model):
     def __str__(self):
         return self.name
 
+
+WORDS_PER_MINUTE = 200
+EXCERPT_LENGTH = 300
+
+
+def text_stats(content):
+    """
+    (word_count, reading_time, excerpt) for a post body. Reading time is in
+    minutes at WORDS_PER_MINUTE, at least 1; the excerpt is the start of the
+    body as plain text, on one line.
+    """
+    words = strip_tags(content or '').split()
+    word_count = len(words)
+    reading_time = max(1, round(word_count / WORDS_PER_MINUTE))
+    excerpt = Truncator(' '.join(words)).chars(EXCERPT_LENGTH)
+    return word_count, reading_time, excerpt
+
+
+def rendition_url(fieldfile, renditions, size, ext='jpeg'):
+    """
+    URL of a resized copy of `fieldfile` (see blog/images.py), or of the
+    original file when that rendition doesn't exist.
+    """
+    if not fieldfile:
+        return None
+    name = (renditions or {}).get('sizes', {}).get(size, {}).get(ext)
+    if name:
+        return fieldfile.storage.url(name)
+    return fieldfile.url
+
+
+class TagQuerySet(models.QuerySet):
+    def top(self, limit=20):
+        """The most used tags, served by blog_tag_popularity_idx."""
+        return self.filter(post_count__gt=0).order_by('-post_count', 'name')[:limit]
+
+    def cloud(self, limit=20, buckets=10):
+        """
+        The top tags, each with a `cloud_size` from 1 to `buckets`. Sizes are
+        spread on a log scale so one very popular tag doesn't flatten the rest.
+        """
+        tags = list(self.top(limit))
+        if not tags:
+            return tags
+        low = math.log(min(tag.post_count for tag in tags))
+        high = math.log(max(tag.post_count for tag in tags))
+        for tag in tags:
+            if high == low:
+                tag.cloud_size = (buckets + 1) // 2
+            else:
+                weight = (math.log(tag.post_count) - low) / (high - low)
+                tag.cloud_size = 1 + round(weight * (buckets - 1))
+        return tags
+
+
 class Tag(models.Model):
     name = models.CharField(max_length=50, unique=True)
     slug = models.SlugField(max_length=50, unique=True)
+    # Maintained by the Post.tags signal handlers below
+    post_count = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = TagQuerySet.as_manager()
 
     def __str__(self):
         return self.name
 
     class Meta:
         ordering = ['name']
+        indexes = [
+            models.Index(fields=['-post_count', 'name'], name='blog_tag_popularity_idx'),
+        ]
+
+
+class PostQuerySet(models.QuerySet):
+    def for_listing(self):
+        """
+        Everything a post card shows, in a fixed number of queries. The body is
+        deferred; cards show the stored excerpt.
+        """
+        return self.select_related('author', 'category').prefetch_related('tags').defer('content')
+
+    def trending(self):
+        """Posts by time-decayed engagement, hottest first (see blog/rankings.py)."""
+        return self.filter(ranking__isnull=False).order_by('-ranking__trending')
+
+    def popular_this_week(self):
+        """Posts by engagement over the last seven days, most first."""
+        return self.filter(ranking__weekly__gt=0).order_by('-ranking__weekly')
 
 
 class Post(models.Model):
     title = models.CharField(max_length=200)
     content = models.TextField()
     pub_date = models.DateTimeField(default=timezone.now)
+    # Last edit, for conditional GET (see blog/conditional.py)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True)
     image = models.ImageField(upload_to='blog_images/', blank=True, null=True)
-    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='blog_posts', null=True)
+    # Indexed by blog_post_author_idx below
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='blog_posts', null=True, db_index=False)
     tags = models.ManyToManyField(Tag, blank=True, related_name='posts')
     view_count = models.PositiveIntegerField(default=0)
+    # Estimated from the post's ViewerSketch by blog/viewers.py
+    unique_viewers = models.PositiveIntegerField(default=0, editable=False)
     is_featured = models.BooleanField(default=False, help_text="Check to display this post in the featured section")
+    # Denormalized counters, kept in sync by the Like/Comment signals below.
+    # Run `manage.py reconcile_counters` to repair any drift.
+    like_count = models.PositiveIntegerField(default=0, editable=False)
+    approved_comment_count = models.PositiveIntegerField(default=0, editable=False)
+    # Resized WebP/JPEG copies of `image`, maintained by blog/images.py
+    image_renditions = models.JSONField(default=dict, blank=True, editable=False)
+    # Derived from `content` on save, so listings can defer('content')
+    word_count = models.PositiveIntegerField(default=0, editable=False)
+    reading_time = models.PositiveSmallIntegerField(default=1, editable=False)
+    excerpt = models.TextField(blank=True, editable=False)
+
+    objects = PostQuerySet.as_manager()
 
     class Meta:
         ordering = ['-pub_date']
+        # Listings are keyset paginated on (pub_date, id), newest first (blog/pagination.py).
+        # Conditions on booleans are partial indexes: SQLite can't search an
+        # index on `WHERE is_featured`, but can pick an index with that condition.
+        # Databases without partial indexes get plain ones (migration 0019).
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'], name='blog_post_date_idx'),
+            models.Index(
+                fields=['-pub_date', '-id'], condition=models.Q(is_featured=True), name='blog_post_featured_idx',
+            ),
+            models.Index(
+                fields=['-pub_date', '-id'], condition=models.Q(is_featured=False), name='blog_post_regular_idx',
+            ),
+            models.Index(fields=['author', '-pub_date', '-id'], name='blog_post_author_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        content_changing = update_fields is None or 'content' in update_fields
+        if content_changing and 'content' not in self.get_deferred_fields():
+            self.word_count, self.reading_time, self.excerpt = text_stats(self.content)
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'word_count', 'reading_time', 'excerpt', 'updated_at'}
+        super().save(*args, **kwargs)
+
     # Optional: Add a method to get the image URL easily in templates
     @property
     def image_url(self):
-        if self.image and hasattr(self.image, 'url'):
-            return self.image.url
-        return None # Or a default image URL
+        """URL of the largest resized JPEG, falling back to the original upload."""
+        return rendition_url(self.image, self.image_renditions, 'hero')
 
     def get_reading_time(self):
         """
-        Calculate the reading time based on word count.
+        Reading time in minutes (at least 1), stored on save.
         Average reading speed: 200 words per minute.
         """
-        word_count = len(self.content.split())
-        reading_time_min = round(word_count / 200)
-
-        # Ensure the reading time is at least 1 minute
-        if reading_time_min < 1:
-            reading_time_min = 1
-
-        return reading_time_min
+        return self.reading_time
 
     def get_likes_count(self):
-        return self.likes.count()
+        return self.like_count
 
     def is_liked_by(self, user):
         return self.likes.filter(user=user).exists()
 
     def increment_view_count(self):
-        """Increment the view count for this post"""
+        """
+        Record a view of this post. Depending on VIEW_COUNT_MODE the database
+        is updated right away or in a later batch (see blog/viewcounts.py).
+        """
+        from .viewcounts import record_view
+
+        record_view(self.pk)
         self.view_count += 1
-        self.save(update_fields=['view_count'])
+
+
+class ViewerSketch(models.Model):
+    """
+    HyperLogLog registers of a post's distinct viewers, kept apart from Post
+    so listings don't load them. Maintained by blog/viewers.py.
+    """
+    post = models.OneToOneField(Post, on_delete=models.CASCADE, primary_key=True, related_name='viewer_sketch')
+    registers = models.BinaryField(default=bytes)
+
+    def __str__(self):
+        return f"Viewers of {self.post_id}"
+
+
+class PostRanking(models.Model):
+    """
+    Trending and weekly scores of a post, one row per post with any activity,
+    so either ranking is a single indexed query. Maintained by blog/rankings.py.
+    """
+    post = models.OneToOneField(Post, on_delete=models.CASCADE, primary_key=True, related_name='ranking')
+    # log of the forward-decayed engagement sum
+    trending = models.FloatField()
+    # weighted engagement over the last seven days
+    weekly = models.FloatField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-trending'], name='blog_ranking_trending_idx'),
+            models.Index(fields=['-weekly'], name='blog_ranking_weekly_idx'),
+        ]
+
+    def __str__(self):
+        return f"Ranking of {self.post_id}"
+
+
+class PostActivity(models.Model):
+    """Weighted engagement of a post per day, for the weekly ranking."""
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='activity')
+    day = models.DateField()
+    score = models.FloatField(default=0)
+
+    class Meta:
+        verbose_name_plural = "Post activity"
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'day'], name='unique_post_activity_day'),
+        ]
+        indexes = [
+            models.Index(fields=['day'], name='blog_activity_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"Activity of {self.post_id} on {self.day}"
+
+
+class RelatedPost(models.Model):
+    """
+    Precomputed "related posts" of a post, ranked by weighted tag overlap and
+    recency. Maintained by blog/related.py.
+    """
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='related_entries')
+    related = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        ordering = ['post', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'related'], name='unique_related_post'),
+        ]
+        indexes = [
+            models.Index(fields=['post', 'rank'], name='blog_related_post_rank_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.related_id} is related to {self.post_id} (#{self.rank})"
 
 
 class UserProfile(models.Model):
@@ -81,15 +283,15 @@ class UserProfile(models.Model):
     bio = models.TextField(max_length=500, blank=True)
     profile_pic = models.ImageField(upload_to='profile_pics/', blank=True, null=True)
     website = models.URLField(blank=True, null=True)
+    # Resized WebP/JPEG copies of `profile_pic`, maintained by blog/images.py
+    profile_pic_renditions = models.JSONField(default=dict, blank=True, editable=False)
 
     def __str__(self):
         return f"{self.user.username}'s profile"
 
     @property
     def profile_pic_url(self):
-        if self.profile_pic and hasattr(self.profile_pic, 'url'):
-            return self.profile_pic.url
-        return None
+        return rendition_url(self.profile_pic, self.profile_pic_renditions, 'card')
 
 
 # Signal to create or update UserProfile when User is created/updated
@@ -101,22 +303,136 @@ def create_or_update_user_profile(sender, instance, created, **kwargs):
         instance.profile.save()
 
 
+def adjust_counter(model, pk, field, delta):
+    """
+    Atomically add `delta` to a denormalized counter column.
+    Decrements never take the counter below zero.
+    """
+    if not delta:
+        return
+    queryset = model.objects.filter(pk=pk)
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(**{field: F(field) + delta})
+
+
+def refresh_tag_counts(tag_ids):
+    """Recount Tag.post_count for `tag_ids` from the Post.tags join table."""
+    tag_ids = set(tag_ids or ())
+    if not tag_ids:
+        return
+    counts = (
+        Post.tags.through.objects.filter(tag=OuterRef('pk'))
+        .order_by()
+        .values('tag')
+        .annotate(n=Count('pk'))
+        .values('n')
+    )
+    Tag.objects.filter(pk__in=tag_ids).update(post_count=Coalesce(Subquery(counts), Value(0)))
+
+
+class CommentQuerySet(models.QuerySet):
+    def set_approved(self, approved):
+        """
+        Bulk approve/disapprove comments, keeping Post.approved_comment_count in sync.
+        Returns the number of comments whose state changed.
+        """
+        with transaction.atomic():
+            changing = self.filter(is_approved=not approved)
+            per_post = changing.order_by().values('post').annotate(n=Count('id'))
+            delta_sign = 1 if approved else -1
+            counts = {}
+            for row in per_post:
+                adjust_counter(Post, row['post'], 'approved_comment_count', delta_sign * row['n'])
+                counts[row['post']] = row['n']
+            post_ids = list(counts)
+            updated = changing.update(is_approved=approved, updated_at=timezone.now())
+        if post_ids:
+            comment_approval_changed.send(sender=Comment, post_ids=post_ids, approved=approved, counts=counts)
+        return updated
+
+    def thread_for(self, post, user=None):
+        """
+        Load the whole approved comment thread of `post` in at most two queries
+        (comments with authors, plus the user's comment likes).
+        Returns the top-level comments; every comment gets `approved_replies`
+        and `liked_by_user` attributes.
+        """
+        comments = list(
+            self.filter(post=post, is_approved=True)
+            .select_related('author')
+            .order_by('created_date', 'id')
+        )
+
+        liked_ids = set()
+        if comments and user is not None and user.is_authenticated:
+            liked_ids = set(
+                Like.objects.filter(user=user, comment__post=post).values_list('comment_id', flat=True)
+            )
+
+        by_id = {comment.pk: comment for comment in comments}
+        top_level = []
+        for comment in comments:
+            comment.liked_by_user = comment.pk in liked_ids
+            comment.approved_replies = []
+        for comment in comments:
+            if comment.parent_id is None:
+                top_level.append(comment)
+            elif comment.parent_id in by_id:
+                by_id[comment.parent_id].approved_replies.append(comment)
+        return top_level
+
+
 class Comment(models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='comments')
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='comments')
     content = models.TextField()
     created_date = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True)
     parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='replies')
     is_approved = models.BooleanField(default=False)  # Set to False if you want moderation
+    like_count = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = CommentQuerySet.as_manager()
 
     class Meta:
         ordering = ['created_date']
+        # Partial indexes; plain ones where unsupported (migration 0019)
+        indexes = [
+            # A post's approved thread, in order (CommentQuerySet.thread_for)
+            models.Index(
+                fields=['post', 'created_date', 'id'],
+                condition=models.Q(is_approved=True),
+                name='blog_comment_thread_idx',
+            ),
+            # Its approved top-level comments, in order (the comments API)
+            models.Index(
+                fields=['post', 'created_date', 'id'],
+                condition=models.Q(parent__isnull=True, is_approved=True),
+                name='blog_comment_top_level_idx',
+            ),
+        ]
 
     def __str__(self):
         return f'Comment by {self.author.username} on {self.post.title}'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored approval state so save() can adjust the post's counter
+        instance._stored_is_approved = dict(zip(field_names, values)).get('is_approved')
+        return instance
+
+    def save(self, *args, **kwargs):
+        was_approved = bool(getattr(self, '_stored_is_approved', False))
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            delta = int(self.is_approved) - int(was_approved)
+            adjust_counter(Post, self.post_id, 'approved_comment_count', delta)
+        self._stored_is_approved = self.is_approved
+
     def get_likes_count(self):
-        return self.likes.count()
+        return self.like_count
 
     def is_liked_by(self, user):
         return self.likes.filter(user=user).exists()
@@ -150,3 +466,57 @@ class Like(models.Model):
         return f"{self.user.username} likes {target}"
 
 
+
+
+# Keep the denormalized like/comment counters in sync on every create and delete,
+# including cascades (e.g. deleting a user removes their likes and comments).
+@receiver(post_save, sender=Like)
+def increment_like_counters(sender, instance, created, **kwargs):
+    if not created:
+        return
+    if instance.post_id:
+        adjust_counter(Post, instance.post_id, 'like_count', 1)
+    if instance.comment_id:
+        adjust_counter(Comment, instance.comment_id, 'like_count', 1)
+
+
+@receiver(post_delete, sender=Like)
+def decrement_like_counters(sender, instance, **kwargs):
+    if instance.post_id:
+        adjust_counter(Post, instance.post_id, 'like_count', -1)
+    if instance.comment_id:
+        adjust_counter(Comment, instance.comment_id, 'like_count', -1)
+
+
+@receiver(post_delete, sender=Comment)
+def decrement_comment_counter(sender, instance, **kwargs):
+    if instance.is_approved:
+        adjust_counter(Post, instance.post_id, 'approved_comment_count', -1)
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def update_tag_counts(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        if not reverse:
+            instance._cleared_tag_ids = list(instance.tags.values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        # tag.posts.add/remove/clear only changes this tag's count
+        refresh_tag_counts([instance.pk])
+    elif action == 'post_clear':
+        refresh_tag_counts(getattr(instance, '_cleared_tag_ids', []))
+    else:
+        refresh_tag_counts(pk_set)
+
+
+@receiver(pre_delete, sender=Post)
+def remember_post_tags(sender, instance, **kwargs):
+    # The join rows are cascaded away without an m2m_changed signal
+    instance._deleted_tag_ids = list(instance.tags.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Post)
+def decrement_tag_counts(sender, instance, **kwargs):
+    refresh_tag_counts(getattr(instance, '_deleted_tag_ids', []))
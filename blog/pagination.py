@@ -0,0 +1,235 @@
+# blog/pagination.py
+
+"""
+Cursor (keyset) pagination for post listings.
+
+Pages are addressed by opaque `?cursor=` tokens holding the (pub_date, id) of
+the row at the edge of the current page, so every page is a single indexed
+range query: no OFFSET, and no COUNT(*) on every request. The total shown in
+"Page N of M" comes from a count that's cached for PAGINATION_COUNT_CACHE_TIMEOUT
+seconds.
+"""
+
+import base64
+import binascii
+import json
+import math
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+FIRST, NEXT, PREVIOUS, LAST = 'first', 'next', 'prev', 'last'
+
+
+def encode_cursor(data):
+    raw = json.dumps(data, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Decode a cursor token; anything malformed is treated as the first page."""
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, binascii.Error):
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def cursor_position(cursor):
+    """The (pub_date, id) a next/previous cursor points at, or None if it's malformed."""
+    pub_date, pk = cursor.get('p'), cursor.get('i')
+    if not isinstance(pub_date, str) or type(pk) is not int or not 0 < pk < 2 ** 63:
+        return None
+    try:
+        pub_date = parse_datetime(pub_date)
+    except ValueError:  # well formed but invalid, e.g. month 13
+        return None
+    return None if pub_date is None else (pub_date, pk)
+
+
+class CursorPage:
+    """A page of results with cursor tokens for its neighbours."""
+
+    def __init__(self, object_list, paginator, number, has_next, has_previous,
+                 next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.number = number
+        self._has_next = has_next
+        self._has_previous = has_previous
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return f'<CursorPage {self.number}>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def last_cursor(self):
+        return encode_cursor({'d': LAST})
+
+
+class CountCacheMixin:
+    """Total result count, cached under `count_key` instead of counted per request."""
+
+    count_key = None
+
+    def _count(self):
+        raise NotImplementedError
+
+    @property
+    def count(self):
+        if getattr(self, '_cached_count', None) is None:
+            timeout = getattr(settings, 'PAGINATION_COUNT_CACHE_TIMEOUT', 300)
+            if self.count_key and timeout:
+                cache_key = 'pagecount:' + md5(self.count_key.encode()).hexdigest()
+                self._cached_count = cache.get_or_set(cache_key, self._count, timeout)
+            else:
+                self._cached_count = self._count()
+        return self._cached_count
+
+    @property
+    def num_pages(self):
+        return max(1, math.ceil(self.count / self.per_page))
+
+
+class CursorPaginator(CountCacheMixin):
+    """
+    Keyset paginator over a queryset ordered newest first by (pub_date, id).
+    """
+
+    def __init__(self, queryset, per_page, count_key=None):
+        self.queryset = queryset.order_by()
+        self.per_page = per_page
+        self.count_key = count_key
+
+    def _count(self):
+        return self.queryset.count()
+
+    def make_cursor(self, post, direction, number):
+        return encode_cursor({
+            'd': direction,
+            'p': post.pub_date.isoformat(),
+            'i': post.pk,
+            'n': number,
+        })
+
+    def page(self, token=None):
+        cursor = decode_cursor(token) or {'d': FIRST}
+        direction = cursor.get('d')
+        position = cursor_position(cursor) if direction in (NEXT, PREVIOUS) else None
+        if position is None and direction in (NEXT, PREVIOUS):
+            direction = FIRST
+
+        # The page number is only for display; the keyset decides what's shown
+        number = cursor.get('n') if isinstance(cursor.get('n'), int) else 2
+
+        newest_first = self.queryset.order_by('-pub_date', '-id')
+        oldest_first = self.queryset.order_by('pub_date', 'id')
+        size = self.per_page
+
+        if direction == NEXT:
+            pub_date, pk = position
+            before = Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, id__lt=pk)
+            rows = list(newest_first.filter(before)[:size + 1])
+            has_next, has_previous = len(rows) > size, True
+            rows = rows[:size]
+            number = max(2, number)
+        elif direction == PREVIOUS:
+            pub_date, pk = position
+            after = Q(pub_date__gt=pub_date) | Q(pub_date=pub_date, id__gt=pk)
+            rows = list(oldest_first.filter(after)[:size + 1])
+            has_next, has_previous = True, len(rows) > size
+            rows = rows[:size][::-1]
+            number = max(1, number)
+        elif direction == LAST:
+            # Size the last page like offset paging would, so it lines up with
+            # the pages before it (as long as the cached count is current)
+            last_size = self.count - (self.num_pages - 1) * size
+            if not 0 < last_size <= size:
+                last_size = size
+            rows = list(oldest_first[:last_size + 1])
+            has_next, has_previous = False, len(rows) > last_size
+            rows = rows[:last_size][::-1]
+            number = self.num_pages
+        else:
+            rows = list(newest_first[:size + 1])
+            has_next, has_previous = len(rows) > size, False
+            rows = rows[:size]
+            number = 1
+
+        if not rows:
+            # Cursor ran past either end (e.g. posts were deleted): restart
+            if direction != FIRST:
+                return self.page(None)
+            return CursorPage([], self, 1, False, False)
+
+        if not has_previous:
+            number = 1
+
+        return CursorPage(
+            rows, self, number, has_next, has_previous,
+            next_cursor=self.make_cursor(rows[-1], NEXT, number + 1) if has_next else None,
+            previous_cursor=self.make_cursor(rows[0], PREVIOUS, number - 1) if has_previous else None,
+        )
+
+
+class OffsetCursorPaginator(CountCacheMixin):
+    """
+    Same page interface for result sets with no stable keyset order, such as
+    relevance-ranked search results; the cursor carries the offset instead.
+    """
+
+    def __init__(self, object_list, per_page, count_key=None):
+        self.object_list = object_list
+        self.per_page = per_page
+        self.count_key = count_key
+
+    def _count(self):
+        return self.object_list.count()
+
+    def page(self, token=None):
+        cursor = decode_cursor(token) or {}
+        if cursor.get('d') == LAST:
+            offset = (self.num_pages - 1) * self.per_page
+        else:
+            offset = cursor.get('o', 0)
+            if type(offset) is not int or not 0 <= offset < 2 ** 63:
+                offset = 0
+            offset -= offset % self.per_page
+
+        rows = list(self.object_list[offset:offset + self.per_page + 1])
+        if not rows and offset:
+            return self.page(None)
+
+        number = offset // self.per_page + 1
+        has_next = len(rows) > self.per_page
+        has_previous = offset > 0
+        return CursorPage(
+            rows[:self.per_page], self, number, has_next, has_previous,
+            next_cursor=encode_cursor({'o': offset + self.per_page}) if has_next else None,
+            previous_cursor=encode_cursor({'o': offset - self.per_page}) if has_previous else None,
+        )
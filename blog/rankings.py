@@ -0,0 +1,182 @@
+# blog/rankings.py
+
+"""
+Trending and "most popular this week" rankings, kept in PostRanking.
+
+Views, likes and approved comments are engagement events, weighted by
+RANKING_WEIGHTS, and update a post's ranking as they happen:
+
+* trending uses forward decay: an event of weight w at time t adds
+  w * 2 ** ((t - EPOCH) / half-life) to the post's sum. Every sum decays at
+  the same rate, so the order never needs a decay pass, and the stored value
+  is the sum's logarithm, which grows linearly and can't overflow. Adding an
+  event is a single UPDATE (a log-add-exp in SQL), safe under concurrency.
+* weekly is added to as events come in, and every event also lands in its
+  day's PostActivity bucket. `manage.py update_rankings` (run it daily, or
+  more often) recomputes weekly from the last seven days of buckets and drops
+  older ones.
+
+Unlikes and deleted comments don't lower the scores: they count engagement
+that happened.
+"""
+
+import math
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Exp, Greatest, Least, Ln
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Comment, Like, PostActivity, PostRanking, comment_approval_changed
+
+EPOCH = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+WEEK_DAYS = 7
+
+
+def weights():
+    return getattr(settings, 'RANKING_WEIGHTS', {'view': 1, 'like': 5, 'comment': 8})
+
+
+def log_weight(weight, when):
+    """log(weight * 2 ** ((when - EPOCH) / half-life))"""
+    half_life = getattr(settings, 'TRENDING_HALF_LIFE_HOURS', 24) * 3600
+    return math.log(weight) + (when - EPOCH).total_seconds() / half_life * math.log(2)
+
+
+def current_score(trending, now=None):
+    """A stored trending value as the engagement it's worth at `now`."""
+    return math.exp(trending - log_weight(1, now or timezone.now()))
+
+
+def _upsert(queryset, create, **changes):
+    """UPDATE the row, or create it if it doesn't exist yet."""
+    if queryset.update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            create()
+    except IntegrityError:
+        # Created concurrently
+        queryset.update(**changes)
+
+
+def record_activity(scores, when=None):
+    """
+    Add {post_id: weight} of engagement at `when` (default now) to the
+    rankings. The posts must exist.
+    """
+    when = when or timezone.now()
+    day = timezone.localdate(when)
+    for post_id, weight in scores.items():
+        if weight <= 0:
+            continue
+        x = log_weight(weight, when)
+        high, low = Greatest(F('trending'), Value(x)), Least(F('trending'), Value(x))
+        _upsert(
+            PostRanking.objects.filter(pk=post_id),
+            lambda: PostRanking.objects.create(post_id=post_id, trending=x, weekly=weight),
+            # log(e^trending + e^x), without overflowing
+            trending=high + Ln(1 + Exp(low - high)),
+            weekly=F('weekly') + weight,
+        )
+        _upsert(
+            PostActivity.objects.filter(post_id=post_id, day=day),
+            lambda: PostActivity.objects.create(post_id=post_id, day=day, score=weight),
+            score=F('score') + weight,
+        )
+
+
+def record_event(kind, post_ids):
+    """Record one `kind` event ('view', 'like' or 'comment') per entry of `post_ids`."""
+    weight = weights().get(kind, 0)
+    scores = defaultdict(float)
+    for post_id in post_ids:
+        scores[post_id] += weight
+    record_activity(scores)
+
+
+def update_weekly(today=None):
+    """
+    Recompute every weekly score from the last WEEK_DAYS days of activity and
+    delete older buckets. Returns the number of buckets deleted.
+    """
+    today = today or timezone.localdate()
+    first_day = today - timedelta(days=WEEK_DAYS - 1)
+    with transaction.atomic():
+        deleted, _ = PostActivity.objects.filter(day__lt=first_day).delete()
+        week = (
+            PostActivity.objects.filter(post=OuterRef('pk'), day__gte=first_day)
+            .order_by()
+            .values('post')
+            .annotate(total=Sum('score'))
+            .values('total')
+        )
+        PostRanking.objects.filter(weekly__gt=0).update(weekly=Coalesce(Subquery(week), Value(0.0)))
+    return deleted
+
+
+def rebuild_rankings(now=None):
+    """
+    Recompute all rankings from the timestamps of likes and approved comments.
+    Views aren't timestamped, so views before the rebuild are dropped.
+    Returns the number of posts ranked.
+    """
+    now = now or timezone.now()
+    events = [
+        ('like', Like.objects.filter(post__isnull=False).values_list('post_id', 'created_at')),
+        ('comment', Comment.objects.filter(is_approved=True).values_list('post_id', 'created_date')),
+    ]
+    first_day = timezone.localdate(now) - timedelta(days=WEEK_DAYS - 1)
+    trending, activity = {}, defaultdict(float)
+    for kind, rows in events:
+        weight = weights().get(kind, 0)
+        if weight <= 0:
+            continue
+        for post_id, when in rows.iterator():
+            x = log_weight(weight, when)
+            old = trending.get(post_id)
+            trending[post_id] = x if old is None else max(old, x) + math.log1p(math.exp(-abs(old - x)))
+            day = timezone.localdate(when)
+            if day >= first_day:
+                activity[post_id, day] += weight
+
+    weekly = defaultdict(float)
+    for (post_id, _), score in activity.items():
+        weekly[post_id] += score
+    with transaction.atomic():
+        PostRanking.objects.all().delete()
+        PostActivity.objects.all().delete()
+        PostRanking.objects.bulk_create([
+            PostRanking(post_id=post_id, trending=value, weekly=weekly.get(post_id, 0))
+            for post_id, value in trending.items()
+        ], batch_size=500)
+        PostActivity.objects.bulk_create([
+            PostActivity(post_id=post_id, day=day, score=score)
+            for (post_id, day), score in activity.items()
+        ], batch_size=500)
+    return len(trending)
+
+
+@receiver(post_save, sender=Like)
+def rank_like(sender, instance, created, raw=False, **kwargs):
+    if created and not raw and instance.post_id:
+        record_event('like', [instance.post_id])
+
+
+@receiver(post_save, sender=Comment)
+def rank_comment(sender, instance, raw=False, **kwargs):
+    # Comment.save() updates _stored_is_approved after post_save
+    if not raw and instance.is_approved and not getattr(instance, '_stored_is_approved', False):
+        record_event('comment', [instance.post_id])
+
+
+@receiver(comment_approval_changed)
+def rank_approved_comments(sender, post_ids, approved=True, counts=None, **kwargs):
+    if approved and counts:
+        weight = weights().get('comment', 0)
+        record_activity({post_id: weight * n for post_id, n in counts.items()})
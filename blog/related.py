@@ -0,0 +1,164 @@
+# blog/related.py
+
+"""
+Related-posts index.
+
+For every post we store its top RELATED_POSTS_INDEX_SIZE most similar posts in
+RelatedPost. Similarity is the sum of the weights of the tags two posts share,
+where rarer tags weigh more (inverse document frequency), scaled down gently
+for older posts. Lists are refreshed when a post's tags change, for the post
+itself and for the posts sharing those tags; `manage.py rebuild_related_posts`
+recomputes everything.
+"""
+
+import math
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import m2m_changed
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Post, RelatedPost
+
+PostTags = Post.tags.through
+
+
+def index_size():
+    return getattr(settings, 'RELATED_POSTS_INDEX_SIZE', 6)
+
+
+def recency_factor(pub_date, now):
+    """1.0 for a brand new post, approaching 0.5 as it ages past the half-life."""
+    half_life = getattr(settings, 'RELATED_POSTS_HALF_LIFE_DAYS', 180)
+    age_days = max(0.0, (now - pub_date).total_seconds() / 86400)
+    return 0.5 + 0.5 * 0.5 ** (age_days / half_life)
+
+
+def tag_weights(tag_counts, total_posts):
+    """Inverse document frequency weight for each tag id."""
+    return {
+        tag_id: math.log(1 + total_posts / count)
+        for tag_id, count in tag_counts.items() if count
+    }
+
+
+def rank_related(post_id, tags_by_post, posts_by_tag, weights, pub_dates, now):
+    """Return the top [(related_id, score)] for post_id, best first."""
+    overlap = defaultdict(float)
+    for tag_id in tags_by_post.get(post_id, ()):
+        weight = weights.get(tag_id, 0.0)
+        for other_id in posts_by_tag.get(tag_id, ()):
+            if other_id != post_id:
+                overlap[other_id] += weight
+
+    scored = [
+        (other_id, overlap[other_id] * recency_factor(pub_dates[other_id], now))
+        for other_id in overlap if other_id in pub_dates
+    ]
+    # Ties go to the newer post
+    scored.sort(key=lambda item: (-item[1], -pub_dates[item[0]].timestamp(), -item[0]))
+    return scored[:index_size()]
+
+
+def write_related(rankings):
+    """Replace the stored lists for the posts in `rankings` ({post_id: [(related_id, score)]})."""
+    with transaction.atomic():
+        RelatedPost.objects.filter(post_id__in=list(rankings)).delete()
+        RelatedPost.objects.bulk_create([
+            RelatedPost(post_id=post_id, related_id=related_id, score=score, rank=rank)
+            for post_id, ranked in rankings.items()
+            for rank, (related_id, score) in enumerate(ranked, start=1)
+        ], batch_size=500)
+
+
+def refresh_related(post_ids):
+    """Recompute the related lists of `post_ids` only."""
+    post_ids = set(post_ids)
+    if not post_ids:
+        return
+    now = timezone.now()
+
+    own_tags = PostTags.objects.filter(post_id__in=post_ids).values_list('post_id', 'tag_id')
+    tags_by_post = defaultdict(set)
+    for post_id, tag_id in own_tags:
+        tags_by_post[post_id].add(tag_id)
+    all_tag_ids = set().union(*tags_by_post.values()) if tags_by_post else set()
+
+    posts_by_tag = defaultdict(set)
+    for post_id, tag_id in PostTags.objects.filter(tag_id__in=all_tag_ids).values_list('post_id', 'tag_id'):
+        posts_by_tag[tag_id].add(post_id)
+
+    tag_counts = {tag_id: len(members) for tag_id, members in posts_by_tag.items()}
+    weights = tag_weights(tag_counts, Post.objects.count())
+    candidate_ids = set().union(*posts_by_tag.values()) if posts_by_tag else set()
+    pub_dates = dict(Post.objects.filter(pk__in=candidate_ids).values_list('pk', 'pub_date'))
+
+    write_related({
+        post_id: rank_related(post_id, tags_by_post, posts_by_tag, weights, pub_dates, now)
+        for post_id in post_ids
+    })
+
+
+def refresh_related_around(post_id, tag_ids):
+    """
+    Refresh `post_id` and the (most recent) posts sharing any of `tag_ids`,
+    whose lists may gain or lose `post_id`.
+    """
+    limit = getattr(settings, 'RELATED_POSTS_NEIGHBOUR_LIMIT', 100)
+    neighbours = (
+        Post.objects.filter(tags__in=tag_ids)
+        .exclude(pk=post_id)
+        .order_by('-pub_date')
+        .values_list('pk', flat=True)
+        .distinct()[:limit]
+    )
+    refresh_related({post_id, *neighbours})
+
+
+def rebuild_related(batch_size=500):
+    """Recompute every post's related list. Returns the number of posts processed."""
+    now = timezone.now()
+    tags_by_post = defaultdict(set)
+    posts_by_tag = defaultdict(set)
+    for post_id, tag_id in PostTags.objects.values_list('post_id', 'tag_id').iterator():
+        tags_by_post[post_id].add(tag_id)
+        posts_by_tag[tag_id].add(post_id)
+
+    pub_dates = dict(Post.objects.values_list('pk', 'pub_date'))
+    weights = tag_weights({tag_id: len(members) for tag_id, members in posts_by_tag.items()}, len(pub_dates))
+
+    with transaction.atomic():
+        RelatedPost.objects.all().delete()
+        batch = {}
+        for post_id in pub_dates:
+            batch[post_id] = rank_related(post_id, tags_by_post, posts_by_tag, weights, pub_dates, now)
+            if len(batch) >= batch_size:
+                write_related(batch)
+                batch = {}
+        write_related(batch)
+    return len(pub_dates)
+
+
+@receiver(m2m_changed, sender=PostTags)
+def refresh_related_on_tag_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        # Remember the old tags (or posts) so their neighbours can be refreshed
+        if reverse:
+            instance._related_cleared_ids = list(instance.posts.values_list('pk', flat=True))
+        else:
+            instance._related_cleared_ids = list(instance.tags.values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    changed_ids = pk_set if action != 'post_clear' else getattr(instance, '_related_cleared_ids', [])
+    if not reverse:
+        # post.tags.add/remove/clear: `changed_ids` are tag ids
+        tag_ids = set(changed_ids or ()) | set(instance.tags.values_list('pk', flat=True))
+        refresh_related_around(instance.pk, tag_ids)
+    else:
+        # tag.posts.add/remove/clear: `changed_ids` are post ids
+        members = set(instance.posts.values_list('pk', flat=True))
+        refresh_related(set(changed_ids or ()) | members)
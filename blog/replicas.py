@@ -0,0 +1,122 @@
+# blog/replicas.py
+
+"""
+Read replicas.
+
+ReplicaRouter sends every write to the primary ('default'). Reads go to a
+replica (one of DATABASE_REPLICAS, picked at random) only while
+ReplicaMiddleware is handling a GET or HEAD request for one of REPLICA_VIEWS;
+everything else, including management commands and reads made for a write
+(select_for_update, get_or_create), stays on the primary.
+
+Pages, fragments and ETags cached under a version (blog/cache.py) must not
+hold replica rows: other clients would be served them as current until the
+next change. So an anonymous page-cache miss, which stores the page for
+everyone, reads from the primary; a request that read from a replica stores
+no fragments, and its response loses its ETag. Cache hits and 304s read
+nothing at all.
+
+Replicas lag behind, so a client that just changed something must see it:
+a POST (or other unsafe request) that wrote pins the client to the primary
+for REPLICA_PIN_SECONDS with a cookie. The cookie only decides where that
+client's reads go, so it needs no signing.
+"""
+
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+PIN_COOKIE = 'pin_primary'
+SAFE_METHODS = ('GET', 'HEAD')
+
+# The request being handled, if its reads may go to a replica
+active_request = ContextVar('replica_request', default=None)
+
+
+def replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def reads_from_replica(request):
+    """Whether the reads of `request`, once resolved, may go to a replica."""
+    match = request.resolver_match
+    return (
+        match is not None
+        and match.url_name in getattr(settings, 'REPLICA_VIEWS', ())
+        and request.method in SAFE_METHODS
+        and PIN_COOKIE not in request.COOKIES
+        and not getattr(request, 'uses_primary', False)
+    )
+
+
+def use_primary():
+    """Send the rest of the current request's reads to the primary."""
+    request = active_request.get()
+    if request is not None:
+        request.uses_primary = True
+
+
+def has_read_replica(request):
+    """Whether `request` has read anything from a replica."""
+    return getattr(request, 'read_replica', False)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        request = active_request.get()
+        if request is not None and replicas() and reads_from_replica(request):
+            request.read_replica = True
+            return random.choice(replicas())
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        request = active_request.get()
+        if request is not None:
+            request.wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+
+class ReplicaMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = active_request.set(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            active_request.reset(token)
+        return self.process_response(request, response)
+
+    async def __acall__(self, request):
+        active_request.set(request)  # the context is this request's own
+        return self.process_response(request, await self.get_response(request))
+
+    def process_response(self, request, response):
+        if has_read_replica(request) and response.has_header('ETag'):
+            # The ETag names the current versions, which the replica's rows
+            # may not have caught up with yet
+            del response['ETag']
+        return self.pin(request, response)
+
+    def pin(self, request, response):
+        """Read from the primary for a while after a write other than a GET or HEAD."""
+        if replicas() and request.method not in SAFE_METHODS and getattr(request, 'wrote', False):
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=getattr(settings, 'REPLICA_PIN_SECONDS', 10),
+                httponly=True, samesite='Lax',
+            )
+        return response
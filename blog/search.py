@@ -0,0 +1,378 @@
+# blog/search.py
+
+"""
+Full-text search over posts.
+
+Each backend keeps its own index of (title, content, author, tags) per post,
+in a table created by migration 0010, and updated by the signal handlers at
+the bottom of this module. The backend is
+picked from the database vendor, or set explicitly with the SEARCH_BACKEND
+setting (a dotted path to a SearchBackend subclass).
+"""
+
+import re
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection, connections, router
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils.html import escape
+from django.utils.module_loading import import_string
+from django.utils.safestring import mark_safe
+
+from .models import Post, Tag
+
+# Control characters that can't appear in posts; swapped for <mark> after escaping
+MARK_START = '\x02'
+MARK_END = '\x03'
+
+TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def split_terms(query):
+    """Break a user query into plain word terms, dropping any search syntax."""
+    return TERM_RE.findall(query.lower())[:20]
+
+
+def render_snippet(text):
+    """Escape a snippet and turn the match markers into <mark> tags."""
+    html = escape(text).replace(MARK_START, '<mark>').replace(MARK_END, '</mark>')
+    return mark_safe(html)
+
+
+def make_snippet(text, terms, width=200):
+    """
+    Python-side snippet for backends without a native highlighter: a window of
+    `text` around the first matching term, with every term occurrence marked.
+    """
+    if not terms:
+        return render_snippet(text[:width])
+    pattern = re.compile(r'\b(' + '|'.join(re.escape(t) for t in terms) + r')\w*', re.IGNORECASE)
+    match = pattern.search(text)
+    start = max(0, match.start() - width // 4) if match else 0
+    window = text[start:start + width]
+    marked = pattern.sub(lambda m: f'{MARK_START}{m.group(0)}{MARK_END}', window)
+    prefix = '…' if start else ''
+    suffix = '…' if start + width < len(text) else ''
+    return render_snippet(prefix + marked + suffix)
+
+
+def document_for(post):
+    """The text fields indexed for a post."""
+    return (
+        post.pk,
+        post.title,
+        post.content,
+        post.author.username if post.author_id else '',
+        ' '.join(post.tags.values_list('name', flat=True)),
+    )
+
+
+class SearchResults:
+    """
+    Lazy, Paginator-compatible result set: count() runs one COUNT query and
+    slicing fetches only that page of hits plus their Post rows.
+    """
+
+    def __init__(self, backend, query):
+        self.backend = backend
+        self.query = query
+        self._count = None
+
+    def count(self):
+        if self._count is None:
+            self._count = self.backend.count(self.query)
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        offset = index.start or 0
+        limit = (index.stop - offset) if index.stop is not None else self.count() - offset
+        hits = self.backend.search(self.query, limit=limit, offset=offset)
+        posts = Post.objects.for_listing().in_bulk([post_id for post_id, _, _ in hits])
+        results = []
+        for post_id, rank, snippet in hits:
+            post = posts.get(post_id)
+            if post is None:
+                continue  # stale index row; fixed by the next rebuild
+            post.search_rank = rank
+            post.search_snippet = snippet
+            results.append(post)
+        return results
+
+
+class SearchBackend:
+    """Base class for search backends."""
+
+    def index_documents(self, documents):
+        """Add or replace (post_id, title, content, author, tags) tuples."""
+
+    def remove(self, post_ids):
+        pass
+
+    def clear(self):
+        pass
+
+    def search(self, query, limit, offset=0):
+        """Return [(post_id, rank, snippet)] ordered by relevance."""
+        raise NotImplementedError
+
+    def count(self, query):
+        raise NotImplementedError
+
+    def results(self, query):
+        return SearchResults(self, query)
+
+    def read_connection(self):
+        """Where searches run: a replica on replica-routed pages (blog/replicas.py)."""
+        return connections[router.db_for_read(Post)]
+
+
+class SQLiteFTS5Backend(SearchBackend):
+    """SQLite FTS5 virtual table, ranked with bm25()."""
+
+    table = 'blog_post_fts'
+    # bm25 column weights for title, content, author, tags
+    weights = (10.0, 1.0, 3.0, 5.0)
+
+    def match_expression(self, query):
+        # Quote every term so user input can't produce FTS5 syntax errors;
+        # the trailing * keeps the old "partial word" matching behaviour.
+        return ' '.join(f'"{term}"*' for term in split_terms(query))
+
+    def index_documents(self, documents):
+        documents = list(documents)
+        if not documents:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {self.table} WHERE rowid = %s", [(doc[0],) for doc in documents])
+            cursor.executemany(
+                f"INSERT INTO {self.table} (rowid, title, content, author, tags) VALUES (%s, %s, %s, %s, %s)",
+                documents,
+            )
+
+    def remove(self, post_ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {self.table} WHERE rowid = %s", [(pk,) for pk in post_ids])
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table}")
+
+    def search(self, query, limit, offset=0):
+        match = self.match_expression(query)
+        if not match:
+            return []
+        weights = ', '.join(str(w) for w in self.weights)
+        with self.read_connection().cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid, bm25({self.table}, {weights}) AS rank, "
+                f"snippet({self.table}, 1, %s, %s, '…', 32) "
+                f"FROM {self.table} WHERE {self.table} MATCH %s "
+                f"ORDER BY rank LIMIT %s OFFSET %s",
+                [MARK_START, MARK_END, match, limit, offset],
+            )
+            return [(pk, rank, render_snippet(snippet)) for pk, rank, snippet in cursor.fetchall()]
+
+    def count(self, query):
+        match = self.match_expression(query)
+        if not match:
+            return 0
+        with self.read_connection().cursor() as cursor:
+            cursor.execute(f"SELECT count(*) FROM {self.table} WHERE {self.table} MATCH %s", [match])
+            return cursor.fetchone()[0]
+
+
+class MySQLFulltextBackend(SearchBackend):
+    """InnoDB shadow table with a FULLTEXT index, ranked by MATCH ... AGAINST."""
+
+    table = 'blog_post_search'
+    columns = 'title, content, author, tags'
+
+    def boolean_query(self, query):
+        return ' '.join(f'+{term}*' for term in split_terms(query))
+
+    def index_documents(self, documents):
+        documents = list(documents)
+        if not documents:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"REPLACE INTO {self.table} (post_id, {self.columns}) VALUES (%s, %s, %s, %s, %s)",
+                documents,
+            )
+
+    def remove(self, post_ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {self.table} WHERE post_id = %s", [(pk,) for pk in post_ids])
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table}")
+
+    def search(self, query, limit, offset=0):
+        boolean = self.boolean_query(query)
+        if not boolean:
+            return []
+        with self.read_connection().cursor() as cursor:
+            cursor.execute(
+                f"SELECT post_id, MATCH({self.columns}) AGAINST (%s IN BOOLEAN MODE) AS score, content "
+                f"FROM {self.table} WHERE MATCH({self.columns}) AGAINST (%s IN BOOLEAN MODE) "
+                f"ORDER BY score DESC LIMIT %s OFFSET %s",
+                [boolean, boolean, limit, offset],
+            )
+            terms = split_terms(query)
+            return [(pk, score, make_snippet(content, terms)) for pk, score, content in cursor.fetchall()]
+
+    def count(self, query):
+        boolean = self.boolean_query(query)
+        if not boolean:
+            return 0
+        with self.read_connection().cursor() as cursor:
+            cursor.execute(
+                f"SELECT count(*) FROM {self.table} WHERE MATCH({self.columns}) AGAINST (%s IN BOOLEAN MODE)",
+                [boolean],
+            )
+            return cursor.fetchone()[0]
+
+
+class DatabaseLikeBackend(SearchBackend):
+    """Fallback for databases without a native index: LIKE scans, newest first."""
+
+    def queryset(self, query):
+        from django.db.models import Q
+
+        terms = split_terms(query)
+        if not terms:
+            return Post.objects.none()
+        condition = Q()
+        for term in terms:
+            condition &= (
+                Q(title__icontains=term) |
+                Q(content__icontains=term) |
+                Q(author__username__icontains=term) |
+                Q(tags__name__icontains=term)
+            )
+        return Post.objects.filter(condition).distinct().order_by('-pub_date')
+
+    def search(self, query, limit, offset=0):
+        terms = split_terms(query)
+        rows = self.queryset(query).values_list('id', 'content')[offset:offset + limit]
+        return [(pk, None, make_snippet(content, terms)) for pk, content in rows]
+
+    def count(self, query):
+        return self.queryset(query).count()
+
+
+VENDOR_BACKENDS = {
+    'sqlite': SQLiteFTS5Backend,
+    'mysql': MySQLFulltextBackend,
+}
+
+
+def get_backend_class(vendor=None):
+    path = getattr(settings, 'SEARCH_BACKEND', None)
+    if path:
+        return import_string(path)
+    return VENDOR_BACKENDS.get(vendor or connection.vendor, DatabaseLikeBackend)
+
+
+def get_backend():
+    return get_backend_class()()
+
+
+def search_posts(query):
+    """Ranked, paginatable search results for `query`."""
+    return get_backend().results(query)
+
+
+def index_posts(posts):
+    get_backend().index_documents(document_for(post) for post in posts)
+
+
+def rebuild_index(batch_size=500):
+    """Re-index every post from scratch. Returns the number of posts indexed."""
+    backend = get_backend()
+    backend.clear()
+    queryset = Post.objects.select_related('author').prefetch_related('tags').order_by('pk')
+    total = 0
+    batch = []
+    for post in queryset.iterator(chunk_size=batch_size):
+        batch.append((
+            post.pk, post.title, post.content,
+            post.author.username if post.author_id else '',
+            ' '.join(tag.name for tag in post.tags.all()),
+        ))
+        if len(batch) >= batch_size:
+            backend.index_documents(batch)
+            total += len(batch)
+            batch = []
+    backend.index_documents(batch)
+    return total + len(batch)
+
+
+# Keep the index in sync with posts and their tags
+@receiver(post_save, sender=Post)
+def index_saved_post(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    # Counter-only updates (views, likes) don't change any indexed text
+    if update_fields and not {'title', 'content', 'author'} & set(update_fields):
+        return
+    index_posts([instance])
+
+
+@receiver(post_delete, sender=Post)
+def unindex_deleted_post(sender, instance, **kwargs):
+    get_backend().remove([instance.pk])
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def reindex_post_tags(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            index_posts([instance])
+        return
+
+    # Reverse side (tag.posts.add/remove/clear): instance is the Tag
+    if action == 'pre_clear':
+        # post_clear doesn't say which posts were affected, so remember them now
+        instance._search_cleared_post_ids = list(instance.posts.values_list('pk', flat=True))
+        return
+    if action == 'post_clear':
+        pk_set = getattr(instance, '_search_cleared_post_ids', [])
+    elif action not in ('post_add', 'post_remove'):
+        return
+    if pk_set:
+        index_posts(Post.objects.select_related('author').filter(pk__in=pk_set))
+
+
+@receiver(post_save, sender=Tag)
+def reindex_renamed_tag(sender, instance, created, raw=False, **kwargs):
+    if created or raw:
+        return
+    index_posts(instance.posts.select_related('author'))
+
+
+@receiver(post_save, sender=User)
+def reindex_renamed_author(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if created or raw or (update_fields and 'username' not in update_fields):
+        return
+    index_posts(instance.blog_posts.select_related('author'))
+
+
+@receiver(pre_delete, sender=Tag)
+def remember_deleted_tag_posts(sender, instance, **kwargs):
+    instance._search_post_ids = list(instance.posts.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Tag)
+def reindex_deleted_tag_posts(sender, instance, **kwargs):
+    post_ids = getattr(instance, '_search_post_ids', [])
+    if post_ids:
+        index_posts(Post.objects.select_related('author').filter(pk__in=post_ids))
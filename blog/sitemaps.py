@@ -0,0 +1,223 @@
+# blog/sitemaps.py
+
+"""
+Sitemaps for posts, tags and authors, split into a sitemap index and child
+sitemaps of at most SITEMAP_PAGE_SIZE URLs each (50,000 by default, the
+protocol's limit; at well under 200 bytes per URL a child also stays far
+below the 50 MB one).
+
+Child N of a section holds the objects with primary keys in
+[(N-1) * SITEMAP_PAGE_SIZE + 1, N * SITEMAP_PAGE_SIZE], so a child's
+contents only change when an object in its range does. Children are streamed
+to files under SITEMAP_ROOT straight from .values_list().iterator(), without
+loading model instances, and named after a version counter (blog/cache.py)
+that the signal handlers below bump for the ranges a change touches:
+
+    sitemap                  the index
+    sitemap:<section>:<N>    child N of posts, tags or authors
+"""
+
+import glob
+import os
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models import F, Max
+from django.db.models.functions import Floor
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.http import FileResponse, Http404
+from django.urls import reverse
+
+from .cache import bump, get_versions
+from .models import Post, Tag
+
+SECTIONS = ('posts', 'tags', 'authors')
+
+
+def page_size():
+    return getattr(settings, 'SITEMAP_PAGE_SIZE', 50000)
+
+
+def sitemap_root():
+    return getattr(settings, 'SITEMAP_ROOT', os.path.join(settings.BASE_DIR, 'cache', 'sitemaps'))
+
+
+def site_url():
+    """Where the site is served from, without a trailing slash."""
+    return settings.SITE_URL.rstrip('/')
+
+
+def page_of(pk):
+    return (pk - 1) // page_size() + 1
+
+
+# section: (model, URL name, field in the URL, field holding the last change)
+SECTION_SOURCES = {
+    'posts': (Post, 'post_detail', 'pk', 'updated_at'),
+    'tags': (Tag, 'tag_posts', 'slug', 'posts__updated_at'),
+    'authors': (User, 'author_profile', 'username', 'blog_posts__updated_at'),
+}
+
+
+def page_filter(page):
+    size = page_size()
+    return {'pk__gt': (page - 1) * size, 'pk__lte': page * size}
+
+
+def section_rows(section, page):
+    """
+    (url field, lastmod) for child `page` of `section`. Tags and authors
+    without posts are left out.
+    """
+    model, _, field, lastmod = SECTION_SOURCES[section]
+    rows = model.objects.filter(**page_filter(page)).order_by('pk')
+    if '__' not in lastmod:
+        return rows.values_list(field, lastmod)
+    return rows.values(field).annotate(lastmod=Max(lastmod)).filter(lastmod__isnull=False).values_list(field, 'lastmod')
+
+
+def section_urls(section, page):
+    """Stream (path, lastmod) for child `page` of `section`."""
+    url_name = SECTION_SOURCES[section][1]
+    for value, lastmod in section_rows(section, page).iterator():
+        yield reverse(url_name, args=[value]), lastmod
+
+
+def section_pages(section):
+    """[(page, lastmod)] of the non-empty children of `section`, in one grouped query."""
+    model, _, _, lastmod = SECTION_SOURCES[section]
+    pages = (
+        model.objects.annotate(page=Floor((F('pk') - 1) / page_size()) + 1)
+        .values('page')
+        .annotate(latest=Max(lastmod))
+        .filter(latest__isnull=False)
+        .order_by('page')
+        .values_list('page', 'latest')
+    )
+    return [(int(page), latest) for page, latest in pages]
+
+
+def write_urlset(f, base_url, urls):
+    f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+    f.write('<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n')
+    for path, lastmod in urls:
+        f.write(f'<url><loc>{escape(base_url + path)}</loc><lastmod>{lastmod.date().isoformat()}</lastmod></url>\n')
+    f.write('</urlset>\n')
+
+
+def write_index(f, base_url):
+    f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+    f.write('<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n')
+    for section in SECTIONS:
+        for page, lastmod in section_pages(section):
+            loc = base_url + reverse('sitemap_section', args=[section, page])
+            f.write(f'<sitemap><loc>{escape(loc)}</loc><lastmod>{lastmod.date().isoformat()}</lastmod></sitemap>\n')
+    f.write('</sitemapindex>\n')
+
+
+class SitemapFile:
+    """The file for sitemap `name` at the current version of `scope`."""
+
+    def __init__(self, name, scope):
+        self.name = name
+        self.base_url = site_url()
+        self.directory = sitemap_root()
+        self.version = get_versions(scope)[scope]
+        self.path = os.path.join(self.directory, f'{name}.{self.version}.xml')
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def write(self, writer, *args):
+        """Write the file with writer(f, base_url, *args) and remove older versions."""
+        os.makedirs(self.directory, exist_ok=True)
+        # Write to a temporary file and rename it into place, so a concurrent
+        # request never serves a partial sitemap
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            writer(f, self.base_url, *args)
+        os.replace(tmp_path, self.path)
+
+        # Only older ones: a request that read the version before a change may
+        # finish after the request writing the newer file
+        prefix = os.path.join(self.directory, f'{self.name}.')
+        for old in glob.glob(f'{glob.escape(prefix)}*.xml'):
+            version = old[len(prefix):-len('.xml')]
+            if version.isdigit() and int(version) < self.version:
+                try:
+                    os.remove(old)
+                except FileNotFoundError:
+                    pass
+
+    def response(self, writer, *args):
+        """Serve the file, writing it with writer(f, base_url, *args) first if it's missing."""
+        try:
+            f = open(self.path, 'rb')
+        except FileNotFoundError:
+            self.write(writer, *args)
+            f = open(self.path, 'rb')
+        return FileResponse(f, content_type='application/xml')
+
+
+def sitemap_index(request):
+    return SitemapFile('index', 'sitemap').response(write_index)
+
+
+def sitemap_section(request, section, page):
+    if section not in SECTIONS or page < 1:
+        raise Http404("No such sitemap.")
+    sitemap = SitemapFile(f'{section}-{page}', f'sitemap:{section}:{page}')
+    # Only write files for ranges that have URLs
+    if not sitemap.exists() and not section_rows(section, page).exists():
+        raise Http404("No such sitemap.")
+    return sitemap.response(write_urlset, section_urls(section, page))
+
+
+# Invalidation
+def tag_pages(tag_ids):
+    return {f'sitemap:tags:{page_of(pk)}' for pk in tag_ids}
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post_sitemaps(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    scopes = {'sitemap', f'sitemap:posts:{page_of(instance.pk)}'}
+    if instance.author_id:
+        scopes.add(f'sitemap:authors:{page_of(instance.author_id)}')
+    if kwargs.get('signal') is post_delete:
+        # Remembered by remember_post_tags in models.py
+        tag_ids = getattr(instance, '_deleted_tag_ids', [])
+    else:
+        tag_ids = Post.tags.through.objects.filter(post_id=instance.pk).values_list('tag_id', flat=True)
+    bump(*scopes, *tag_pages(tag_ids))
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def invalidate_tag_sitemaps(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        tag_ids = [instance.pk]
+    elif action == 'post_clear':
+        # Remembered by update_tag_counts in models.py
+        tag_ids = getattr(instance, '_cleared_tag_ids', [])
+    else:
+        tag_ids = pk_set or ()
+    bump('sitemap', *tag_pages(tag_ids))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_tag_sitemap(sender, instance, **kwargs):
+    bump('sitemap', f'sitemap:tags:{page_of(instance.pk)}')
+
+
+@receiver(post_save, sender=User)
+def invalidate_author_sitemap(sender, instance, created, update_fields=None, **kwargs):
+    if created or (update_fields and set(update_fields) <= {'last_login'}):
+        return
+    bump('sitemap', f'sitemap:authors:{page_of(instance.pk)}')
@@ -0,0 +1,48 @@
+# blog/storage.py
+
+"""
+Static files storage for production: WhiteNoise's manifest storage, which
+writes content-hashed copies (style.3f2a1c.css) plus gzip and, when the
+Brotli package is installed, brotli variants at collectstatic time, so
+WhiteNoise can serve them precompressed with far-future, immutable caching.
+
+With STATICFILES_MINIFY on, CSS and JS are minified first (with rcssmin and
+rjsmin, installed separately), so the hashes cover the minified files.
+"""
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from whitenoise.storage import CompressedManifestStaticFilesStorage
+
+
+def get_minifiers():
+    """{extension: minify(text) -> text}"""
+    try:
+        import rcssmin
+        import rjsmin
+    except ImportError:
+        raise ImproperlyConfigured("STATICFILES_MINIFY needs the rcssmin and rjsmin packages.")
+    return {'.css': rcssmin.cssmin, '.js': rjsmin.jsmin}
+
+
+class MinifyingCompressedManifestStorage(CompressedManifestStaticFilesStorage):
+    def post_process(self, paths, dry_run=False, **options):
+        if not dry_run and getattr(settings, 'STATICFILES_MINIFY', False):
+            self.minify(paths)
+            # Hash the minified copies rather than the source files
+            paths = {name: (self, name) for name in paths}
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+
+    def minify(self, paths):
+        """Minify the collected copies of the CSS and JS files in place."""
+        minifiers = get_minifiers()
+        for name in paths:
+            extension = name[name.rfind('.'):]
+            if extension not in minifiers or name.endswith(('.min.css', '.min.js')):
+                continue
+            with self.open(name) as f:
+                source = f.read().decode('utf-8')
+            minified = minifiers[extension](source)
+            self.delete(name)
+            self._save(name, ContentFile(minified.encode('utf-8')))
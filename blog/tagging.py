@@ -0,0 +1,86 @@
+# blog/tagging.py
+
+"""
+Batched tag handling for posts.
+
+resolve_tags() turns tag names into Tag rows with one SELECT for the ones that
+exist and one bulk INSERT for the rest; set_post_tags() then applies only the
+rows that actually changed. A bulk import should resolve the names of all its
+posts once and pass the result along:
+
+    resolved = resolve_tags(name for names in tag_names.values() for name in names)
+    for post, names in tag_names.items():
+        set_post_tags(post, names, resolved)
+"""
+
+from django.db.models import Q
+from django.utils.text import slugify
+
+from .models import Tag
+
+MAX_LENGTH = Tag._meta.get_field('slug').max_length
+
+
+def parse_tag_names(text):
+    """Split a comma separated string into tag names."""
+    return [name.strip() for name in (text or '').split(',') if name.strip()]
+
+
+def normalize(names):
+    """{slug: name} for `names`, keeping the first spelling of each slug."""
+    by_slug = {}
+    for name in names:
+        name = name.strip()[:MAX_LENGTH]
+        slug = slugify(name)[:MAX_LENGTH]
+        if slug and slug not in by_slug:
+            by_slug[slug] = name
+    return by_slug
+
+
+def fetch_tags(by_slug):
+    """Existing tags for {slug: name}, matched on slug or, failing that, name."""
+    found = Tag.objects.filter(Q(slug__in=list(by_slug)) | Q(name__in=list(by_slug.values())))
+    by_slug_found = {tag.slug: tag for tag in found}
+    by_name_found = {tag.name: tag for tag in by_slug_found.values()}
+    tags = {}
+    for slug, name in by_slug.items():
+        tag = by_slug_found.get(slug) or by_name_found.get(name)
+        if tag is not None:
+            tags[slug] = tag
+    return tags
+
+
+def resolve_tags(names):
+    """Return {slug: Tag} for `names`, creating the tags that don't exist yet."""
+    by_slug = normalize(names)
+    if not by_slug:
+        return {}
+    tags = fetch_tags(by_slug)
+
+    missing = {slug: name for slug, name in by_slug.items() if slug not in tags}
+    if missing:
+        # Another request may create the same tag concurrently; skip
+        # conflicting rows and read back whatever ended up in the table
+        Tag.objects.bulk_create(
+            [Tag(name=name, slug=slug) for slug, name in missing.items()],
+            ignore_conflicts=True,
+        )
+        tags.update(fetch_tags(missing))
+    return tags
+
+
+def set_post_tags(post, names, resolved=None):
+    """
+    Make `names` the tags of `post`, adding and removing only the rows that
+    changed. `resolved` is an optional {slug: Tag} from resolve_tags().
+    """
+    by_slug = normalize(names)
+    if resolved is None or not set(by_slug) <= set(resolved):
+        resolved = {**(resolved or {}), **resolve_tags(by_slug.values())}
+
+    wanted = {resolved[slug].pk for slug in by_slug if slug in resolved}
+    current = set(post.tags.values_list('pk', flat=True))
+    if current - wanted:
+        post.tags.remove(*(current - wanted))
+    if wanted - current:
+        post.tags.add(*(wanted - current))
@@ -0,0 +1,16 @@
+# blog/templatetags/blog_cache.py
+
+from django import template
+
+register = template.Library()
+
+
+@register.filter
+def post_version(cache_versions, post_id):
+    """
+    The version of a post's own scope (see blog/cache.py), for fragments
+    that show one post:
+
+        {% cache fragment_cache_timeout post_card post.pk cache_versions|post_version:post.pk %}
+    """
+    return cache_versions[f'post:{post_id}']
@@ -0,0 +1,62 @@
+# blog/templatetags/blog_images.py
+
+from django import template
+from django.utils.html import format_html, format_html_join
+
+register = template.Library()
+
+
+def srcset(fieldfile, renditions, ext):
+    seen = set()
+    entries = []
+    for rendition in sorted(renditions.get('sizes', {}).values(), key=lambda r: r['width']):
+        name = rendition.get(ext)
+        if name and name not in seen:
+            seen.add(name)
+            entries.append(f"{fieldfile.storage.url(name)} {rendition['width']}w")
+    return ', '.join(entries)
+
+
+@register.simple_tag
+def responsive_image(fieldfile, renditions, size='card', alt='', css_class='', sizes=None, eager=False):
+    """
+    Render a lazy-loaded <picture> for an image field and its renditions:
+
+        {% responsive_image post.image post.image_renditions 'card' alt=post.title css_class='post-image' %}
+
+    `size` picks the fallback <img src> and the default `sizes` hint. Falls back
+    to a plain <img> of the original when no renditions exist yet.
+    """
+    if not fieldfile:
+        return ''
+    loading = 'eager' if eager else 'lazy'
+    renditions = renditions or {}
+    chosen = renditions.get('sizes', {}).get(size)
+
+    if not chosen or not chosen.get('jpeg'):
+        return format_html(
+            '<img src="{}" alt="{}" class="{}" loading="{}" decoding="async">',
+            fieldfile.url, alt, css_class, loading,
+        )
+
+    if sizes is None:
+        sizes = f"(max-width: {chosen['width']}px) 100vw, {chosen['width']}px"
+
+    sources = []
+    webp_srcset = srcset(fieldfile, renditions, 'webp')
+    if webp_srcset:
+        sources.append((webp_srcset, sizes))
+
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" '
+        'alt="{}" class="{}" loading="{}" decoding="async"></picture>',
+        format_html_join('', '<source type="image/webp" srcset="{}" sizes="{}">', sources),
+        fieldfile.storage.url(chosen['jpeg']),
+        srcset(fieldfile, renditions, 'jpeg'),
+        sizes,
+        chosen['width'],
+        chosen['height'],
+        alt,
+        css_class,
+        loading,
+    )
@@ -1,3 +1,866 @@
-from django.test import TestCase
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from datetime import timedelta
+from importlib import import_module
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import OperationalError, connection, connections, transaction
+from django.templatetags.static import static
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .cache import get_versions
+from .likes import insert_likes
+from .management.commands.explain_queries import explain, problems
+from .middleware import QueryBudgetExceeded
+from .models import Category, Comment, Like, Post, PostActivity, PostRanking, Tag
+from .pagination import encode_cursor
+from .rankings import current_score, rebuild_rankings, update_weekly
+from .sitemaps import SitemapFile, write_index
+from .viewcounts import MemoryViewCounter, flush_view_counts, get_view_counter, record_view
+from .viewers import HyperLogLog
+from .writes import write_with_retry
+
+
+def discard_buffered_views():
+    """
+    Drop the views earlier tests left buffered: their posts were rolled back,
+    and a flush shouldn't land in the middle of a test, or in the real
+    database when the process exits.
+    """
+    counter = get_view_counter()
+    counter.take_pending()
+    counter.take_sketches()
+
+
+def tearDownModule():
+    discard_buffered_views()
+
+
+class CommentThreadQueryTests(TestCase):
+    """post_detail must load a comment thread in a constant number of queries."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='pw')
+        cls.reader = User.objects.create_user('reader', password='pw')
+
+    def setUp(self):
+        discard_buffered_views()
+
+    def make_thread(self, size):
+        post = Post.objects.create(title=f'Thread of {size}', content='Body', author=self.author)
+        for i in range(size):
+            comment = Comment.objects.create(post=post, author=self.author, content=f'c{i}', is_approved=True)
+            reply = Comment.objects.create(
+                post=post, author=self.reader, content=f'r{i}', parent=comment, is_approved=True
+            )
+            Like.objects.create(user=self.reader, comment=comment)
+            Like.objects.create(user=self.author, comment=reply)
+        return post
+
+    def count_detail_queries(self, post):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('post_detail', args=[post.id]))
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_query_count_is_flat_as_thread_grows(self):
+        self.client.login(username='reader', password='pw')
+        small = self.make_thread(2)
+        large = self.make_thread(20)
+        # Warm the session so both measured requests do the same session work
+        self.client.get(reverse('post_list'))
+        self.assertEqual(self.count_detail_queries(small), self.count_detail_queries(large))
+
+    def test_thread_contains_only_approved_comments(self):
+        post = self.make_thread(1)
+        hidden = Comment.objects.create(post=post, author=self.reader, content='pending')
+        Comment.objects.create(post=post, author=self.reader, content='hidden reply', parent=hidden, is_approved=True)
+
+        thread = Comment.objects.thread_for(post, self.reader)
+
+        self.assertEqual([c.content for c in thread], ['c0'])
+        self.assertEqual([r.content for r in thread[0].approved_replies], ['r0'])
+        self.assertTrue(thread[0].liked_by_user)
+        self.assertFalse(thread[0].approved_replies[0].liked_by_user)
+
+
+class QueryBudgetTests(TestCase):
+    """
+    Pins the number of queries each view in blog/urls.py may run, measured
+    by QueryBudgetMiddleware with empty caches. If a change legitimately
+    needs more queries, raise the budget here in the same commit.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='pw')
+        cls.reader = User.objects.create_user('reader', password='pw')
+        category = Category.objects.create(name='General')
+        tags = [Tag.objects.create(name=f'tag{i}', slug=f'tag{i}') for i in range(3)]
+        # More posts than fit on a page, each with everything a card shows
+        for i in range(8):
+            post = Post.objects.create(
+                title=f'Post {i}', content=f'Body {i} ' * 50, author=cls.author,
+                category=category, is_featured=i < 2,
+            )
+            post.tags.add(*tags)
+            Like.objects.create(user=cls.reader, post=post)
+            comment = Comment.objects.create(post=post, author=cls.reader, content='c', is_approved=True)
+            Comment.objects.create(post=post, author=cls.author, content='r', parent=comment, is_approved=True)
+        cls.post = post
+        cls.comment = comment
+        cls.tag = tags[0]
+
+    def setUp(self):
+        cache.clear()
+        discard_buffered_views()
+
+    def assertWithinBudget(self, url_name, budget, args=(), method='get', data=None, user=None, **extra):
+        if user is not None:
+            self.client.force_login(user)
+        url = reverse(url_name, args=args)
+        with override_settings(QUERY_BUDGETS={url_name: budget}, QUERY_BUDGET_RAISE=True):
+            try:
+                response = getattr(self.client, method)(url, data, **extra)
+            except QueryBudgetExceeded as e:
+                self.fail(str(e))
+        self.assertLess(response.status_code, 400)
+        return response
+
+    def test_post_list(self):
+        self.assertWithinBudget('post_list', 8)
+
+    # Includes counting the view (VIEW_COUNT_MODE = 'sync'): one UPDATE, as
+    # its ranking and unique-viewer sketch wait for the next flush
+    def test_post_detail(self):
+        self.assertWithinBudget('post_detail', 6, args=[self.post.id])
+
+    def test_post_detail_logged_in(self):
+        self.assertWithinBudget('post_detail', 10, args=[self.post.id], user=self.reader)
+
+    def test_tag_posts(self):
+        self.assertWithinBudget('tag_posts', 5, args=[self.tag.slug])
+
+    def test_author_profile(self):
+        self.assertWithinBudget('author_profile', 5, args=[self.author.username])
+
+    def test_search_posts(self):
+        self.assertWithinBudget('search_posts', 4, data={'query': 'body'})
+
+    def test_profile(self):
+        self.assertWithinBudget('profile', 6, user=self.author)
+
+    def test_register(self):
+        self.assertWithinBudget('register', 0)
+
+    def test_login(self):
+        self.assertWithinBudget('login', 0)
+
+    def test_logout(self):
+        self.assertWithinBudget('logout', 4, user=self.reader)
+
+    def test_create_post(self):
+        self.assertWithinBudget('create_post', 3, user=self.author)
+
+    def test_update_post(self):
+        self.assertWithinBudget('update_post', 7, args=[self.post.id], user=self.author)
+
+    def test_delete_post(self):
+        self.assertWithinBudget('delete_post', 4, args=[self.post.id], user=self.author)
+
+    def test_delete_comment(self):
+        self.assertWithinBudget('delete_comment', 5, args=[self.comment.id], user=self.reader)
+
+    def test_like_post(self):
+        self.assertWithinBudget('like_post', 7, args=[self.post.id], method='post', user=self.reader)
+
+    def test_like_comment(self):
+        self.assertWithinBudget('like_comment', 10, args=[self.comment.id], method='post', user=self.author)
+
+    def test_like_batch(self):
+        operations = [
+            {'type': 'post', 'id': self.post.id, 'liked': False},
+            {'type': 'comment', 'id': self.comment.id, 'liked': True},
+        ]
+        self.assertWithinBudget(
+            'like_batch', 15, method='post', data=json.dumps({'operations': operations}),
+            content_type='application/json', user=self.reader,
+        )
+
+    def test_api_post_list(self):
+        # A full page of 50 posts costs the same as the 8 here
+        self.assertWithinBudget('api-v1:post_list', 2, data={'page_size': 50})
+
+    def test_api_rankings(self):
+        self.assertWithinBudget('api-v1:post_trending', 2)
+        self.assertWithinBudget('api-v1:post_popular', 2)
+
+    def test_api_post_detail(self):
+        self.assertWithinBudget('api-v1:post_detail', 2, args=[self.post.id])
+
+    def test_api_post_comments(self):
+        self.assertWithinBudget('api-v1:post_comments', 3, args=[self.post.id])
+
+    def test_api_tags(self):
+        self.assertWithinBudget('api-v1:tag_list', 1)
+        self.assertWithinBudget('api-v1:tag_detail', 1, args=[self.tag.slug])
+
+    def test_api_authors(self):
+        self.assertWithinBudget('api-v1:author_list', 1)
+        self.assertWithinBudget('api-v1:author_detail', 1, args=[self.author.username])
+
+    def test_feeds(self):
+        self.assertWithinBudget('post_feed', 2)
+        self.assertWithinBudget('tag_atom_feed', 3, args=[self.tag.slug])
+        self.assertWithinBudget('author_feed', 3, args=[self.author.username])
+        # Polls are served from the cache
+        self.assertWithinBudget('post_feed', 0)
+
+    def test_sitemaps(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        page = (self.post.pk - 1) // settings.SITEMAP_PAGE_SIZE + 1
+        with override_settings(SITEMAP_ROOT=root.name):
+            # Cold: the files are written
+            self.assertWithinBudget('sitemap_index', 3)
+            self.assertWithinBudget('sitemap_section', 2, args=['posts', page])
+            # Warm: served from the files
+            self.assertWithinBudget('sitemap_index', 0)
+            self.assertWithinBudget('sitemap_section', 0, args=['posts', page])
+
+    def test_over_budget_raises_or_logs(self):
+        url = reverse('post_list')
+        with override_settings(QUERY_BUDGETS={'post_list': 1}, QUERY_BUDGET_RAISE=True):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get(url)
+        cache.clear()
+        with override_settings(QUERY_BUDGETS={'post_list': 1}, QUERY_BUDGET_RAISE=False):
+            with self.assertLogs('blog.querybudget', 'WARNING'):
+                response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(response.wsgi_request.query_stats.queries, 1)
+
+
+class PostFormTests(TestCase):
+    def test_create_and_update_save_tags(self):
+        author = User.objects.create_user('author', password='pw')
+        Tag.objects.create(name='Django', slug='django')
+        self.client.force_login(author)
+
+        self.client.post(reverse('create_post'), {'title': 'Post', 'content': 'Body', 'tags': 'django, Python'})
+        post = Post.objects.get(title='Post')
+        self.assertEqual(post.author, author)
+        self.assertEqual(sorted(post.tags.values_list('slug', flat=True)), ['django', 'python'])
+
+        self.client.post(reverse('update_post', args=[post.pk]), {'title': 'Post', 'content': 'Body', 'tags': 'python'})
+        self.assertEqual(list(post.tags.values_list('slug', flat=True)), ['python'])
+
+
+class ApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user('author', password='pw')
+        tag = Tag.objects.create(name='news', slug='news')
+        for i in range(3):
+            Post.objects.create(title=f'Post {i}', content='Body', author=author).tags.add(tag)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_sparse_fields(self):
+        response = self.client.get(reverse('api-v1:post_list'), {'fields': 'id,title'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.json()['results'][0]), {'id', 'title'})
+
+    def test_cursor_pagination(self):
+        response = self.client.get(reverse('api-v1:post_list'), {'page_size': 2})
+        first = response.json()
+        self.assertEqual([post['title'] for post in first['results']], ['Post 2', 'Post 1'])
+        second = self.client.get(first['next']).json()
+        self.assertEqual([post['title'] for post in second['results']], ['Post 0'])
+
+    def test_malformed_cursors_show_the_first_page(self):
+        tokens = [
+            {'d': 'next', 'p': '2024-13-45T00:00:00', 'i': 1},
+            {'d': 'next', 'p': 5, 'i': 1},
+            {'d': 'prev', 'p': '2024-01-01T00:00:00', 'i': 2 ** 70},
+            {'d': 'next', 'p': '2024-01-01T00:00:00', 'i': '1'},
+        ]
+        for token in tokens:
+            response = self.client.get(reverse('post_list'), {'cursor': encode_cursor(token)})
+            self.assertEqual(response.status_code, 200, token)
+            self.assertContains(response, 'Post 2')
+        for token in ({'o': 2 ** 70}, {'o': '6'}):
+            response = self.client.get(reverse('search_posts'), {'query': 'Post', 'cursor': encode_cursor(token)})
+            self.assertEqual(response.status_code, 200, token)
+
+    def test_etag_revalidation(self):
+        url = reverse('api-v1:post_list')
+        etag = self.client.get(url)['ETag']
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Post.objects.create(title='New', content='Body')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_author_changes_revalidate(self):
+        author = User.objects.get(username='author')
+        post = Post.objects.first()
+        Comment.objects.create(post=post, author=author, content='c', is_approved=True)
+        authors_url = reverse('api-v1:author_list')
+        comments_url = reverse('api-v1:post_comments', args=[post.pk])
+        etags = [self.client.get(url)['ETag'] for url in (authors_url, comments_url)]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            author.profile.bio = 'New bio'
+            author.profile.save()
+        self.assertEqual(self.client.get(authors_url, HTTP_IF_NONE_MATCH=etags[0]).status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            author.username = 'renamed'
+            author.save()
+        response = self.client.get(comments_url, HTTP_IF_NONE_MATCH=etags[1])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['author'], 'renamed')
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='pw')
+        cls.post = Post.objects.create(title='Post', content='Body', author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_unchanged_page_is_not_modified(self):
+        url = reverse('post_detail', args=[self.post.id])
+        response = self.client.get(url)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_no_last_modified(self):
+        # No timestamp tracks likes, deletions or approvals; only the ETag validates
+        url = reverse('post_detail', args=[self.post.id])
+        self.assertNotIn('Last-Modified', self.client.get(url))
+        since = 'Fri, 01 Jan 2100 00:00:00 GMT'
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=since).status_code, 200)
+
+    def test_new_comment_changes_validators(self):
+        url = reverse('post_detail', args=[self.post.id])
+        etag = self.client.get(url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Comment.objects.create(post=self.post, author=self.author, content='New', is_approved=True)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_validators_change_only_after_commit(self):
+        url = reverse('post_detail', args=[self.post.id])
+        etag = self.client.get(url)['ETag']
+        with self.captureOnCommitCallbacks() as callbacks:
+            Comment.objects.create(post=self.post, author=self.author, content='New', is_approved=True)
+            # A request during the transaction must not cache under a new version
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_like_changes_listings_and_only_its_card(self):
+        other = Post.objects.create(title='Other', content='Body', author=self.author)
+        url = reverse('post_list')
+        self.client.force_login(self.author)
+        etag = self.client.get(url)['ETag']
+        before = get_versions('posts', f'post:{other.pk}')
+        with self.captureOnCommitCallbacks(execute=True):
+            Like.objects.create(user=self.author, post=self.post)
+        # The other card's fragment is still valid
+        self.assertEqual(get_versions('posts', f'post:{other.pk}'), before)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '❤️ 1 likes')
+
+    def test_etag_differs_per_user(self):
+        url = reverse('post_list')
+        etag = self.client.get(url)['ETag']
+        self.client.force_login(self.author)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+@override_settings(FEED_ITEM_COUNT=3)
+class FeedTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='pw')
+        cls.tag = Tag.objects.create(name='Django', slug='django')
+        cls.other = Tag.objects.create(name='Other', slug='other')
+        for i in range(5):
+            Post.objects.create(title=f'Post {i}', content='Body', author=cls.author).tags.add(cls.tag)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_item_count_is_bounded(self):
+        response = self.client.get(reverse('post_feed'))
+        self.assertEqual(response.content.count(b'<item>'), 3)
+        self.assertContains(response, 'Post 4')
+        self.assertNotContains(response, 'Post 1')
+
+    @override_settings(SITE_URL='https://blog.example')
+    def test_links_ignore_the_requested_host(self):
+        for url in (reverse('post_feed'), reverse('tag_atom_feed', args=[self.tag.slug])):
+            self.client.get(url, HTTP_HOST='attacker.example')
+            response = self.client.get(url, HTTP_HOST='blog.example')
+            self.assertNotContains(response, 'attacker.example')
+            self.assertContains(response, 'https://blog.example/post/')
+            self.assertContains(response, f'https://blog.example{url}')
+
+    def test_unchanged_feed_is_not_modified(self):
+        url = reverse('tag_atom_feed', args=[self.tag.slug])
+        response = self.client.get(url)
+        etag, last_modified = response['ETag'], response['Last-Modified']
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+    def test_only_feeds_of_the_changed_post_are_regenerated(self):
+        tag_url = reverse('tag_feed', args=[self.tag.slug])
+        other_url = reverse('tag_feed', args=[self.other.slug])
+        tag_etag, other_etag = self.client.get(tag_url)['ETag'], self.client.get(other_url)['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Post.objects.create(title='New', content='Body', author=self.author).tags.add(self.tag)
+
+        self.assertEqual(self.client.get(other_url, HTTP_IF_NONE_MATCH=other_etag).status_code, 304)
+        response = self.client.get(tag_url, HTTP_IF_NONE_MATCH=tag_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'New')
+
+
+class SitemapTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='pw')
+        cls.tag = Tag.objects.create(name='Django', slug='django')
+        cls.posts = [Post.objects.create(title=f'Post {i}', content='Body', author=cls.author) for i in range(5)]
+        cls.posts[0].tags.add(cls.tag)
+
+    def setUp(self):
+        cache.clear()
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        overrides = override_settings(SITEMAP_PAGE_SIZE=2, SITEMAP_ROOT=root.name)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.first_page = (self.posts[0].pk - 1) // 2 + 1
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_index_lists_every_child(self):
+        index = self.get(reverse('sitemap_index'))
+        post_pages = {(post.pk - 1) // 2 + 1 for post in self.posts}
+        for page in post_pages:
+            self.assertIn(reverse('sitemap_section', args=['posts', page]), index)
+        self.assertIn(reverse('sitemap_section', args=['tags', 1]), index)
+        self.assertIn(reverse('sitemap_section', args=['authors', 1]), index)
+
+    def test_children_hold_their_range(self):
+        child = self.get(reverse('sitemap_section', args=['posts', self.first_page]))
+        self.assertIn(reverse('post_detail', args=[self.posts[0].pk]), child)
+        self.assertLessEqual(child.count('<url>'), 2)
+        self.assertIn(reverse('tag_posts', args=['django']), self.get(reverse('sitemap_section', args=['tags', 1])))
+        self.assertEqual(self.client.get(reverse('sitemap_section', args=['posts', 999])).status_code, 404)
+
+    @override_settings(SITE_URL='https://blog.example/')
+    def test_urls_ignore_the_requested_host(self):
+        response = self.client.get(reverse('sitemap_index'), HTTP_HOST='attacker.example')
+        index = b''.join(response.streaming_content).decode()
+        self.assertIn('<loc>https://blog.example/sitemap-', index)
+        self.assertNotIn('attacker.example', index)
+        self.get(reverse('sitemap_index'))
+        self.assertEqual(len(os.listdir(settings.SITEMAP_ROOT)), 1)
+
+    def test_files_removed_after_the_check_are_rewritten(self):
+        with mock.patch.object(SitemapFile, 'exists', return_value=True):
+            self.assertIn('<url>', self.get(reverse('sitemap_section', args=['posts', self.first_page])))
+
+    def test_newer_versions_are_kept(self):
+        sitemap = SitemapFile('index', 'sitemap')
+        older, newer = (os.path.join(settings.SITEMAP_ROOT, f'index.{sitemap.version + n}.xml') for n in (-1, 1))
+        for path in (older, newer):
+            open(path, 'w').close()
+        sitemap.write(write_index)
+        self.assertEqual(sorted(os.listdir(settings.SITEMAP_ROOT)), sorted(map(os.path.basename, [sitemap.path, newer])))
+
+    def test_only_changed_children_are_rewritten(self):
+        last_page = (self.posts[-1].pk - 1) // 2 + 1
+        self.get(reverse('sitemap_section', args=['posts', self.first_page]))
+        self.get(reverse('sitemap_section', args=['posts', last_page]))
+        before = set(os.listdir(settings.SITEMAP_ROOT))
+
+        self.posts[-1].title = 'Edited'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.posts[-1].save()
+        self.get(reverse('sitemap_section', args=['posts', self.first_page]))
+        self.get(reverse('sitemap_section', args=['posts', last_page]))
+        after = set(os.listdir(settings.SITEMAP_ROOT))
+
+        self.assertEqual([name.split('.')[0] for name in before - after], [f'posts-{last_page}'])
+        self.assertEqual(len(after), 2)
+
+
+class StaticPipelineTests(TestCase):
+    def test_collected_files_are_hashed_compressed_and_immutable(self):
+        with tempfile.TemporaryDirectory() as root, override_settings(
+            STATIC_ROOT=root,
+            # Only the site's own CSS and JS are compressed, to keep this quick
+            STATICFILES_FINDERS=['django.contrib.staticfiles.finders.FileSystemFinder'],
+            WHITENOISE_SKIP_COMPRESS_EXTENSIONS=['png', 'ico'],
+            STORAGES={**settings.STORAGES, 'staticfiles': {'BACKEND': 'blog.storage.MinifyingCompressedManifestStorage'}},
+        ):
+            call_command('collectstatic', interactive=False, verbosity=0)
+            url = static('css/style.css')
+            self.assertRegex(url, r'^/static/css/style\.[0-9a-f]{12}\.css$')
+            self.assertTrue(os.path.exists(os.path.join(root, url[len('/static/'):] + '.gz')))
+
+            # WhiteNoise indexes STATIC_ROOT when the middleware is created
+            response = Client().get(url, HTTP_ACCEPT_ENCODING='gzip')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertIn('immutable', response['Cache-Control'])
+
+
+class UniqueViewerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='pw')
+        cls.post = Post.objects.create(title='Post', content='Body', author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        discard_buffered_views()
+
+    def view(self, client):
+        client.get(reverse('post_detail', args=[self.post.id]))
+
+    def test_repeat_views_are_counted_once_without_a_session(self):
+        client = Client(HTTP_USER_AGENT='reader')
+        for _ in range(3):
+            self.view(client)
+        flush_view_counts()
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.view_count, self.post.unique_viewers), (1, 1))
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, client.cookies)
+
+    def test_distinct_viewers_are_estimated(self):
+        for i in range(20):
+            self.view(Client(HTTP_USER_AGENT=f'reader {i}'))
+        flush_view_counts()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.view_count, 20)
+        self.assertAlmostEqual(self.post.unique_viewers, 20, delta=2)
+
+    def test_not_modified_views_are_counted(self):
+        url = reverse('post_detail', args=[self.post.id])
+        etag = Client(HTTP_USER_AGENT='reader 1').get(url)['ETag']
+        response = Client(HTTP_USER_AGENT='reader 2').get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.view_count, 2)
+
+    def test_sync_views_write_only_the_count_until_the_flush(self):
+        with self.assertNumQueries(1):
+            record_view(self.post.id, viewer=1 << 127)
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.view_count, self.post.unique_viewers), (1, 0))
+        self.assertFalse(PostRanking.objects.exists())
+
+        flush_view_counts()
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.view_count, self.post.unique_viewers), (1, 1))
+        self.assertEqual(PostRanking.objects.get(post=self.post).weekly, 1)
+
+    def test_failed_inline_flush_keeps_the_views(self):
+        counter = MemoryViewCounter(threshold=1, interval=30)
+        with mock.patch('blog.viewcounts.apply_view_counts', side_effect=OperationalError('disk I/O error')), \
+                self.assertLogs('blog.viewcounts', 'ERROR'):
+            counter.record(self.post.id)
+        self.assertEqual(dict(counter.pending), {self.post.id: 1})
+        self.assertEqual(counter.flush(), 1)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.view_count, 1)
+
+    def test_timer_flushes_without_requests(self):
+        counter = MemoryViewCounter(threshold=100, interval=30)
+        counter.record(self.post.id)
+        counter.last_flush -= 30
+        # One pass of the loop; its connection is the test's, so keep it open
+        with mock.patch('blog.viewcounts.time.sleep', side_effect=[None, InterruptedError]), \
+                mock.patch('blog.viewcounts.connections'), self.assertRaises(InterruptedError):
+            counter.run_timer()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.view_count, 1)
+
+    def test_hyperloglog_estimate(self):
+        sketch, other = HyperLogLog(), HyperLogLog()
+        for i in range(10000):
+            (sketch if i % 2 else other).add(int(hashlib.sha256(str(i).encode()).hexdigest(), 16))
+        sketch.merge(other)
+        self.assertAlmostEqual(sketch.estimate(), 10000, delta=10000 * 0.1)
+
+
+@override_settings(RANKING_WEIGHTS={'view': 1, 'like': 5, 'comment': 8}, TRENDING_HALF_LIFE_HOURS=24)
+class RankingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='pw')
+        cls.readers = [User.objects.create_user(f'reader{i}', password='pw') for i in range(3)]
+        cls.old, cls.new = [
+            Post.objects.create(title=title, content='Body', author=cls.author) for title in ('Old', 'New')
+        ]
+
+    def setUp(self):
+        discard_buffered_views()
+
+    def test_events_update_rankings(self):
+        for reader in self.readers:
+            Like.objects.create(user=reader, post=self.old)
+        Comment.objects.create(post=self.new, author=self.author, content='c', is_approved=True)
+        Comment.objects.create(post=self.new, author=self.author, content='pending')
+        self.new.increment_view_count()
+        flush_view_counts()
+
+        ranking = PostRanking.objects.get(post=self.old)
+        self.assertEqual(ranking.weekly, 15)
+        self.assertAlmostEqual(current_score(ranking.trending), 15, places=3)
+        self.assertEqual(PostRanking.objects.get(post=self.new).weekly, 9)
+        self.assertEqual(list(Post.objects.popular_this_week()), [self.old, self.new])
+
+        # Approving in bulk counts too
+        Comment.objects.filter(post=self.new).set_approved(True)
+        self.assertEqual(PostRanking.objects.get(post=self.new).weekly, 17)
+
+    def test_batch_inserts_skip_likes_made_concurrently(self):
+        Like.objects.create(user=self.readers[0], post=self.old)
+        likes = [Like(user=reader, post=self.old) for reader in self.readers[:2]]
+        self.assertEqual(insert_likes(likes), likes[1:])
+        self.assertEqual(Like.objects.filter(post=self.old).count(), 2)
+
+    def test_trending_decays_and_weekly_expires(self):
+        for reader in self.readers:
+            Like.objects.create(user=reader, post=self.old)
+        Like.objects.filter(post=self.old).update(created_at=timezone.now() - timedelta(days=8))
+        Like.objects.create(user=self.readers[0], post=self.new)
+        rebuild_rankings()
+
+        # 15 of engagement eight half-lives ago is worth less than 5 now
+        self.assertEqual(list(Post.objects.trending()), [self.new, self.old])
+        self.assertEqual(list(Post.objects.popular_this_week()), [self.new])
+
+        PostActivity.objects.update(day=timezone.localdate() - timedelta(days=7))
+        update_weekly()
+        self.assertFalse(PostActivity.objects.exists())
+        self.assertFalse(Post.objects.popular_this_week().exists())
+
+    def test_homepage_and_api_show_rankings(self):
+        Like.objects.create(user=self.readers[0], post=self.old)
+        self.assertContains(self.client.get(reverse('post_list')), 'Most popular this week')
+        response = self.client.get(reverse('api-v1:post_trending'))
+        self.assertEqual([post['title'] for post in response.json()], ['Old'])
+
+
+@skipUnless(connection.vendor == 'sqlite', "Reads SQLite query plans")
+class IndexUsageTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='pw')
+        cls.post = Post.objects.create(title='Post', content='Body', author=cls.author, is_featured=True)
+
+    def plan_of(self, queryset):
+        with CaptureQueriesContext(connection) as captured:
+            list(queryset)
+        sql = captured.captured_queries[-1]['sql']
+        plan = explain(sql)
+        self.assertEqual(problems(sql, plan), [])
+        return ' '.join(plan)
+
+    def test_listings_walk_indexes(self):
+        for featured, index in ((True, 'blog_post_featured_idx'), (False, 'blog_post_regular_idx')):
+            listing = Post.objects.filter(is_featured=featured).order_by('-pub_date', '-id')[:7]
+            self.assertIn(index, self.plan_of(listing))
+        by_author = Post.objects.filter(author=self.author).order_by('-pub_date', '-id')[:7]
+        self.assertIn('blog_post_author_idx', self.plan_of(by_author))
+
+    def test_mysql_plans(self):
+        sql = 'SELECT * FROM blog_post WHERE is_featured = 1 ORDER BY pub_date DESC LIMIT 7'
+        with mock.patch('blog.management.commands.explain_queries.connection', mock.Mock(vendor='mysql')):
+            self.assertEqual(problems(sql, ['blog_post type=ref key=blog_post_featured_date_idx Using where']), [])
+            self.assertEqual(
+                problems(sql, ['blog_post type=ALL key=None Using where; Using filesort']),
+                ['full scan of blog_post'],
+            )
+            self.assertEqual(
+                problems(sql, ['blog_post type=ref key=blog_post_author_idx Using where; Using filesort']),
+                ['sort of every matching row'],
+            )
+
+    def test_plain_indexes_without_partial_index_support(self):
+        migration = import_module('blog.migrations.0019_indexes_without_partial_support')
+        for supported, added in ((True, 0), (False, 3)):
+            schema_editor = mock.Mock()
+            schema_editor.connection.features.supports_partial_indexes = supported
+            migration.add_plain_indexes(django_apps, schema_editor)
+            self.assertEqual(schema_editor.add_index.call_count, added)
+            self.assertEqual(schema_editor.add_constraint.call_count, added and 2)
+
+    def test_comment_threads_use_indexes(self):
+        thread = Comment.objects.filter(post=self.post, is_approved=True).order_by('created_date', 'id')
+        self.assertIn('blog_comment_thread_idx', self.plan_of(thread))
+        top_level = thread.filter(parent__isnull=True)[:10]
+        self.assertIn('blog_comment_top_level_idx', self.plan_of(top_level))
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTests(TestCase):
+    """A second SQLite database stands in for a (lagging) replica."""
+
+    @classmethod
+    def setUpClass(cls):
+        # Declared here rather than in `databases`, since the test runner
+        # would want a test database for an alias that isn't in DATABASES
+        cls.replica_dir = tempfile.TemporaryDirectory()
+        connections.settings['replica'] = {
+            **connections.settings['default'],
+            'NAME': os.path.join(cls.replica_dir.name, 'replica.sqlite3'),
+        }
+        call_command('migrate', database='replica', verbosity=0)
+        cls.databases = {'default', 'replica'}
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections['replica'].close()
+        del connections['replica']
+        del connections.settings['replica']
+        cls.replica_dir.cleanup()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='pw')
+        cls.post = Post.objects.create(title='Replicated', content='Body', author=cls.author)
+        User.objects.using('replica').bulk_create([cls.author])
+        Post.objects.using('replica').bulk_create([cls.post])
+        # Not replicated yet
+        Post.objects.create(title='Fresh', content='Body', author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+
+    def log_in(self, client):
+        client.force_login(self.author)
+        # Replicated like the rest
+        Session.objects.using('replica').bulk_create(Session.objects.using('default').all())
+
+    def test_logged_in_pages_read_from_replica(self):
+        self.log_in(self.client)
+        response = self.client.get(reverse('post_list'))
+        self.assertContains(response, 'Replicated')
+        self.assertNotContains(response, 'Fresh')
+        # Its ETag would name versions the replica hasn't caught up with
+        self.assertFalse(response.has_header('ETag'))
+        self.assertNotIn('pin_primary', response.cookies)
+
+    def test_page_cache_misses_read_from_primary(self):
+        # The page is stored for everyone, so it must not be rendered from lagging rows
+        response = self.client.get(reverse('post_list'))
+        self.assertContains(response, 'Fresh')
+        self.assertTrue(response.has_header('ETag'))
+        self.assertContains(self.client.get(reverse('post_list')), 'Fresh')
+
+        # Counting the view writes to the primary, without pinning the client
+        response = self.client.get(reverse('post_detail', args=[self.post.pk]))
+        self.assertNotIn('pin_primary', response.cookies)
+        self.assertEqual(Post.objects.using('default').get(pk=self.post.pk).view_count, 1)
+        self.assertEqual(Post.objects.using('replica').get(pk=self.post.pk).view_count, 0)
+
+    def test_fragments_rendered_from_replica_are_not_stored(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post.title = 'Renamed'
+            self.post.save()
+        # Read from the replica: the post cards must not be cached under the new version
+        client = Client()
+        self.log_in(client)
+        self.assertContains(client.get(reverse('post_list')), 'Replicated')
+        self.assertContains(self.client.get(reverse('post_list')), 'Renamed')
+
+    def test_other_views_and_requests_read_from_primary(self):
+        self.client.force_login(self.author)
+        self.assertContains(self.client.get(reverse('profile')), 'Fresh')
+
+    def test_writing_pins_client_to_primary(self):
+        response = self.client.post(reverse('login'), {'username': 'author', 'password': 'wrong'})
+        self.assertNotIn('pin_primary', response.cookies)
+
+        # Logging out deletes the session
+        self.client.force_login(self.author)
+        response = self.client.post(reverse('logout'))
+        self.assertIn('pin_primary', response.cookies)
+        # Uncacheable (the logout message is pending), so only the pin sends it to the primary
+        self.assertContains(self.client.get(reverse('post_list')), 'Fresh')
+
+
+@skipUnless(connection.vendor == 'sqlite', "SQLite's write lock")
+class ConcurrentWriteTests(TestCase):
+    def test_concurrent_writes_dont_hit_locked_database(self):
+        # In a separate process: the command sets up its own file database,
+        # which concurrent connections need
+        result = subprocess.run(
+            [sys.executable, 'manage.py', 'stress_writes', '--threads', '8', '--operations', '40'],
+            cwd=settings.BASE_DIR, env={**os.environ, 'SQLITE_CONCURRENT': 'True'},
+            capture_output=True, text=True, timeout=120,
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        report = json.loads(result.stdout)
+        self.assertEqual(report['settings']['journal_mode'], 'wal')
+        self.assertEqual(report['errors'], {})
+        self.assertEqual(sum(report['writes'].values()), 8 * 40)
+        self.assertTrue(report['consistent'], report['counters'])
+
+    def test_write_with_retry_retries_while_locked(self):
+        attempts = []
+
+        def write():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise OperationalError('database is locked')
+            return 'written'
+
+        # Outside the test's transaction, as in a request
+        with mock.patch.object(transaction, 'get_connection') as get_connection, \
+                mock.patch('blog.writes.transaction.atomic'), mock.patch('blog.writes.time.sleep'):
+            get_connection.return_value.in_atomic_block = False
+            self.assertEqual(write_with_retry(write)(), 'written')
+            self.assertEqual(len(attempts), 3)
+
+            attempts.clear()
+            with self.settings(SQLITE_WRITE_RETRIES=1), self.assertRaises(OperationalError):
+                write_with_retry(write)()
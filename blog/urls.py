@@ -1,7 +1,7 @@
 # blog/urls.py
 
-from django.urls import path
-from . import views
+from django.urls import include, path
+from . import feeds, sitemaps, views
 
 urlpatterns = [
     # Existing paths
@@ -28,4 +28,20 @@ urlpatterns = [
 
     path('post/<int:post_id>/like/', views.like_post, name='like_post'),
     path('comment/<int:comment_id>/like/', views.like_comment, name='like_comment'),
+    path('likes/batch/', views.like_batch, name='like_batch'),
+
+    # RSS and Atom feeds (blog/feeds.py)
+    path('feed/', feeds.post_feed, name='post_feed'),
+    path('feed/atom/', feeds.post_atom_feed, name='post_atom_feed'),
+    path('tag/<slug:tag_slug>/feed/', feeds.tag_feed, name='tag_feed'),
+    path('tag/<slug:tag_slug>/feed/atom/', feeds.tag_atom_feed, name='tag_atom_feed'),
+    path('author/<str:username>/feed/', feeds.author_feed, name='author_feed'),
+    path('author/<str:username>/feed/atom/', feeds.author_atom_feed, name='author_atom_feed'),
+
+    # Sitemaps (blog/sitemaps.py)
+    path('sitemap.xml', sitemaps.sitemap_index, name='sitemap_index'),
+    path('sitemap-<str:section>-<int:page>.xml', sitemaps.sitemap_section, name='sitemap_section'),
+
+    # Read-only JSON API (blog/api/)
+    path('api/v1/', include('blog.api.urls', namespace='api-v1')),
 ]
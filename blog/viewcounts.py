@@ -0,0 +1,323 @@
+# blog/viewcounts.py
+
+"""
+View-count ingestion.
+
+VIEW_COUNT_MODE selects how post views reach the database:
+
+* 'sync'   - one atomic `UPDATE ... SET view_count = view_count + 1` per view.
+* 'memory' - views are counted in this worker's memory.
+* 'cache'  - views are counted in the default cache, shared by all workers.
+
+The buffered modes write `view_count = view_count + n` in batches, once
+VIEW_COUNT_FLUSH_THRESHOLD views are pending or VIEW_COUNT_FLUSH_INTERVAL
+seconds have passed, and when the worker exits. A request checks the
+threshold; a background thread per worker checks the interval, so a quiet
+worker doesn't sit on its views.
+`manage.py flush_view_counts` drains the cache buffer on demand.
+
+Views are deduplicated per viewer without the session, and distinct viewers
+are estimated per post (see blog/viewers.py). Every mode buffers the views'
+rankings and HyperLogLog sketches per worker and writes them with the next
+flush: written per view, they would take a view from one write to about six.
+"""
+
+import atexit
+import functools
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import F
+
+from . import rankings
+from .models import Post
+from .viewers import HyperLogLog, RecentViewers, apply_viewer_sketches, viewer_hash
+from .writes import write_with_retry
+
+logger = logging.getLogger(__name__)
+
+CACHE_KEY_PREFIX = 'viewcount:pending:'
+CACHE_LOCK_KEY = 'viewcount:flush-lock'
+
+
+@write_with_retry
+def apply_view_counts(counts):
+    """
+    Add {post_id: n} to Post.view_count, one UPDATE per distinct n, and the
+    views to the rankings, in one transaction.
+    """
+    by_increment = defaultdict(list)
+    for post_id, n in counts.items():
+        if n > 0:
+            by_increment[n].append(post_id)
+    for n, post_ids in by_increment.items():
+        Post.objects.filter(pk__in=post_ids).update(view_count=F('view_count') + n)
+    rank_views({pk: counts[pk] for ids in by_increment.values() for pk in ids})
+    return sum(n * len(ids) for n, ids in by_increment.items())
+
+
+@write_with_retry
+def rank_views(counts):
+    """Add {post_id: n} views to the rankings of those posts that still exist."""
+    if not counts:
+        return
+    existing = Post.objects.filter(pk__in=list(counts)).values_list('pk', flat=True)
+    weight = rankings.weights().get('view', 0)
+    rankings.record_activity({pk: counts[pk] * weight for pk in existing})
+
+
+class MemoryViewCounter:
+    """Buffers views in this process only."""
+
+    def __init__(self, threshold, interval):
+        self.threshold = threshold
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.pending = defaultdict(int)
+        self.pending_total = 0
+        self.sketches = defaultdict(HyperLogLog)
+        self.last_flush = time.monotonic()
+
+    def record(self, post_id, viewer=None):
+        with self.lock:
+            self.pending[post_id] += 1
+            self.pending_total += 1
+            self.add_viewer(post_id, viewer)
+        self.flush_if_due()
+
+    def flush_if_due(self):
+        """
+        Flush from a request once due. A failed flush keeps the views buffered
+        for the next one rather than failing the request that triggered it.
+        """
+        if not self.should_flush():
+            return
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Could not flush view counts; keeping them for the next flush")
+
+    def add_viewer(self, post_id, viewer):
+        # Called with the lock held
+        if viewer is not None:
+            self.sketches[post_id].add(viewer)
+
+    def should_flush(self):
+        return (self.pending_total >= self.threshold
+                or time.monotonic() - self.last_flush >= self.interval)
+
+    def start_timer(self):
+        threading.Thread(target=self.run_timer, name='view-count-flush', daemon=True).start()
+
+    def run_timer(self):
+        """Flush whenever the interval is up, even if no request comes in to do it."""
+        while True:
+            time.sleep(max(0, self.last_flush + self.interval - time.monotonic()))
+            self.flush_if_due()
+            # This thread's connection, if the flush opened one
+            connections.close_all()
+
+    def take_pending(self):
+        with self.lock:
+            counts = self.pending
+            self.pending = defaultdict(int)
+            self.pending_total = 0
+            self.last_flush = time.monotonic()
+        return counts
+
+    def take_sketches(self):
+        with self.lock:
+            sketches = self.sketches
+            self.sketches = defaultdict(HyperLogLog)
+        return sketches
+
+    def flush_sketches(self):
+        sketches = self.take_sketches()
+        if not sketches:
+            return
+        try:
+            apply_viewer_sketches(sketches)
+        except Exception:
+            # Merging is idempotent, so put them back for the next flush
+            with self.lock:
+                for post_id, sketch in sketches.items():
+                    self.sketches[post_id].merge(sketch)
+            raise
+
+    def write_pending(self, counts):
+        return apply_view_counts(counts)
+
+    def flush(self):
+        counts = self.take_pending()
+        if not counts:
+            # Runs at exit too; with nothing to write, don't even connect
+            return 0
+        try:
+            applied = self.write_pending(counts)
+        except Exception:
+            # Put the counts back so the next flush retries them
+            with self.lock:
+                for post_id, n in counts.items():
+                    self.pending[post_id] += n
+                    self.pending_total += n
+            raise
+        self.flush_sketches()
+        return applied
+
+
+class SyncViewCounter(MemoryViewCounter):
+    """
+    Writes each view to Post.view_count right away, and buffers only its
+    ranking and viewer sketch in this process.
+    """
+
+    def record(self, post_id, viewer=None):
+        if write_view(post_id):
+            super().record(post_id, viewer)
+
+    def write_pending(self, counts):
+        # The views themselves are already written
+        rank_views(counts)
+        return 0
+
+
+class CacheViewCounter(MemoryViewCounter):
+    """
+    Buffers views in the shared cache. The in-process state only tracks which
+    posts this worker touched and how many views it added since its last flush.
+    """
+
+    def record(self, post_id, viewer=None):
+        key = f'{CACHE_KEY_PREFIX}{post_id}'
+        cache.add(key, 0, timeout=None)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Key was evicted between add() and incr()
+            cache.set(key, 1, timeout=None)
+        with self.lock:
+            self.pending[post_id] += 1
+            self.pending_total += 1
+            self.add_viewer(post_id, viewer)
+        self.flush_if_due()
+
+    def flush(self):
+        post_ids = list(self.take_pending())
+        try:
+            applied = drain_cached_counts(post_ids)
+        except Exception:
+            # The counts stay in the cache; keep our posts marked to retry them
+            with self.lock:
+                for post_id in post_ids:
+                    self.pending[post_id] += 0
+            raise
+        # Each worker merges its own sketches; no lock needed
+        self.flush_sketches()
+        if applied is None:
+            # Another worker is flushing; keep our posts marked for the next round
+            with self.lock:
+                for post_id in post_ids:
+                    self.pending[post_id] += 0
+            return 0
+        return applied
+
+
+def drain_cached_counts(post_ids):
+    """
+    Move buffered counts for `post_ids` from the cache into the database.
+    Returns None if another process currently holds the flush lock.
+    """
+    if not post_ids:
+        return 0
+    # Only one flusher at a time, so two workers can't apply the same views twice
+    if not cache.add(CACHE_LOCK_KEY, True, timeout=60):
+        return None
+    try:
+        keys = {f'{CACHE_KEY_PREFIX}{post_id}': post_id for post_id in post_ids}
+        counts = {keys[key]: n for key, n in cache.get_many(list(keys)).items() if n}
+        applied = apply_view_counts(counts)
+        for post_id, n in counts.items():
+            # decr (not delete) keeps views recorded since get_many()
+            try:
+                cache.decr(f'{CACHE_KEY_PREFIX}{post_id}', n)
+            except ValueError:
+                pass
+        return applied
+    finally:
+        cache.delete(CACHE_LOCK_KEY)
+
+
+COUNTER_CLASSES = {
+    'sync': SyncViewCounter,
+    'memory': MemoryViewCounter,
+    'cache': CacheViewCounter,
+}
+
+_counters = {}
+_counters_lock = threading.Lock()
+
+
+def get_view_counter():
+    """Return this process's buffer for the configured mode."""
+    mode = getattr(settings, 'VIEW_COUNT_MODE', 'sync')
+    with _counters_lock:
+        if mode not in _counters:
+            counter = COUNTER_CLASSES[mode](
+                threshold=getattr(settings, 'VIEW_COUNT_FLUSH_THRESHOLD', 100),
+                interval=getattr(settings, 'VIEW_COUNT_FLUSH_INTERVAL', 30),
+            )
+            atexit.register(counter.flush)
+            if counter.interval > 0:
+                counter.start_timer()
+            _counters[mode] = counter
+    return _counters[mode]
+
+
+def record_view(post_id, viewer=None):
+    """
+    Count one view of `post_id` according to VIEW_COUNT_MODE, and add
+    `viewer` (a viewer_hash()) to its unique-viewer sketch.
+    """
+    get_view_counter().record(post_id, viewer)
+
+
+@write_with_retry
+def write_view(post_id):
+    """Add one view to `post_id` right away. Returns False if the post is gone."""
+    return bool(Post.objects.filter(pk=post_id).update(view_count=F('view_count') + 1))
+
+
+def count_unique_view(request, post_id):
+    """
+    Count a view of `post_id` unless this viewer was seen recently.
+    Returns True if this request's view was counted.
+    """
+    viewer = viewer_hash(request)
+    if RecentViewers(post_id).check_and_add(viewer):
+        return False
+    record_view(post_id, viewer)
+    return True
+
+
+def counts_not_modified(view):
+    """
+    Count views answered with 304 Not Modified by `view`, a conditional view
+    taking `post_id`. Those never run the view's body, which counts the rest.
+    """
+    @functools.wraps(view)
+    def wrapper(request, post_id, *args, **kwargs):
+        response = view(request, post_id, *args, **kwargs)
+        if response.status_code == 304:
+            count_unique_view(request, post_id)
+        return response
+    return wrapper
+
+
+def flush_view_counts():
+    """Flush this process's pending views. Returns the number of views written."""
+    return get_view_counter().flush()
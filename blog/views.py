@@ -1,103 +1,118 @@
 # blog/views.py
 
+import json
+
+from asgiref.sync import sync_to_async
 from django.contrib import messages
 from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
-from django.db.models import Q
 from django.http import JsonResponse
-from django.shortcuts import render, get_object_or_404, redirect
+from django.shortcuts import render, get_object_or_404, redirect, aget_object_or_404
+from django.utils.functional import SimpleLazyObject
+from django.views.decorators.http import condition, require_POST
 
+from . import search
+from .cache import PageCache
+from .conditional import post_detail_etag, post_list_etag, tag_posts_etag
 from .forms import CommentForm
 from .forms import SearchForm
 from .forms import UserRegistrationForm, UserLoginForm, UserProfileForm, UserUpdateForm, PostForm
+from .likes import InvalidBatch, apply_like_batch, aset_like, parse_batch, requested_state
 from .models import Comment
-from .models import Like
-from .models import Post, Tag
+from .models import Post, RelatedPost, Tag
+from .pagination import CursorPaginator, OffsetCursorPaginator
+from .viewcounts import count_unique_view, counts_not_modified
+from .writes import write_with_retry
 
 
 
+@condition(etag_func=tag_posts_etag)
 def tag_posts(request, tag_slug):
     """
     Display posts filtered by tag
     """
-    from django.db.models import Count
+    page_cache = PageCache(request, 'tag_posts', 'posts', 'likes')
+    cached = page_cache.get()
+    if cached is not None:
+        return cached
 
     tag = get_object_or_404(Tag, slug=tag_slug)
-    # Annotate with like counts
-    posts_list = Post.objects.filter(tags=tag).annotate(likes_count=Count('likes')).order_by('-pub_date')
-
-    # Set up pagination
-    paginator = Paginator(posts_list, 6)  # Show 6 posts per page
-    page = request.GET.get('page')
+    posts_list = Post.objects.filter(tags=tag).for_listing().order_by('-pub_date')
 
-    try:
-        posts = paginator.page(page)
-    except PageNotAnInteger:
-        posts = paginator.page(1)
-    except EmptyPage:
-        posts = paginator.page(paginator.num_pages)
+    # Set up cursor pagination
+    paginator = CursorPaginator(posts_list, 6, count_key=f'tag_posts:{tag.pk}')  # Show 6 posts per page
+    posts = paginator.page(request.GET.get('cursor'))
 
     context = {
         'posts': posts,
         'tag': tag
     }
 
-    return render(request, 'blog/tag_posts.html', context)
+    return page_cache.set(render(request, 'blog/tag_posts.html', context))
 
 
+@condition(etag_func=post_list_etag)
 def post_list(request):
     """
     Displays a paginated list of blog posts with featured posts carousel.
     """
-    from django.db.models import Count
+    page_cache = PageCache(request, 'post_list', 'posts', 'likes', 'tags')
+    cached = page_cache.get()
+    if cached is not None:
+        return cached
 
-    # Get featured posts with like counts
-    featured_posts = Post.objects.filter(is_featured=True).annotate(
-        likes_count=Count('likes')
-    ).order_by('-pub_date')
+    # Get featured posts
+    featured_posts = Post.objects.filter(is_featured=True).for_listing().order_by('-pub_date')
 
-    # Get regular posts with like counts (excluding featured ones)
-    regular_posts_list = Post.objects.filter(is_featured=False).annotate(
-        likes_count=Count('likes')
-    ).order_by('-pub_date')
+    # Get regular posts (excluding featured ones)
+    regular_posts_list = Post.objects.filter(is_featured=False).for_listing().order_by('-pub_date')
 
-    # Get the most used tags (limited to 20)
-    tags = Tag.objects.annotate(
-        num_posts=Count('posts')
-    ).order_by('-num_posts')[:20]
+    # Get the most used tags (limited to 20), sized for the tag cloud. Lazy, so
+    # nothing is queried while the cloud's template fragment is cached.
+    tags = SimpleLazyObject(lambda: Tag.objects.cloud(20))
 
-    # Set up pagination for regular posts only
-    paginator = Paginator(regular_posts_list, 6)
-    page = request.GET.get('page')
+    # Rankings (blog/rankings.py), one indexed query each, also lazy: their
+    # fragment is cached for a minute since every view moves them
+    ranked = Post.objects.select_related('author').only('title', 'author__username')
+    trending_posts = SimpleLazyObject(lambda: list(ranked.trending()[:5]))
+    popular_posts = SimpleLazyObject(lambda: list(ranked.popular_this_week()[:5]))
 
-    try:
-        regular_posts = paginator.page(page)
-    except PageNotAnInteger:
-        regular_posts = paginator.page(1)
-    except EmptyPage:
-        regular_posts = paginator.page(paginator.num_pages)
+    # Set up cursor pagination for regular posts only
+    paginator = CursorPaginator(regular_posts_list, 6, count_key='post_list')
+    regular_posts = paginator.page(request.GET.get('cursor'))
 
     context = {
         'featured_posts': featured_posts,
         'posts': regular_posts,
-        'tags': tags
+        'tags': tags,
+        'trending_posts': trending_posts,
+        'popular_posts': popular_posts,
     }
-    return render(request, 'blog/post_list.html', context)
+    return page_cache.set(render(request, 'blog/post_list.html', context))
 
 
+@counts_not_modified
+@condition(etag_func=post_detail_etag)
 def post_detail(request, post_id):
     """
     Displays a single blog post and handles comment submission.
     """
-    post = get_object_or_404(Post, pk=post_id)
+    page_cache = PageCache(request, 'post_detail', 'posts', f'post:{post_id}')
+    cached = page_cache.get()
+    if cached is not None:
+        # Views still count when the page is served from the cache
+        count_unique_view(request, post_id)
+        return cached
+
+    post = get_object_or_404(
+        Post.objects.select_related('author', 'category').prefetch_related('tags'),
+        pk=post_id,
+    )
 
-    # Increment the view count - only once per session
-    session_key = f'viewed_post_{post.id}'
-    if not request.session.get(session_key, False):
-        post.increment_view_count()
-        request.session[session_key] = True
+    # Increment the view count - once per viewer and day or so (blog/viewers.py)
+    if count_unique_view(request, post.id):
+        post.view_count += 1
 
     # Add a liked_by_user property to the post
     if request.user.is_authenticated:
@@ -105,20 +120,9 @@ def post_detail(request, post_id):
     else:
         post.liked_by_user = False
 
-    # Only get approved comments
-    comments = post.comments.filter(parent=None, is_approved=True)
-
-    # Add a liked_by_user property to each comment and reply
-    if request.user.is_authenticated:
-        for comment in comments:
-            comment.liked_by_user = comment.likes.filter(user=request.user).exists()
-            for reply in comment.replies.all():
-                reply.liked_by_user = reply.likes.filter(user=request.user).exists()
-    else:
-        for comment in comments:
-            comment.liked_by_user = False
-            for reply in comment.replies.all():
-                reply.liked_by_user = False
+    # Load the approved comment thread (authors, replies and the user's likes)
+    # in a constant number of queries
+    comments = Comment.objects.thread_for(post, request.user)
 
     new_comment = None
     comment_form = None
@@ -137,8 +141,9 @@ def post_detail(request, post_id):
                 if parent_id:
                     new_comment.parent = Comment.objects.get(id=parent_id)
 
-                # Save the comment (is_approved defaults to False in the model)
-                new_comment.save()
+                # Save the comment (is_approved defaults to False in the model),
+                # retrying while the database is locked
+                write_with_retry(new_comment.save)()
 
                 # Notify user that comment is pending approval
                 messages.success(request, 'Your comment has been submitted and is awaiting approval.')
@@ -146,11 +151,11 @@ def post_detail(request, post_id):
         else:
             comment_form = CommentForm()
 
-    # Get related posts by tags (up to 3)
-    related_posts = []
-    if post.tags.exists():
-        tag_ids = post.tags.values_list('id', flat=True)
-        related_posts = Post.objects.filter(tags__in=tag_ids).exclude(id=post.id).distinct()[:3]
+    # Get related posts (up to 3) from the precomputed index in blog/related.py
+    related_posts = [
+        entry.related
+        for entry in RelatedPost.objects.filter(post=post).select_related('related').defer('related__content')[:3]
+    ]
 
     context = {
         'post': post,
@@ -158,7 +163,7 @@ def post_detail(request, post_id):
         'comment_form': comment_form,
         'related_posts': related_posts,  # Add related posts based on tags
     }
-    return render(request, 'blog/post_detail.html', context)
+    return page_cache.set(render(request, 'blog/post_detail.html', context))
 
 
 
@@ -261,24 +266,12 @@ def profile(request):
         user_form = UserUpdateForm(instance=request.user)
         profile_form = UserProfileForm(instance=request.user.profile)
 
-    # Get user's posts with pagination
-    user_posts_list = Post.objects.filter(author=request.user)
-
-    # Debug: Print the count of posts found (you can remove this after fixing)
-    print(f"Found {user_posts_list.count()} posts for user {request.user.username}")
+    # Get user's posts with cursor pagination
+    user_posts_list = Post.objects.filter(author=request.user).for_listing()
 
-    # Set up pagination
-    paginator = Paginator(user_posts_list, 6)  # Show 6 posts per page
-    page = request.GET.get('page')
-
-    try:
-        user_posts = paginator.page(page)
-    except PageNotAnInteger:
-        # If page is not an integer, deliver first page
-        user_posts = paginator.page(1)
-    except EmptyPage:
-        # If page is out of range, deliver last page of results
-        user_posts = paginator.page(paginator.num_pages)
+    # No count_key: authors expect their own post count to be exact
+    paginator = CursorPaginator(user_posts_list, 6)  # Show 6 posts per page
+    user_posts = paginator.page(request.GET.get('cursor'))
 
     context = {
         'user_form': user_form,
@@ -296,9 +289,8 @@ def create_post(request):
     if request.method == 'POST':
         form = PostForm(request.POST, request.FILES)
         if form.is_valid():
-            post = form.save(commit=False)
-            post.author = request.user
-            post.save()
+            form.instance.author = request.user
+            post = form.save()
             messages.success(request, 'Your post has been created!')
             return redirect('post_detail', post_id=post.id)
     else:
@@ -352,26 +344,17 @@ def delete_post(request, post_id):
 
 
 @login_required
-def like_post(request, post_id):
+@require_POST
+async def like_post(request, post_id):
     """
-    Toggle like status for a post
+    Like, unlike or toggle (the default) a post. Async, so under ASGI a burst
+    of clicks doesn't hold a worker per request (see blog/likes.py).
     """
-    post = get_object_or_404(Post, pk=post_id)
-    like, created = Like.objects.get_or_create(
-        user=request.user,
-        post=post,
-        defaults={'comment': None}
-    )
-
-    # If not created, it means the like already existed, so we remove it
-    if not created:
-        like.delete()
-        liked = False
-    else:
-        liked = True
+    post = await aget_object_or_404(Post.objects.only('pk'), pk=post_id)
+    liked = await aset_like(await request.auser(), requested_state(request), post=post)
 
-    # Get updated count
-    like_count = post.likes.count()
+    # Get updated count (maintained by the Like signals)
+    like_count = await Post.objects.filter(pk=post.pk).values_list('like_count', flat=True).aget()
 
     # Return JSON response
     return JsonResponse({
@@ -381,26 +364,16 @@ def like_post(request, post_id):
 
 
 @login_required
-def like_comment(request, comment_id):
+@require_POST
+async def like_comment(request, comment_id):
     """
-    Toggle like status for a comment
+    Like, unlike or toggle (the default) a comment.
     """
-    comment = get_object_or_404(Comment, pk=comment_id)
-    like, created = Like.objects.get_or_create(
-        user=request.user,
-        comment=comment,
-        defaults={'post': None}
-    )
-
-    # If not created, it means the like already existed, so we remove it
-    if not created:
-        like.delete()
-        liked = False
-    else:
-        liked = True
+    comment = await aget_object_or_404(Comment.objects.only('pk'), pk=comment_id)
+    liked = await aset_like(await request.auser(), requested_state(request), comment=comment)
 
-    # Get updated count
-    like_count = comment.likes.count()
+    # Get updated count (maintained by the Like signals)
+    like_count = await Comment.objects.filter(pk=comment.pk).values_list('like_count', flat=True).aget()
 
     # Return JSON response
     return JsonResponse({
@@ -409,38 +382,40 @@ def like_comment(request, comment_id):
     })
 
 
+@login_required
+@require_POST
+async def like_batch(request):
+    """
+    Apply a batch of like/unlike operations on posts and comments in one
+    request (see blog/likes.py for the format) and return their final states.
+    The post_detail page coalesces rapid clicks into these batches.
+    """
+    try:
+        data = json.loads(request.body or b'null')
+    except ValueError:
+        return JsonResponse({'error': "Invalid JSON."}, status=400)
+    try:
+        wanted = parse_batch(data)
+    except InvalidBatch as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    results = await sync_to_async(apply_like_batch)(await request.auser(), wanted)
+    return JsonResponse({'results': results})
 
 
 def search_posts(request):
     """
     Search for posts by title, content, author username, or tags with pagination.
+    Results come from the full-text index (blog/search.py), ranked by relevance.
     """
-    from django.db.models import Count
-
     search_form = SearchForm(request.GET)
     query = request.GET.get('query', '')
-    results_list = []
+    results = None
 
     if query:
-        # Search in title, content, author's username, and tags
-        # And annotate with like counts
-        results_list = Post.objects.filter(
-            Q(title__icontains=query) |
-            Q(content__icontains=query) |
-            Q(author__username__icontains=query) |
-            Q(tags__name__icontains=query)
-        ).distinct().annotate(likes_count=Count('likes')).order_by('-pub_date')
-
-    # Set up pagination
-    paginator = Paginator(results_list, 6)  # Show 6 results per page
-    page = request.GET.get('page')
-
-    try:
-        results = paginator.page(page)
-    except PageNotAnInteger:
-        results = paginator.page(1)
-    except EmptyPage:
-        results = paginator.page(paginator.num_pages)
+        # Relevance order has no stable keyset, so the cursor carries an offset
+        paginator = OffsetCursorPaginator(search.search_posts(query), 6, count_key=f'search:{query}')
+        results = paginator.page(request.GET.get('cursor'))
 
     context = {
         'search_form': search_form,
@@ -456,27 +431,22 @@ def author_profile(request, username):
     """
     View another user's profile and posts with pagination.
     """
-    from django.db.models import Count
+    page_cache = PageCache(request, 'author_profile', 'posts', 'likes', f'author:{username}')
+    cached = page_cache.get()
+    if cached is not None:
+        return cached
 
     author = get_object_or_404(User, username=username)
 
-    # Make sure we're filtering correctly by author and annotating with like counts
-    author_posts_list = Post.objects.filter(author=author).annotate(likes_count=Count('likes')).order_by('-pub_date')
-
-    # Set up pagination
-    paginator = Paginator(author_posts_list, 6)  # Show 6 posts per page
-    page = request.GET.get('page')
+    author_posts_list = Post.objects.filter(author=author).for_listing().order_by('-pub_date')
 
-    try:
-        author_posts = paginator.page(page)
-    except PageNotAnInteger:
-        author_posts = paginator.page(1)
-    except EmptyPage:
-        author_posts = paginator.page(paginator.num_pages)
+    # Set up cursor pagination
+    paginator = CursorPaginator(author_posts_list, 6, count_key=f'author_profile:{author.pk}')  # Show 6 posts per page
+    author_posts = paginator.page(request.GET.get('cursor'))
 
     context = {
         'author': author,
         'author_posts': author_posts
     }
 
-    return render(request, 'blog/author_profile.html', context)
\ No newline at end of file
+    return page_cache.set(render(request, 'blog/author_profile.html', context))
\ No newline at end of file
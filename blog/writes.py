@@ -0,0 +1,59 @@
+# blog/writes.py
+
+"""
+The write path for requests and flushes.
+
+SQLite has one write lock for the whole database. Writers wait for it up to
+the busy timeout, but some conflicts can't be waited out: a transaction that
+read first and then wants to write gets "database is locked" right away if
+another writer got in between. SQLITE_CONCURRENT (see settings.py) avoids
+most of that with WAL and BEGIN IMMEDIATE; write_with_retry handles the rest
+by running each write in its own short transaction and retrying the whole
+transaction, with jittered exponential backoff, while the database is locked.
+
+A retried function runs again from the start, so anything it does outside the
+database (cache version bumps, say) must be safe to repeat.
+"""
+
+import functools
+import random
+import time
+
+from django.conf import settings
+from django.db import OperationalError, transaction
+
+LOCK_ERRORS = ('database is locked', 'database table is locked')
+
+
+def is_locked(error):
+    return any(message in str(error) for message in LOCK_ERRORS)
+
+
+def backoff(attempt):
+    """Seconds to wait before retry number `attempt` (from 0): full jitter, capped at a second."""
+    base = getattr(settings, 'SQLITE_RETRY_BACKOFF', 0.02)
+    return random.uniform(0, min(1.0, base * 2 ** attempt))
+
+
+def write_with_retry(func):
+    """
+    Run `func` in a transaction, retrying up to SQLITE_WRITE_RETRIES times
+    while the database is locked. Inside an enclosing transaction it just
+    runs: the outermost transaction is the one that can be retried.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if transaction.get_connection().in_atomic_block:
+            return func(*args, **kwargs)
+        retries = getattr(settings, 'SQLITE_WRITE_RETRIES', 5)
+        attempt = 0
+        while True:
+            try:
+                with transaction.atomic():
+                    return func(*args, **kwargs)
+            except OperationalError as e:
+                if attempt >= retries or not is_locked(e):
+                    raise
+            time.sleep(backoff(attempt))
+            attempt += 1
+    return wrapper
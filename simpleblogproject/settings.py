@@ -13,6 +13,8 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 from pathlib import Path
 import os
 
+from decouple import config
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -24,7 +26,7 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = "django-insecure-y_@c083w9glqw1=flqv!0f0ce3^w81g5j-6)+y-aq+8rz3_(@i"
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = config('DEBUG', default=True, cast=bool)
 
 ALLOWED_HOSTS = ['*']
 
@@ -39,10 +41,14 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "rest_framework",
 ]
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "whitenoise.middleware.WhiteNoiseMiddleware",
+    "blog.middleware.QueryBudgetMiddleware",
+    "blog.replicas.ReplicaMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -63,6 +69,7 @@ TEMPLATES = [
                 "django.template.context_processors.request",
                 "django.contrib.auth.context_processors.auth",
                 "django.contrib.messages.context_processors.messages",
+                "blog.cache.cache_versions",
             ],
         },
     },
@@ -74,13 +81,191 @@ WSGI_APPLICATION = "simpleblogproject.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Read from the environment or a .env file. Without any, this is SQLite in
+# db.sqlite3; for MySQL set DB_ENGINE=django.db.backends.mysql and DB_NAME,
+# DB_USER, DB_PASSWORD, DB_HOST, DB_PORT. Connections stay open for
+# DB_CONN_MAX_AGE seconds (0 closes them after each request) and are checked
+# before being reused.
+DB_ENGINE = config('DB_ENGINE', default='django.db.backends.sqlite3')
+DB_OPTIONS = {'charset': 'utf8mb4'} if DB_ENGINE.endswith('mysql') else {}
+if DB_ENGINE.endswith('mysql'):
+    # MySQL has no partial indexes; migration 0019 adds plain ones in their place
+    SILENCED_SYSTEM_CHECKS = ['models.W036', 'models.W037']
+
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+        "ENGINE": DB_ENGINE,
+        "NAME": config('DB_NAME', default=str(BASE_DIR / "db.sqlite3")),
+        "USER": config('DB_USER', default=''),
+        "PASSWORD": config('DB_PASSWORD', default=''),
+        "HOST": config('DB_HOST', default=''),
+        "PORT": config('DB_PORT', default=''),
+        "CONN_MAX_AGE": config('DB_CONN_MAX_AGE', default=60, cast=int),
+        "CONN_HEALTH_CHECKS": config('DB_CONN_HEALTH_CHECKS', default=True, cast=bool),
+        "OPTIONS": {**DB_OPTIONS},
     }
 }
 
+# SQLITE_CONCURRENT is for SQLite shared by several workers (gunicorn_start.sh
+# runs three). It turns on WAL, so readers and the writer stop blocking each
+# other, and makes transactions take the write lock when they start (BEGIN
+# IMMEDIATE), so they queue for it instead of failing halfway. Writers wait up
+# to 5 seconds for the lock. synchronous=NORMAL is safe with WAL; only the last
+# commits can be lost, and only on power loss. Reads use a 256 MB memory map and
+# a 64 MB page cache per connection. Writes that still find the database locked
+# are retried SQLITE_WRITE_RETRIES times (blog/writes.py).
+SQLITE_CONCURRENT = config('SQLITE_CONCURRENT', default=False, cast=bool)
+if SQLITE_CONCURRENT and DB_ENGINE.endswith('sqlite3'):
+    DATABASES['default']['OPTIONS'] = {
+        **DB_OPTIONS,
+        'init_command': (
+            'PRAGMA journal_mode=WAL; PRAGMA busy_timeout=5000; PRAGMA synchronous=NORMAL; '
+            'PRAGMA mmap_size=268435456; PRAGMA cache_size=-65536; PRAGMA temp_store=MEMORY'
+        ),
+        'transaction_mode': 'IMMEDIATE',
+    }
+SQLITE_WRITE_RETRIES = config('SQLITE_WRITE_RETRIES', default=5, cast=int)
+SQLITE_RETRY_BACKOFF = 0.02  # seconds before the first retry; doubles each time
+
+# Read replica (blog/replicas.py): DB_REPLICA_HOST, or DB_REPLICA_NAME (e.g. a
+# second SQLite file), adds one with the primary's other settings, except
+# SQLITE_CONCURRENT's options: BEGIN IMMEDIATE would make its reads take the
+# write lock that replication needs.
+# REPLICA_VIEWS read from it on GET and HEAD requests; after any other request
+# that wrote, the client reads from the primary for REPLICA_PIN_SECONDS, so it
+# sees its own writes despite replication lag.
+DB_REPLICA_HOST = config('DB_REPLICA_HOST', default='')
+DB_REPLICA_NAME = config('DB_REPLICA_NAME', default='')
+DATABASE_REPLICAS = []
+if DB_REPLICA_HOST or DB_REPLICA_NAME:
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        "NAME": DB_REPLICA_NAME or DATABASES['default']['NAME'],
+        "HOST": DB_REPLICA_HOST or DATABASES['default']['HOST'],
+        "OPTIONS": {**DB_OPTIONS},
+        # Tests use the primary's test database
+        "TEST": {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS = ['replica']
+DATABASE_ROUTERS = ['blog.replicas.ReplicaRouter']
+REPLICA_VIEWS = ['post_list', 'post_detail', 'search_posts', 'tag_posts', 'author_profile']
+REPLICA_PIN_SECONDS = config('REPLICA_PIN_SECONDS', default=10, cast=int)
+
+
+# Caching
+# BLOG_CACHE_BACKEND picks the cache used for pages, fragments and counters:
+#   'file'   - the default; shared by all workers on one host (BLOG_CACHE_LOCATION)
+#   'redis'  - any Redis-compatible server at BLOG_CACHE_LOCATION
+#   'locmem' - per process, so only for a single process: each gunicorn worker
+#              would only see its own invalidations and keep serving, and
+#              answering 304 for, pages another worker changed
+BLOG_CACHE_BACKEND = config('BLOG_CACHE_BACKEND', default='file')
+
+if BLOG_CACHE_BACKEND == 'redis':
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": config('BLOG_CACHE_LOCATION', default='redis://127.0.0.1:6379/1'),
+        }
+    }
+elif BLOG_CACHE_BACKEND == 'locmem':
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "simpleblog",
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": config('BLOG_CACHE_LOCATION', default=os.path.join(BASE_DIR, 'cache')),
+        }
+    }
+
+# Rendered pages for anonymous visitors and template fragments ({% cache %}) are
+# keyed on version counters bumped by signals (see blog/cache.py), so these
+# timeouts only bound memory use and view-count staleness.
+PAGE_CACHE_TIMEOUT = 600
+FRAGMENT_CACHE_TIMEOUT = 600
+
+
+# RSS/Atom feeds (see blog/feeds.py): the number of posts per feed, and how long
+# a rendered feed is kept; feeds are re-rendered as soon as one of their posts changes.
+FEED_ITEM_COUNT = 20
+FEED_CACHE_TIMEOUT = 3600
+
+
+# Sitemaps (see blog/sitemaps.py): URLs per child sitemap (the protocol allows
+# 50,000) and where generated files are kept. Each child is rewritten only when
+# an object in its range changes. Sitemaps and feeds hold absolute URLs on
+# SITE_URL, never on the requested host, which any client can set.
+SITEMAP_PAGE_SIZE = 50000
+SITEMAP_ROOT = os.path.join(BASE_DIR, 'cache', 'sitemaps')
+SITE_URL = config('SITE_URL', default='http://localhost:8000')
+
+
+# Related posts (see blog/related.py): how many to store per post, how fast
+# older posts lose weight, and how many neighbours to refresh on a tag change
+RELATED_POSTS_INDEX_SIZE = 6
+RELATED_POSTS_HALF_LIFE_DAYS = 180
+RELATED_POSTS_NEIGHBOUR_LIMIT = 100
+
+
+# Trending and weekly rankings (see blog/rankings.py): the weight of each kind of
+# event, and how fast trending scores halve. Run `manage.py update_rankings` daily.
+RANKING_WEIGHTS = {'view': 1, 'like': 5, 'comment': 8}
+TRENDING_HALF_LIFE_HOURS = 24
+
+
+# Post view counting (see blog/viewcounts.py)
+# 'sync' writes every view immediately; 'memory' and 'cache' buffer views and
+# write them in batches, on whichever of the threshold or interval comes first.
+# In every mode the views' rankings and unique-viewer sketches wait for a batch.
+VIEW_COUNT_MODE = 'sync'
+VIEW_COUNT_FLUSH_THRESHOLD = 100  # pending views
+VIEW_COUNT_FLUSH_INTERVAL = 30  # seconds
+
+# Repeat views by the same visitor aren't counted for one to two windows; a
+# Bloom filter of this many bits per post and window remembers recent viewers
+# (see blog/viewers.py).
+VIEWER_DEDUP_WINDOW = 86400  # seconds
+VIEWER_FILTER_BITS = 8192
+
+
+# Full-text search backend (see blog/search.py). None picks one from the database
+# vendor: SQLite FTS5 or MySQL FULLTEXT, with a LIKE-based fallback elsewhere.
+SEARCH_BACKEND = None
+
+
+# Listing pages use cursor pagination (see blog/pagination.py); the total for
+# "Page N of M" is cached for this many seconds instead of counted per request.
+PAGINATION_COUNT_CACHE_TIMEOUT = 300
+
+
+# Query budgets per view name (see blog/middleware.py). Going over one logs a
+# warning on the "blog.querybudget" logger; QUERY_BUDGET_RAISE turns that into
+# an exception, for development and tests. blog/tests.py pins tighter budgets.
+QUERY_BUDGETS = {
+    'post_list': 12,  # plus the trending and weekly rankings on a cold cache
+    'post_detail': 25,  # counting a view writes several rows in 'sync' mode
+    'tag_posts': 10,
+    'author_profile': 10,
+    'search_posts': 10,
+    'profile': 10,
+    'like_post': 15,
+    'like_comment': 15,
+}
+QUERY_BUDGET_RAISE = False
+
+
+# JSON API (blog/api/): public and read-only, so no authentication or
+# session lookups; pagination is configured per view.
+REST_FRAMEWORK = {
+    "DEFAULT_AUTHENTICATION_CLASSES": [],
+    "DEFAULT_PERMISSION_CLASSES": ["rest_framework.permissions.AllowAny"],
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -128,6 +313,23 @@ STATICFILES_DIRS = [
     BASE_DIR / 'static',
 ]
 
+# Outside DEBUG, collectstatic writes content-hashed, precompressed (gzip and, with
+# the Brotli package, brotli) copies that WhiteNoise serves with immutable
+# far-future caching (see blog/storage.py). STATICFILES_MINIFY also minifies CSS
+# and JS first; it needs `pip install rcssmin rjsmin`.
+STORAGES = {
+    "default": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+    },
+    "staticfiles": {
+        "BACKEND": (
+            "django.contrib.staticfiles.storage.StaticFilesStorage" if DEBUG
+            else "blog.storage.MinifyingCompressedManifestStorage"
+        ),
+    },
+}
+STATICFILES_MINIFY = config('STATICFILES_MINIFY', default=False, cast=bool)
+
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field